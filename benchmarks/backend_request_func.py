@@ -4,7 +4,7 @@ import sys
 import time
 import traceback
 from dataclasses import dataclass, field
-from typing import List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 import aiohttp
 import huggingface_hub.constants
@@ -24,6 +24,12 @@ class RequestFuncInput:
     model: str
     best_of: int = 1
     use_beam_search: bool = False
+    # The conversation so far, sent instead of `prompt` by the chat backend.
+    messages: Optional[List[Dict[str, str]]] = None
+    session_id: Optional[str] = None
+    session_reuse: int = -1
+    rounds: float = -1
+    default_config: Optional[Dict[str, float]] = None
 
 
 @dataclass
@@ -309,18 +315,27 @@ async def async_request_openai_chat_completions(
 
     async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
         assert not request_func_input.use_beam_search
-        payload = {
-            "model": request_func_input.model,
-            "messages": [
+        messages = request_func_input.messages
+        if messages is None:
+            messages = [
                 {
                     "role": "user",
                     "content": request_func_input.prompt,
                 },
-            ],
+            ]
+        payload: Dict[str, Any] = {
+            "model": request_func_input.model,
+            "messages": messages,
             "temperature": 0.0,
             "max_tokens": request_func_input.output_len,
             "stream": True,
         }
+        if request_func_input.session_id is not None:
+            payload["session_id"] = request_func_input.session_id
+            payload["session_reuse"] = request_func_input.session_reuse
+            payload["rounds"] = request_func_input.rounds
+            if request_func_input.default_config is not None:
+                payload["default_config"] = request_func_input.default_config
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY')}",
@@ -382,6 +397,29 @@ async def async_request_openai_chat_completions(
     return output
 
 
+async def async_request_openai_session_stop(api_url: str, model: str,
+                                            session_id: str) -> bool:
+    """Ask a vLLM OpenAI chat server to free the preserved KV of a session.
+    """
+    async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
+        payload = {
+            "model": model,
+            "messages": [],
+            "session_id": session_id,
+            "request_stop": True,
+        }
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY')}",
+        }
+        try:
+            async with session.post(url=api_url, json=payload,
+                                    headers=headers) as response:
+                return response.status == 200
+        except aiohttp.ClientError:
+            return False
+
+
 # Since vllm must support Python 3.8, we can't use str.removeprefix(prefix)
 # introduced in Python 3.9
 def remove_prefix(text: str, prefix: str) -> str:
@@ -0,0 +1,65 @@
+"""Replay the session turns of a trace through the arrival estimators, and
+report how well they forecast the next turns.
+
+The trace has the JSONL format of benchmark_session_simulator.py. Without a
+trace, a synthetic multi-turn workload is generated.
+"""
+import dataclasses
+import json
+
+from benchmark_session_simulator import load_trace, sample_trace
+
+from vllm.preserve.arrival import ArrivalEstimatorFactory, replay_arrivals
+from vllm.utils import FlexibleArgumentParser
+
+
+def main(args):
+    if args.trace is not None:
+        trace = load_trace(args.trace)
+    else:
+        trace = sample_trace(args.num_sessions, args.num_turns,
+                             args.request_rate, args.think_time,
+                             args.prompt_len, args.turn_len, args.output_len,
+                             args.seed)
+    errors = {}
+    for estimator_name in args.estimators:
+        estimator = ArrivalEstimatorFactory.get_estimator(estimator_name)
+        error = replay_arrivals(trace,
+                                estimator,
+                                horizon=args.horizon,
+                                session_ttl=args.session_ttl)
+        errors[estimator_name] = dataclasses.asdict(error)
+    print(json.dumps(errors, indent=4))
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Measure the forecast error of the session arrival '
+        'estimators on a trace.')
+    parser.add_argument('--trace',
+                        type=str,
+                        default=None,
+                        help='JSONL trace to replay.')
+    parser.add_argument('--estimators',
+                        type=str,
+                        nargs='+',
+                        default=['ema', 'quantile'])
+    parser.add_argument('--horizon',
+                        type=float,
+                        default=10.0,
+                        help='Seconds within which the next turn is '
+                        'forecast.')
+    parser.add_argument('--session-ttl',
+                        type=float,
+                        default=None,
+                        help='Seconds after which an idle session is over. '
+                        'Defaults to 10 horizons.')
+    parser.add_argument('--num-sessions', type=int, default=100)
+    parser.add_argument('--num-turns', type=int, default=4)
+    parser.add_argument('--request-rate', type=float, default=2.0)
+    parser.add_argument('--think-time', type=float, default=5.0)
+    parser.add_argument('--prompt-len', type=int, default=512)
+    parser.add_argument('--turn-len', type=int, default=64)
+    parser.add_argument('--output-len', type=int, default=128)
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
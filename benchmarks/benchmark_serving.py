@@ -21,6 +21,14 @@ On the client side, run:
     when using tgi backend, add
         --endpoint /generate_stream
     to the end of the command above.
+
+    To replay multi-turn agent sessions against the session-preserving vLLM
+    server, use the chat backend and the agent workload:
+        --backend openai-chat \
+        --endpoint /v1/chat/completions \
+        --dataset-name agent \
+        --request-rate <session_rate> \
+        --num-prompts <num_sessions>
 """
 import argparse
 import asyncio
@@ -35,7 +43,8 @@ from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
 
 import numpy as np
 from backend_request_func import (ASYNC_REQUEST_FUNCS, RequestFuncInput,
-                                  RequestFuncOutput)
+                                  RequestFuncOutput,
+                                  async_request_openai_session_stop)
 from tqdm.asyncio import tqdm
 from transformers import PreTrainedTokenizerBase
 
@@ -212,6 +221,77 @@ def sample_random_requests(
     return input_requests
 
 
+@dataclass
+class AgentTurn:
+    content: str
+    content_len: int
+    output_len: int
+    # Seconds between the end of the previous turn and the start of this one.
+    pause: float
+    is_tool_result: bool
+
+
+def sample_agent_sessions(
+    num_sessions: int,
+    system_len: int,
+    input_len: int,
+    tool_output_len: int,
+    output_len: int,
+    mean_turns: float,
+    tool_call_ratio: float,
+    think_time: float,
+    tool_time: float,
+    range_ratio: float,
+    tokenizer: PreTrainedTokenizerBase,
+) -> List[List[AgentTurn]]:
+    """Sample multi-turn agent sessions.
+
+    Every session has a geometric number of turns with mean `mean_turns`, and
+    its first turn starts with a system prompt of `system_len` tokens shared
+    by all sessions. A later turn is a tool result with probability
+    `tool_call_ratio`, sent after an exponential tool-call pause with mean
+    `tool_time`; otherwise it is a user message, sent after an exponential
+    think time with mean `think_time`.
+    """
+
+    def sample_len(max_len: int) -> int:
+        return int(np.random.randint(int(max_len * range_ratio), max_len + 1))
+
+    def sample_text(num_tokens: int) -> str:
+        offset = np.random.randint(0, tokenizer.vocab_size)
+        return tokenizer.decode([(offset + j) % tokenizer.vocab_size
+                                 for j in range(num_tokens)])
+
+    system_prompt = sample_text(system_len)
+    sessions: List[List[AgentTurn]] = []
+    for _ in range(num_sessions):
+        num_turns = int(np.random.geometric(1.0 / max(mean_turns, 1.0)))
+        turns: List[AgentTurn] = []
+        for turn_idx in range(num_turns):
+            is_tool_result = (turn_idx > 0
+                              and np.random.random() < tool_call_ratio)
+            if is_tool_result:
+                content_len = sample_len(tool_output_len)
+                content = f"Tool result:\n{sample_text(content_len)}"
+                pause = np.random.exponential(tool_time)
+            else:
+                content_len = sample_len(input_len)
+                content = sample_text(content_len)
+                pause = np.random.exponential(think_time)
+            if turn_idx == 0:
+                content = f"{system_prompt}\n{content}"
+                content_len += system_len
+                pause = 0.0
+            turns.append(
+                AgentTurn(content=content,
+                          content_len=content_len,
+                          output_len=sample_len(output_len),
+                          pause=float(pause),
+                          is_tool_result=is_tool_result))
+        sessions.append(turns)
+    return sessions
+
+
 async def get_request(
     input_requests: List[Tuple[str, int, int]],
     request_rate: float,
@@ -361,6 +441,14 @@ async def benchmark(
         tokenizer=tokenizer,
     )
 
+    print_metrics(metrics, benchmark_duration)
+
+    return get_result(metrics, benchmark_duration, outputs,
+                      actual_output_lens)
+
+
+def print_metrics(metrics: BenchmarkMetrics,
+                  benchmark_duration: float) -> None:
     print("{s:{c}^{n}}".format(s=' Serving Benchmark Result ', n=50, c='='))
     print("{:<40} {:<10}".format("Successful requests:", metrics.completed))
     print("{:<40} {:<10.2f}".format("Benchmark duration (s):",
@@ -392,7 +480,14 @@ async def benchmark(
     print("{:<40} {:<10.2f}".format("P99 ITL (ms):", metrics.p99_itl_ms))
     print("=" * 50)
 
-    result = {
+
+def get_result(
+    metrics: BenchmarkMetrics,
+    benchmark_duration: float,
+    outputs: List[RequestFuncOutput],
+    actual_output_lens: List[int],
+) -> Dict[str, Any]:
+    return {
         "duration": benchmark_duration,
         "completed": metrics.completed,
         "total_input_tokens": metrics.total_input,
@@ -419,6 +514,156 @@ async def benchmark(
         "generated_texts": [output.generated_text for output in outputs],
         "errors": [output.error for output in outputs],
     }
+
+
+def calculate_turn_metrics(
+    turn_indices: List[int],
+    outputs: List[RequestFuncOutput],
+    actual_output_lens: List[int],
+) -> List[Dict[str, float]]:
+    """Split the TTFT and the output throughput of the successful requests
+    by the index of their turn in the session."""
+    turn_metrics: List[Dict[str, float]] = []
+    for turn_idx in range(max(turn_indices, default=-1) + 1):
+        selected = [
+            i for i, idx in enumerate(turn_indices)
+            if idx == turn_idx and outputs[i].success
+        ]
+        if not selected:
+            continue
+        ttfts = [outputs[i].ttft for i in selected]
+        total_latency = sum(outputs[i].latency for i in selected)
+        total_output = sum(actual_output_lens[i] for i in selected)
+        turn_metrics.append({
+            "turn": turn_idx,
+            "completed": len(selected),
+            "mean_input_len": float(
+                np.mean([outputs[i].prompt_len for i in selected])),
+            "mean_ttft_ms": float(np.mean(ttfts)) * 1000,
+            "p99_ttft_ms": float(np.percentile(ttfts, 99)) * 1000,
+            "output_throughput": (total_output / total_latency
+                                  if total_latency > 0 else 0.0),
+        })
+    return turn_metrics
+
+
+async def run_agent_session(
+    request_func,
+    api_url: str,
+    model_id: str,
+    tokenizer: PreTrainedTokenizerBase,
+    session_id: str,
+    turns: List[AgentTurn],
+    session_reuse: int,
+    default_config: Dict[str, float],
+    pbar: Optional[tqdm],
+) -> List[RequestFuncOutput]:
+    """Send the turns of a session one after the other, growing its context
+    with every reply, then free its preserved KV."""
+    messages: List[Dict[str, str]] = []
+    prompt_len = 0
+    outputs: List[RequestFuncOutput] = []
+    for turn_idx, turn in enumerate(turns):
+        if turn_idx > 0:
+            await asyncio.sleep(turn.pause)
+        messages.append({"role": "user", "content": turn.content})
+        prompt_len += turn.content_len
+        request_func_input = RequestFuncInput(
+            model=model_id,
+            prompt=turn.content,
+            api_url=api_url,
+            prompt_len=prompt_len,
+            output_len=turn.output_len,
+            messages=list(messages),
+            session_id=session_id,
+            session_reuse=session_reuse,
+            rounds=len(turns),
+            default_config=default_config,
+        )
+        output = await request_func(request_func_input=request_func_input,
+                                    pbar=pbar)
+        outputs.append(output)
+        if not output.success:
+            break
+        messages.append({
+            "role": "assistant",
+            "content": output.generated_text
+        })
+        prompt_len += len(
+            tokenizer(output.generated_text,
+                      add_special_tokens=False).input_ids)
+    await async_request_openai_session_stop(api_url, model_id, session_id)
+    return outputs
+
+
+async def benchmark_agent(
+    backend: str,
+    api_url: str,
+    model_id: str,
+    tokenizer: PreTrainedTokenizerBase,
+    sessions: List[List[AgentTurn]],
+    session_rate: float,
+    session_reuse: int,
+    default_config: Dict[str, float],
+    disable_tqdm: bool,
+):
+    if backend != "openai-chat":
+        raise ValueError(
+            "The agent workload needs the openai-chat backend, which "
+            f"supports sessions. Got: {backend}")
+    request_func = ASYNC_REQUEST_FUNCS[backend]
+    print(f"Traffic session rate: {session_rate}")
+
+    pbar = None if disable_tqdm else tqdm(
+        total=sum(len(turns) for turns in sessions))
+
+    benchmark_start_time = time.perf_counter()
+    tasks: List[asyncio.Task] = []
+    async for session_idx, turns in get_request(list(enumerate(sessions)),
+                                                session_rate):
+        tasks.append(
+            asyncio.create_task(
+                run_agent_session(request_func, api_url, model_id, tokenizer,
+                                  f"benchmark-{session_idx}", turns,
+                                  session_reuse, default_config, pbar)))
+    session_outputs: List[List[RequestFuncOutput]] = await asyncio.gather(
+        *tasks)
+
+    if pbar is not None:
+        pbar.close()
+
+    benchmark_duration = time.perf_counter() - benchmark_start_time
+
+    outputs = [output for turns in session_outputs for output in turns]
+    turn_indices = [
+        turn_idx for turns in session_outputs
+        for turn_idx in range(len(turns))
+    ]
+    metrics, actual_output_lens = calculate_metrics(
+        input_requests=[("", output.prompt_len, 0) for output in outputs],
+        outputs=outputs,
+        dur_s=benchmark_duration,
+        tokenizer=tokenizer,
+    )
+    turn_metrics = calculate_turn_metrics(turn_indices, outputs,
+                                          actual_output_lens)
+
+    print("{:<40} {:<10}".format("Sessions:", len(sessions)))
+    print_metrics(metrics, benchmark_duration)
+    print("{s:{c}^{n}}".format(s=' Per-turn Result ', n=50, c='-'))
+    print("{:<6} {:<10} {:<10} {:<10} {:<10}".format(
+        "Turn", "Requests", "Mean TTFT", "P99 TTFT", "Out tok/s"))
+    for row in turn_metrics:
+        print("{:<6} {:<10} {:<10.2f} {:<10.2f} {:<10.2f}".format(
+            row["turn"], row["completed"], row["mean_ttft_ms"],
+            row["p99_ttft_ms"], row["output_throughput"]))
+    print("=" * 50)
+
+    result = get_result(metrics, benchmark_duration, outputs,
+                        actual_output_lens)
+    result["num_sessions"] = len(sessions)
+    result["turn_indices"] = turn_indices
+    result["turn_metrics"] = turn_metrics
     return result
 
 
@@ -499,21 +744,54 @@ def main(args: argparse.Namespace):
             tokenizer=tokenizer,
         )
 
+    elif args.dataset_name == "agent":
+        sessions = sample_agent_sessions(
+            num_sessions=args.num_prompts,
+            system_len=args.agent_system_len,
+            input_len=args.agent_input_len,
+            tool_output_len=args.agent_tool_output_len,
+            output_len=args.agent_output_len,
+            mean_turns=args.agent_mean_turns,
+            tool_call_ratio=args.agent_tool_call_ratio,
+            think_time=args.agent_think_time,
+            tool_time=args.agent_tool_time,
+            range_ratio=args.agent_range_ratio,
+            tokenizer=tokenizer,
+        )
+
     else:
         raise ValueError(f"Unknown dataset: {args.dataset_name}")
 
-    benchmark_result = asyncio.run(
-        benchmark(
-            backend=backend,
-            api_url=api_url,
-            model_id=model_id,
-            tokenizer=tokenizer,
-            input_requests=input_requests,
-            best_of=args.best_of,
-            use_beam_search=args.use_beam_search,
-            request_rate=args.request_rate,
-            disable_tqdm=args.disable_tqdm,
-        ))
+    if args.dataset_name == "agent":
+        benchmark_result = asyncio.run(
+            benchmark_agent(
+                backend=backend,
+                api_url=api_url,
+                model_id=model_id,
+                tokenizer=tokenizer,
+                sessions=sessions,
+                session_rate=args.request_rate,
+                session_reuse=args.agent_session_reuse,
+                default_config={
+                    "ip": -1,
+                    "p": args.agent_input_len + args.agent_output_len,
+                    "tau": args.agent_think_time,
+                },
+                disable_tqdm=args.disable_tqdm,
+            ))
+    else:
+        benchmark_result = asyncio.run(
+            benchmark(
+                backend=backend,
+                api_url=api_url,
+                model_id=model_id,
+                tokenizer=tokenizer,
+                input_requests=input_requests,
+                best_of=args.best_of,
+                use_beam_search=args.use_beam_search,
+                request_rate=args.request_rate,
+                disable_tqdm=args.disable_tqdm,
+            ))
 
     # Save config and results to json
     if args.save_result:
@@ -592,8 +870,10 @@ if __name__ == "__main__":
         "--dataset-name",
         type=str,
         default="sharegpt",
-        choices=["sharegpt", "sonnet", "random"],
-        help="Name of the dataset to benchmark on.",
+        choices=["sharegpt", "sonnet", "random", "agent"],
+        help="Name of the dataset to benchmark on. 'agent' replays "
+        "synthetic multi-turn sessions, where --num-prompts is the number "
+        "of sessions and --request-rate their arrival rate.",
     )
     parser.add_argument("--dataset-path",
                         type=str,
@@ -673,6 +953,77 @@ if __name__ == "__main__":
         help="Range of sampled ratio of input/output length, "
         "used only for random sampling.",
     )
+    parser.add_argument(
+        "--agent-system-len",
+        type=int,
+        default=512,
+        help="Number of tokens of the system prompt shared by all sessions, "
+        "used only for the agent workload.",
+    )
+    parser.add_argument(
+        "--agent-input-len",
+        type=int,
+        default=128,
+        help="Number of tokens of a user message, used only for the agent "
+        "workload.",
+    )
+    parser.add_argument(
+        "--agent-tool-output-len",
+        type=int,
+        default=256,
+        help="Number of tokens of a tool result, used only for the agent "
+        "workload.",
+    )
+    parser.add_argument(
+        "--agent-output-len",
+        type=int,
+        default=128,
+        help="Number of output tokens per turn, used only for the agent "
+        "workload.",
+    )
+    parser.add_argument(
+        "--agent-mean-turns",
+        type=float,
+        default=6.0,
+        help="Mean number of turns per session, used only for the agent "
+        "workload.",
+    )
+    parser.add_argument(
+        "--agent-tool-call-ratio",
+        type=float,
+        default=0.5,
+        help="Probability that a turn is a tool result rather than a user "
+        "message, used only for the agent workload.",
+    )
+    parser.add_argument(
+        "--agent-think-time",
+        type=float,
+        default=5.0,
+        help="Mean user think time before a user message in seconds, used "
+        "only for the agent workload.",
+    )
+    parser.add_argument(
+        "--agent-tool-time",
+        type=float,
+        default=1.0,
+        help="Mean tool-call pause before a tool result in seconds, used only "
+        "for the agent workload.",
+    )
+    parser.add_argument(
+        "--agent-range-ratio",
+        type=float,
+        default=0.5,
+        help="Range of sampled ratio of message/output length, used only for "
+        "the agent workload.",
+    )
+    parser.add_argument(
+        "--agent-session-reuse",
+        type=int,
+        default=-1,
+        help="The session_reuse sent with every turn: -1 reuses the whole "
+        "preserved context and 0 disables reuse, used only for the agent "
+        "workload.",
+    )
     parser.add_argument(
         "--request-rate",
         type=float,
@@ -0,0 +1,118 @@
+"""Replay a trace through the scheduler and session preservation, without a
+GPU.
+
+The trace is a JSONL file with one request per line, e.g.
+    {"arrival_time": 0.0, "prompt_len": 512, "output_len": 64,
+     "session_id": "s0", "rounds": 4}
+Without a trace, a synthetic multi-turn workload is generated.
+"""
+import json
+import random
+from typing import List
+
+from vllm.config import SchedulerConfig
+from vllm.preserve.simulator import CostModel, Simulator, TraceRequest
+from vllm.utils import FlexibleArgumentParser
+
+
+def load_trace(path: str) -> List[TraceRequest]:
+    with open(path) as f:
+        return [TraceRequest(**json.loads(line)) for line in f if line.strip()]
+
+
+def sample_trace(num_sessions: int, num_turns: int, request_rate: float,
+                 think_time: float, prompt_len: int, turn_len: int,
+                 output_len: int, seed: int) -> List[TraceRequest]:
+    rng = random.Random(seed)
+    trace: List[TraceRequest] = []
+    start = 0.0
+    for i in range(num_sessions):
+        start += rng.expovariate(request_rate)
+        arrival_time = start
+        context_len = prompt_len
+        for _ in range(num_turns):
+            trace.append(
+                TraceRequest(arrival_time, context_len, output_len,
+                             f"session-{i}", num_turns))
+            context_len += output_len + turn_len
+            arrival_time += rng.expovariate(1 / think_time)
+    return trace
+
+
+def main(args):
+    if args.trace is not None:
+        trace = load_trace(args.trace)
+    else:
+        trace = sample_trace(args.num_sessions, args.num_turns,
+                             args.request_rate, args.think_time,
+                             args.prompt_len, args.turn_len, args.output_len,
+                             args.seed)
+    scheduler_config = SchedulerConfig(
+        args.max_num_batched_tokens,
+        args.max_num_seqs,
+        args.max_model_len,
+        use_v2_block_manager=args.use_v2_block_manager,
+        enable_chunked_prefill=args.enable_chunked_prefill,
+        session_eviction_policy=args.session_eviction_policy,
+        session_ttl=args.session_ttl)
+    cache_config = Simulator.make_cache_config(
+        args.block_size,
+        args.num_gpu_blocks,
+        args.num_cpu_blocks,
+        args.num_disk_blocks,
+        num_compressed_blocks=args.num_compressed_blocks)
+    simulator = Simulator(scheduler_config, cache_config,
+                          CostModel(step_overhead=args.step_overhead,
+                                    prefill_token_time=args.prefill_token_time,
+                                    decode_seq_time=args.decode_seq_time))
+    summary = simulator.run(trace).summary()
+    print(json.dumps(summary, indent=4))
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Simulate the scheduler and session preservation on a '
+        'trace.')
+    parser.add_argument('--trace',
+                        type=str,
+                        default=None,
+                        help='JSONL trace to replay.')
+    parser.add_argument('--num-sessions', type=int, default=100)
+    parser.add_argument('--num-turns', type=int, default=4)
+    parser.add_argument('--request-rate',
+                        type=float,
+                        default=2.0,
+                        help='New sessions per second.')
+    parser.add_argument('--think-time',
+                        type=float,
+                        default=5.0,
+                        help='Mean time between the turns of a session.')
+    parser.add_argument('--prompt-len', type=int, default=512)
+    parser.add_argument('--turn-len', type=int, default=64)
+    parser.add_argument('--output-len', type=int, default=128)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-num-batched-tokens', type=int, default=None)
+    parser.add_argument('--max-num-seqs', type=int, default=256)
+    parser.add_argument('--max-model-len', type=int, default=8192)
+    parser.add_argument('--use-v2-block-manager', action='store_true')
+    parser.add_argument('--enable-chunked-prefill', action='store_true')
+    parser.add_argument('--session-eviction-policy',
+                        type=str,
+                        default='reuse_value')
+    parser.add_argument('--session-ttl', type=float, default=None)
+    parser.add_argument('--block-size', type=int, default=16)
+    parser.add_argument('--num-gpu-blocks', type=int, default=2048)
+    parser.add_argument('--num-cpu-blocks', type=int, default=512)
+    parser.add_argument('--num-disk-blocks', type=int, default=0)
+    parser.add_argument('--num-compressed-blocks',
+                        type=int,
+                        default=0,
+                        help='Blocks of the GPU cache of compressed preserved '
+                        'sessions.')
+    parser.add_argument('--step-overhead', type=float, default=5e-3)
+    parser.add_argument('--prefill-token-time', type=float, default=1e-4)
+    parser.add_argument('--decode-seq-time', type=float, default=2e-4)
+    args = parser.parse_args()
+    if args.max_num_batched_tokens is None and not args.enable_chunked_prefill:
+        args.max_num_batched_tokens = args.max_model_len
+    main(args)
@@ -112,6 +112,33 @@ async def test_new_requests_event():
     assert engine.get_decoding_config() is not None
 
 
+@pytest.mark.asyncio
+async def test_stop_background_loop():
+    engine = MockAsyncLLMEngine(worker_use_ray=False, engine_use_ray=False)
+    engine.start_background_loop()
+    await engine.add_request("1", "", None)
+    engine.engine.generate("1")
+    await asyncio.sleep(0.001)
+    assert engine.engine.step_calls >= 1
+
+    # The loop stops between steps even while there is work left.
+    await engine.stop_background_loop()
+    assert engine.is_stopped
+    assert not engine.errored
+    step_calls = engine.engine.step_calls
+    await asyncio.sleep(0.01)
+    assert engine.engine.step_calls == step_calls
+
+    # An idle loop is woken up to stop.
+    engine = MockAsyncLLMEngine(worker_use_ray=False, engine_use_ray=False)
+    engine.start_background_loop()
+    await asyncio.sleep(0.01)
+    await engine.stop_background_loop()
+    assert engine.is_stopped
+    assert not engine.errored
+    assert engine.engine.step_calls == 0
+
+
 def test_asyncio_run():
     wait_for_gpu_memory_to_clear(
         devices=list(range(torch.cuda.device_count())),
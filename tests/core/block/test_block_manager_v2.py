@@ -381,3 +381,233 @@ def test_sliding_window(block_size, prompt_len, num_slots_to_append,
             check_used(0, sliding_blocks + 1)
         else:
             check_used(sliding_blocks, sliding_blocks + 1)
+
+
+@pytest.mark.parametrize("enable_caching", [False, True])
+def test_retain_and_reuse_session_blocks(enable_caching: bool):
+    block_size = 4
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV2(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0,
+                                        enable_caching=enable_caching)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(prev_group)
+    prev_table = block_manager.get_block_table(prev_seq)
+    block_manager.retain(prev_seq)
+
+    # The KV of the last token is never computed.
+    retained = block_manager.get_retained_token_ids(prev_seq.seq_id)
+    assert retained.tolist() == list(range(9))
+
+    # The next turn shares its first 9 tokens; two full blocks are reused and
+    # the retained partial block is freed.
+    seq, seq_group = create_dummy_prompt("2", 14, block_size)
+    seq_group.computed_block_seq = prev_seq.seq_id
+    seq_group.session_reuse = 9
+    assert block_manager.can_allocate(seq_group) == AllocStatus.OK
+    block_manager.allocate(seq_group)
+
+    assert seq_group.computed_block_nums == prev_table[:2]
+    assert block_manager.get_block_table(seq)[:2] == prev_table[:2]
+    assert block_manager.get_retained_token_ids(prev_seq.seq_id) is None
+    assert block_manager.get_num_seq_id_blocks(prev_seq.seq_id) == 0
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 4
+
+    block_manager.free(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+
+
+
+def test_trim_retained_session_blocks():
+    block_size = 4
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV2(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(prev_group)
+    prev_table = block_manager.get_block_table(prev_seq)
+    block_manager.retain(prev_seq)
+
+    # Nothing is freed while the whole retained prefix is expected to be
+    # reused.
+    assert block_manager.trim_seq_id(prev_seq.seq_id, 9) == 9
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 3
+
+    # Only the full blocks of the expected prefix are kept.
+    assert block_manager.trim_seq_id(prev_seq.seq_id, 7) == 4
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 1
+    assert block_manager.get_retained_token_ids(
+        prev_seq.seq_id).tolist() == list(range(4))
+
+    seq, seq_group = create_dummy_prompt("2", 14, block_size)
+    seq_group.computed_block_seq = prev_seq.seq_id
+    seq_group.session_reuse = 9
+    block_manager.allocate(seq_group)
+    assert block_manager.get_block_table(seq)[:1] == prev_table[:1]
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 4
+
+    block_manager.free(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+
+
+def test_fork_retained_session_blocks():
+    block_size = 4
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV2(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(prev_group)
+    prev_table = block_manager.get_block_table(prev_seq)
+    block_manager.retain(prev_seq)
+
+    # The fork shares the retained blocks instead of copying them.
+    fork_seq_id = 1000
+    block_manager.fork_seq_id(prev_seq.seq_id, fork_seq_id)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 3
+    assert block_manager.get_num_seq_id_blocks(fork_seq_id) == 3
+
+    # Both branches reuse the two full blocks and only allocate their suffix.
+    seqs = []
+    for request_id, seq_id in (("2", prev_seq.seq_id), ("3", fork_seq_id)):
+        seq, seq_group = create_dummy_prompt(request_id, 14, block_size)
+        seq_group.computed_block_seq = seq_id
+        seq_group.session_reuse = 9
+        block_manager.allocate(seq_group)
+        assert block_manager.get_block_table(seq)[:2] == prev_table[:2]
+        seqs.append(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 6
+
+    for seq in seqs:
+        block_manager.free(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+
+
+def test_divergent_turn_of_forked_session_blocks():
+    block_size = 4
+    num_gpu_blocks = 8
+    block_manager = BlockSpaceManagerV2(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 16, block_size)
+    block_manager.allocate(prev_group)
+    block_manager.retain(prev_seq)
+    fork_seq_id = 1000
+    block_manager.fork_seq_id(prev_seq.seq_id, fork_seq_id)
+    _, other_group = create_dummy_prompt("2", 16, block_size)
+    block_manager.allocate(other_group)
+    assert block_manager.get_num_free_gpu_blocks() == 0
+    # The other branch still holds every block of the fork.
+    assert block_manager.get_num_freeable_seq_id_blocks(fork_seq_id) == 0
+
+    # The next turn of the fork reuses nothing, and its blocks are only
+    # dereferenced, so it does not fit.
+    seq, seq_group = create_dummy_prompt("3", 16, block_size)
+    seq_group.computed_block_seq = fork_seq_id
+    seq_group.session_reuse = 0
+    assert block_manager.get_num_required_gpu_blocks(seq_group) == 4
+    assert block_manager.can_allocate(seq_group) == AllocStatus.LATER
+
+    # Once the other branch is freed, the blocks are the fork's alone.
+    block_manager.free_seq_id(prev_seq.seq_id)
+    assert block_manager.get_num_freeable_seq_id_blocks(fork_seq_id) == 4
+    assert block_manager.get_num_required_gpu_blocks(seq_group) == 0
+    block_manager.allocate(seq_group)
+    assert block_manager.get_num_free_gpu_blocks() == 0
+
+
+def test_retained_session_blocks_shared_with_prefix_cache():
+    block_size = 4
+    block_manager = BlockSpaceManagerV2(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=16,
+                                        watermark=0,
+                                        enable_caching=True)
+
+    session_seq, session_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(session_group)
+    block_manager.retain(session_seq)
+    session_table = block_manager.get_block_table(session_seq)
+
+    # An ordinary request with the same prefix skips the full blocks held by
+    # the preserved session.
+    seq, seq_group = create_dummy_prompt("2", 12, block_size)
+    block_manager.allocate(seq_group)
+    assert block_manager.get_block_table(seq)[:2] == session_table[:2]
+    assert list(block_manager.get_common_computed_block_ids(
+        [seq])) == session_table[:2]
+
+
+def test_swap_retained_session_blocks():
+    block_size = 4
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV2(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(prev_group)
+    prev_table = block_manager.get_block_table(prev_seq)
+    block_manager.retain(prev_seq)
+
+    assert block_manager.can_swap_out_seq_id(prev_seq.seq_id)
+    mapping = block_manager.swap_out_seq_id(prev_seq.seq_id)
+    assert [gpu for gpu, _ in mapping] == prev_table
+    assert block_manager.is_seq_id_swapped(prev_seq.seq_id)
+    assert block_manager.get_seq_id_gpu_block_numbers(prev_seq.seq_id,
+                                                      2) is None
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+    assert block_manager.get_num_free_cpu_blocks() == 1
+
+    # Only the reused prefix comes back to GPU.
+    mapping = block_manager.swap_in_seq_id(prev_seq.seq_id, 2)
+    assert len(mapping) == 2
+    assert not block_manager.is_seq_id_swapped(prev_seq.seq_id)
+    assert block_manager.get_num_free_cpu_blocks() == 4
+
+    seq, seq_group = create_dummy_prompt("2", 14, block_size)
+    seq_group.computed_block_seq = prev_seq.seq_id
+    seq_group.session_reuse = 9
+    block_manager.allocate(seq_group)
+    assert seq_group.computed_block_nums == [gpu for _, gpu in mapping]
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 4
+
+
+def test_migrate_retained_session_blocks():
+    block_size = 4
+    src = BlockSpaceManagerV2(block_size,
+                              num_cpu_blocks=4,
+                              num_gpu_blocks=16,
+                              watermark=0)
+    dst = BlockSpaceManagerV2(block_size,
+                              num_cpu_blocks=4,
+                              num_gpu_blocks=16,
+                              watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    src.allocate(prev_group)
+    src.retain(prev_seq)
+
+    src_block_numbers = src.get_seq_id_gpu_block_numbers(prev_seq.seq_id, 2)
+    assert dst.can_migrate_in(len(src_block_numbers))
+    mapping = dst.migrate_in_seq_id(
+        prev_seq.seq_id, src_block_numbers,
+        src.get_retained_token_ids(prev_seq.seq_id))
+    assert [src_block for src_block, _ in mapping] == src_block_numbers
+    assert dst.get_retained_token_ids(
+        prev_seq.seq_id).tolist() == list(range(8))
+    assert dst.get_num_free_gpu_blocks() == 14
+
+    dst.free_seq_id(prev_seq.seq_id)
+    assert dst.get_num_free_gpu_blocks() == 16
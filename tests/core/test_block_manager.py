@@ -595,3 +595,215 @@ def test_sliding_window_multi_seq():
 
     # assert all blocks are free now
     assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+
+
+def test_retain_and_reuse_session_blocks():
+    block_size = 4
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(prev_group)
+    prev_table = block_manager.get_block_table(prev_seq)
+    block_manager.retain(prev_seq)
+
+    # The KV of the last token is never computed.
+    retained = block_manager.get_retained_token_ids(prev_seq.seq_id)
+    assert retained.tolist() == list(range(9))
+
+    # The next turn shares its first 9 tokens; two full blocks are reused.
+    seq, seq_group = create_dummy_prompt("2", 14, block_size)
+    seq_group.computed_block_seq = prev_seq.seq_id
+    seq_group.session_reuse = 9
+    block_manager.allocate(seq_group)
+
+    assert seq_group.computed_block_nums == prev_table[:2]
+    assert block_manager.get_block_table(seq)[:2] == prev_table[:2]
+    assert block_manager.get_retained_token_ids(prev_seq.seq_id) is None
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 4
+
+
+
+def test_trim_retained_session_blocks():
+    block_size = 4
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(prev_group)
+    prev_table = block_manager.get_block_table(prev_seq)
+    block_manager.retain(prev_seq)
+
+    # Nothing is freed while the whole retained prefix is expected to be
+    # reused.
+    assert block_manager.trim_seq_id(prev_seq.seq_id, 9) == 9
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 3
+
+    # Only the full blocks of the expected prefix are kept.
+    assert block_manager.trim_seq_id(prev_seq.seq_id, 7) == 4
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 1
+    assert block_manager.get_retained_token_ids(
+        prev_seq.seq_id).tolist() == list(range(4))
+
+    seq, seq_group = create_dummy_prompt("2", 14, block_size)
+    seq_group.computed_block_seq = prev_seq.seq_id
+    seq_group.session_reuse = 9
+    block_manager.allocate(seq_group)
+    assert block_manager.get_block_table(seq)[:1] == prev_table[:1]
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 4
+
+    block_manager.free(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+
+
+def test_share_identical_retained_blocks():
+    block_size = 4
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    # Two sessions share a 10 token prompt and sample different tokens.
+    seqs = []
+    for i in range(2):
+        seq, seq_group = create_dummy_prompt(str(i), 10, block_size)
+        block_manager.allocate(seq_group)
+        token_id = 100 + i
+        seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+        seqs.append(seq)
+    first_table = block_manager.get_block_table(seqs[0])
+    for seq in seqs:
+        block_manager.retain(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 4
+
+    # The retained full blocks are shared, the partial ones are not.
+    second_table = block_manager.get_block_table(seqs[1])
+    assert second_table[:2] == first_table[:2]
+    assert second_table[2] != first_table[2]
+
+    # A next turn reuses the shared blocks without taking them from the
+    # other session.
+    seq, seq_group = create_dummy_prompt("2", 14, block_size)
+    seq_group.computed_block_seq = seqs[1].seq_id
+    seq_group.session_reuse = 9
+    block_manager.allocate(seq_group)
+    assert block_manager.get_block_table(seq)[:2] == first_table[:2]
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 5
+
+    block_manager.free(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 3
+    block_manager.free_seq_id(seqs[0].seq_id)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+
+
+def test_divergent_turn_of_shared_retained_blocks():
+    block_size = 4
+    num_gpu_blocks = 6
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    # Two sessions share the two full blocks of a 10 token prompt.
+    seqs = []
+    for i in range(2):
+        seq, seq_group = create_dummy_prompt(str(i), 10, block_size)
+        block_manager.allocate(seq_group)
+        token_id = 100 + i
+        seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+        seqs.append(seq)
+    for seq in seqs:
+        block_manager.retain(seq)
+    assert block_manager.get_num_free_gpu_blocks() == 2
+    # Only the partial block is freed when a session is released.
+    assert block_manager.get_num_freeable_seq_id_blocks(seqs[1].seq_id) == 1
+
+    # The next turn diverges in the first block: the shared blocks stay with
+    # the other session, so it does not fit.
+    seq, seq_group = create_dummy_prompt("2", 14, block_size)
+    seq_group.computed_block_seq = seqs[1].seq_id
+    seq_group.session_reuse = 0
+    assert block_manager.get_num_required_gpu_blocks(seq_group) == 3
+    assert block_manager.can_allocate(seq_group) == AllocStatus.LATER
+
+    # Diverging in the second block, it reuses the first one and fits.
+    seq_group.session_reuse = 6
+    assert block_manager.get_num_required_gpu_blocks(seq_group) == 2
+    assert block_manager.can_allocate(seq_group) == AllocStatus.OK
+    block_manager.allocate(seq_group)
+    assert block_manager.get_num_free_gpu_blocks() == 0
+
+
+def test_fork_retained_session_blocks():
+    block_size = 4
+    num_gpu_blocks = 16
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(prev_group)
+    prev_table = block_manager.get_block_table(prev_seq)
+    block_manager.retain(prev_seq)
+
+    # The fork shares the retained blocks instead of copying them.
+    fork_seq_id = 1000
+    block_manager.fork_seq_id(prev_seq.seq_id, fork_seq_id)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 3
+    assert block_manager.get_retained_token_ids(
+        fork_seq_id).tolist() == list(range(9))
+
+    # Both branches reuse the two full blocks and only allocate their suffix.
+    seqs = []
+    for request_id, seq_id in (("2", prev_seq.seq_id), ("3", fork_seq_id)):
+        seq, seq_group = create_dummy_prompt(request_id, 14, block_size)
+        seq_group.computed_block_seq = seq_id
+        seq_group.session_reuse = 9
+        block_manager.allocate(seq_group)
+        assert block_manager.get_block_table(seq)[:2] == prev_table[:2]
+        seqs.append(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks - 6
+
+    for seq in seqs:
+        block_manager.free(seq)
+    assert block_manager.get_num_free_gpu_blocks() == num_gpu_blocks
+
+
+def test_divergent_turn_of_forked_session_blocks():
+    block_size = 4
+    num_gpu_blocks = 6
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks=4,
+                                        num_gpu_blocks=num_gpu_blocks,
+                                        watermark=0)
+
+    prev_seq, prev_group = create_dummy_prompt("1", 10, block_size)
+    block_manager.allocate(prev_group)
+    block_manager.retain(prev_seq)
+    fork_seq_id = 1000
+    block_manager.fork_seq_id(prev_seq.seq_id, fork_seq_id)
+    assert block_manager.get_num_free_gpu_blocks() == 3
+    # The other branch still holds every block of the fork.
+    assert block_manager.get_num_freeable_seq_id_blocks(fork_seq_id) == 0
+
+    # The fork returns with a prompt that diverges in its second block, so
+    # only its first block is reused and nothing is freed.
+    seq, seq_group = create_dummy_prompt("2", 20, block_size)
+    seq_group.computed_block_seq = fork_seq_id
+    seq_group.session_reuse = 5
+    assert block_manager.get_num_required_gpu_blocks(seq_group) == 4
+    assert block_manager.can_allocate(seq_group) == AllocStatus.LATER
+
+    # Once the other branch is freed, the blocks are the fork's alone.
+    block_manager.free_seq_id(prev_seq.seq_id)
+    assert block_manager.get_num_required_gpu_blocks(seq_group) == 2
+    block_manager.allocate(seq_group)
+    assert block_manager.get_num_free_gpu_blocks() == 1
@@ -6,9 +6,10 @@ import pytest  # noqa
 from vllm.config import CacheConfig, SchedulerConfig
 from vllm.core.interfaces import AllocStatus
 from vllm.core.scheduler import Scheduler
+from vllm.preserve.eviction import PreservedSessions
 from vllm.sequence import Logprob, SequenceGroup
 
-from .utils import create_dummy_prompt
+from .utils import create_dummy_prompt, preserve_session
 
 
 def get_sequence_groups(scheduler_output):
@@ -20,8 +21,10 @@ def append_new_token(seq_group, token_id: int):
         seq.append_token_id(token_id, {token_id: Logprob(token_id)})
 
 
-def schedule_and_update_computed_tokens(scheduler):
-    metas, out = scheduler.schedule()
+def schedule_and_update_computed_tokens(scheduler,
+                                        session_id_block=None,
+                                        session_id_arrived=None):
+    metas, out = scheduler.schedule(session_id_block, session_id_arrived)
     for s, meta in zip(out.scheduled_seq_groups, metas):
         s.seq_group.update_num_computed_tokens(meta.token_chunk_size)
     return metas, out
@@ -562,3 +565,105 @@ def test_chunked_prefill_max_seqs():
     assert len(get_sequence_groups(out)) == max_seqs
     assert not running[0].is_prefill()
     assert not running[1].is_prefill()
+
+
+def _initialize_chunked_scheduler(max_num_batched_tokens: int = 8):
+    block_size = 4
+    scheduler_config = SchedulerConfig(max_num_batched_tokens,
+                                       max_num_seqs=8,
+                                       max_model_len=64,
+                                       enable_chunked_prefill=True)
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    return Scheduler(scheduler_config, cache_config, None)
+
+
+def test_chunked_prefill_reuses_preserved_session():
+    scheduler = _initialize_chunked_scheduler()
+    session_seq = preserve_session(scheduler, "0", prompt_length=12)
+    session_id_arrived = PreservedSessions()
+
+    # The next turn shares its first 11 tokens; the two full blocks are
+    # reused and only the rest of the prompt is prefilled, in chunks.
+    seq, seq_group = create_dummy_prompt("1", prompt_length=20, block_size=4)
+    seq_group.session_id = "session"
+    seq_group.computed_block_seq = session_seq.seq_id
+    seq_group.session_reuse = 11
+    session_id_arrived["session"] = session_seq.seq_id
+    scheduler.add_seq_group(seq_group)
+
+    metas, out = schedule_and_update_computed_tokens(
+        scheduler, PreservedSessions(), session_id_arrived)
+    assert get_sequence_groups(out) == [seq_group]
+    assert metas[0].token_chunk_size == 8
+    assert metas[0].computed_block_nums == []
+    assert len(session_id_arrived) == 0
+    assert seq.data.get_num_computed_tokens() == 16
+
+    metas, out = schedule_and_update_computed_tokens(
+        scheduler, PreservedSessions(), session_id_arrived)
+    assert metas[0].token_chunk_size == 4
+    assert not seq_group.is_prefill()
+
+
+def test_chunked_prefill_releases_preserved_session():
+    scheduler = _initialize_chunked_scheduler(max_num_batched_tokens=32)
+    scheduler.block_manager.cpu_allocator.free_blocks.clear()
+    session_seq = preserve_session(scheduler, "0", prompt_length=16)
+    session_id_block = PreservedSessions()
+    session_id_block["session"] = session_seq.seq_id
+
+    # The prompt only fits once the preserved session is freed.
+    _, seq_group = create_dummy_prompt("1", prompt_length=24, block_size=4)
+    scheduler.add_seq_group(seq_group)
+    _, out = schedule_and_update_computed_tokens(
+        scheduler, session_id_block, PreservedSessions())
+    assert get_sequence_groups(out) == [seq_group]
+    assert len(session_id_block) == 0
+    assert scheduler.block_manager.get_retained_token_ids(
+        session_seq.seq_id) is None
+
+
+
+def test_chunked_prefill_defers_restore_while_demoting_sessions():
+    scheduler = _initialize_chunked_scheduler(max_num_batched_tokens=32)
+    # The returning session was demoted to CPU, another one is idle on GPU.
+    returning_seq = preserve_session(scheduler, "0", prompt_length=8)
+    scheduler.block_manager.swap_out_seq_id(returning_seq.seq_id)
+    idle_seq = preserve_session(scheduler, "1", prompt_length=12)
+    session_id_block = PreservedSessions()
+    session_id_block["idle"] = idle_seq.seq_id
+    session_id_arrived = PreservedSessions()
+    session_id_arrived["returning"] = returning_seq.seq_id
+
+    _, running_group = create_dummy_prompt("2", prompt_length=20, block_size=4)
+    scheduler.add_seq_group(running_group)
+    _, out = schedule_and_update_computed_tokens(scheduler, session_id_block,
+                                                 session_id_arrived)
+    assert get_sequence_groups(out) == [running_group]
+    assert scheduler.block_manager.get_num_free_gpu_blocks() == 0
+
+    # The decode needs a new block, so the idle session is demoted. The
+    # returning session fits in the blocks it frees, but is not restored
+    # before they are copied out.
+    _, seq_group = create_dummy_prompt("3", prompt_length=8, block_size=4)
+    seq_group.session_id = "returning"
+    seq_group.computed_block_seq = returning_seq.seq_id
+    seq_group.session_reuse = 4
+    scheduler.add_seq_group(seq_group)
+    append_new_token(running_group, 1)
+    _, out = schedule_and_update_computed_tokens(scheduler, session_id_block,
+                                                 session_id_arrived)
+    assert get_sequence_groups(out) == [running_group]
+    assert out.blocks_to_swap_out
+    assert not out.blocks_to_swap_in
+    assert list(scheduler.waiting) == [seq_group]
+
+    # It is restored in the next step.
+    append_new_token(running_group, 1)
+    _, out = schedule_and_update_computed_tokens(scheduler, session_id_block,
+                                                 session_id_arrived)
+    assert get_sequence_groups(out) == [seq_group, running_group]
+    assert not out.blocks_to_swap_out
+    assert len(out.blocks_to_swap_in) == 1
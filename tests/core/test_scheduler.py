@@ -3,16 +3,21 @@ from collections import deque
 from typing import Deque, List, Set, Tuple
 from unittest.mock import MagicMock
 
+import numpy as np
 import pytest  # noqa
 
 from vllm.config import CacheConfig, LoRAConfig, SchedulerConfig
+from vllm.core.block_manager_v1 import UncachedBlockAllocator
 from vllm.core.interfaces import AllocStatus
 from vllm.core.policy import PolicyFactory
 from vllm.core.scheduler import Scheduler, SchedulingBudget
 from vllm.lora.request import LoRARequest
-from vllm.sequence import Logprob, SequenceGroup, SequenceStatus
+from vllm.outputs import RequestOutput
+from vllm.preserve.eviction import PreservedSessions
+from vllm.sequence import Logprob, RequestSLO, SequenceGroup, SequenceStatus
+from vllm.utils import Device
 
-from .utils import create_dummy_prompt
+from .utils import create_dummy_prompt, preserve_session
 
 
 def get_sequence_groups(scheduler_output):
@@ -314,10 +319,14 @@ def initialize_scheduler(*,
                          max_num_seqs=1000,
                          max_token_budget=1000,
                          max_model_len=1000,
-                         lora_config=None):
+                         lora_config=None,
+                         use_v2_block_manager=False):
     block_size = 4
-    scheduler_config = SchedulerConfig(max_token_budget, max_num_seqs,
-                                       max_model_len)
+    scheduler_config = SchedulerConfig(
+        max_token_budget,
+        max_num_seqs,
+        max_model_len,
+        use_v2_block_manager=use_v2_block_manager)
     cache_config = CacheConfig(block_size, 1.0, 1, "auto")
     cache_config.num_cpu_blocks = 8
     cache_config.num_gpu_blocks = 8
@@ -899,3 +908,469 @@ def test_scheduling_budget():
     assert budget.num_curr_seqs == 0
     budget.subtract_num_seqs(seq_group.request_id, 2)
     assert budget.num_curr_seqs == 0
+
+
+@pytest.mark.parametrize("use_v2_block_manager", [False, True])
+def test_preserved_session_spills_to_cpu(use_v2_block_manager: bool):
+    scheduler = initialize_scheduler(
+        use_v2_block_manager=use_v2_block_manager)
+    session_seq = preserve_session(scheduler, "0", prompt_length=16)
+    session_gpu_blocks = scheduler.block_manager.get_block_table(session_seq)
+    session_id_block = PreservedSessions()
+    session_id_block["session"] = session_seq.seq_id
+    session_id_arrived = PreservedSessions()
+
+    # The prompt does not fit next to the preserved session, which is
+    # demoted to CPU instead of being freed.
+    _, seq_group = create_dummy_prompt("1", prompt_length=24, block_size=4)
+    scheduler.add_seq_group(seq_group)
+    _, out = scheduler.schedule(session_id_block, session_id_arrived)
+    assert len(out.scheduled_seq_groups) == 0
+    assert [gpu for gpu, _ in out.blocks_to_swap_out] == session_gpu_blocks
+    assert dict(session_id_block) == {"session": session_seq.seq_id}
+    assert scheduler.block_manager.is_seq_id_swapped(session_seq.seq_id)
+    assert scheduler.block_manager.get_num_free_cpu_blocks() == 4
+
+    _, out = scheduler.schedule(session_id_block, session_id_arrived)
+    assert get_sequence_groups(out) == [seq_group]
+    assert out.blocks_to_swap_out == []
+    scheduler.abort_seq_group("1")
+
+    # The next turn swaps in only the reused prefix of the session.
+    _, next_turn = create_dummy_prompt("2", prompt_length=20, block_size=4)
+    next_turn.session_id = "session"
+    next_turn.computed_block_seq = session_id_block.pop("session")
+    next_turn.session_reuse = 9
+    session_id_arrived["session"] = next_turn.computed_block_seq
+    scheduler.add_seq_group(next_turn)
+    _, out = scheduler.schedule(session_id_block, session_id_arrived)
+    assert get_sequence_groups(out) == [next_turn]
+    assert len(out.blocks_to_swap_in) == 2
+    assert next_turn.computed_block_nums == [
+        gpu for _, gpu in out.blocks_to_swap_in
+    ]
+    assert len(session_id_arrived) == 0
+    assert scheduler.block_manager.get_num_free_cpu_blocks() == 8
+
+
+def test_preserved_session_freed_without_cpu_space():
+    scheduler = initialize_scheduler()
+    scheduler.block_manager.cpu_allocator.free_blocks.clear()
+    session_seq = preserve_session(scheduler, "0", prompt_length=16)
+    session_id_block = PreservedSessions()
+    session_id_block["session"] = session_seq.seq_id
+
+    _, seq_group = create_dummy_prompt("1", prompt_length=24, block_size=4)
+    scheduler.add_seq_group(seq_group)
+    _, out = scheduler.schedule(session_id_block, PreservedSessions())
+    assert get_sequence_groups(out) == [seq_group]
+    assert out.blocks_to_swap_out == []
+    assert len(session_id_block) == 0
+    assert scheduler.block_manager.get_retained_token_ids(
+        session_seq.seq_id) is None
+
+
+
+@pytest.mark.parametrize("use_v2_block_manager", [False, True])
+def test_preserved_sessions_released_in_one_pass(use_v2_block_manager: bool):
+    scheduler = initialize_scheduler(
+        use_v2_block_manager=use_v2_block_manager)
+    if use_v2_block_manager:
+        scheduler.block_manager.block_allocator._allocators[
+            Device.CPU]._free_block_indices.clear()
+    else:
+        scheduler.block_manager.cpu_allocator.free_blocks.clear()
+    session_id_block = PreservedSessions()
+    for i in range(6):
+        session_seq = preserve_session(scheduler, str(i), prompt_length=4)
+        session_id_block[f"session{i}"] = session_seq.seq_id
+
+    num_passes = 0
+    schedule_default = scheduler._schedule_default
+
+    def count_passes(*args, **kwargs):
+        nonlocal num_passes
+        num_passes += 1
+        return schedule_default(*args, **kwargs)
+
+    scheduler._schedule_default = count_passes
+
+    # The prompt misses two blocks; the two oldest sessions are freed
+    # together and the prompt is scheduled by a single extra pass.
+    _, seq_group = create_dummy_prompt("6", prompt_length=16, block_size=4)
+    scheduler.add_seq_group(seq_group)
+    _, out = scheduler.schedule(session_id_block, PreservedSessions())
+    assert get_sequence_groups(out) == [seq_group]
+    assert num_passes == 2
+    assert list(session_id_block) == [f"session{i}" for i in range(2, 6)]
+    assert scheduler.get_and_reset_num_evicted_sessions() == 2
+
+
+def test_preserved_session_demoted_to_disk():
+    scheduler = initialize_scheduler()
+    block_manager = scheduler.block_manager
+    block_manager.cpu_allocator.free_blocks = (
+        block_manager.cpu_allocator.free_blocks[:4])
+    block_manager.disk_allocator = UncachedBlockAllocator(
+        Device.DISK, block_size=4, num_blocks=8)
+
+    # An idle session already demoted to CPU fills the CPU swap space.
+    cpu_session = preserve_session(scheduler, "0", prompt_length=16)
+    block_manager.swap_out_seq_id(cpu_session.seq_id)
+    gpu_session = preserve_session(scheduler, "1", prompt_length=16)
+    session_id_block = PreservedSessions()
+    session_id_block["cpu"] = cpu_session.seq_id
+    session_id_block["gpu"] = gpu_session.seq_id
+
+    # The GPU session moves to CPU after the CPU session moves to disk.
+    _, seq_group = create_dummy_prompt("2", prompt_length=24, block_size=4)
+    scheduler.add_seq_group(seq_group)
+    _, out = scheduler.schedule(session_id_block, PreservedSessions())
+    assert len(out.scheduled_seq_groups) == 0
+    assert len(out.blocks_to_disk_out) == 4
+    assert len(out.blocks_to_swap_out) == 4
+    assert block_manager.get_seq_id_device(cpu_session.seq_id) == Device.DISK
+    assert block_manager.get_seq_id_device(gpu_session.seq_id) == Device.CPU
+
+    _, out = scheduler.schedule(session_id_block, PreservedSessions())
+    assert get_sequence_groups(out) == [seq_group]
+    scheduler.abort_seq_group("2")
+
+    # The next turn of the disk session is restored straight to GPU.
+    _, next_turn = create_dummy_prompt("3", prompt_length=20, block_size=4)
+    next_turn.session_id = "cpu"
+    next_turn.computed_block_seq = session_id_block.pop("cpu")
+    next_turn.session_reuse = 12
+    scheduler.add_seq_group(next_turn)
+    session_id_arrived = PreservedSessions()
+    session_id_arrived["cpu"] = next_turn.computed_block_seq
+    _, out = scheduler.schedule(session_id_block, session_id_arrived)
+    assert get_sequence_groups(out) == [next_turn]
+    assert out.blocks_to_swap_in == []
+    assert len(out.blocks_to_disk_in) == 3
+    assert next_turn.computed_block_nums == [
+        gpu for _, gpu in out.blocks_to_disk_in
+    ]
+    assert block_manager.get_num_free_disk_blocks() == 8
+
+
+def test_preserved_session_compressed():
+    scheduler = initialize_scheduler()
+    block_manager = scheduler.block_manager
+    block_manager.compressed_allocator = UncachedBlockAllocator(
+        Device.COMPRESSED, block_size=4, num_blocks=8)
+    session_seq = preserve_session(scheduler, "0", prompt_length=16)
+    session_id_block = PreservedSessions()
+    session_id_block["session"] = session_seq.seq_id
+
+    # The session is compressed on GPU rather than swapped out.
+    _, seq_group = create_dummy_prompt("1", prompt_length=24, block_size=4)
+    scheduler.add_seq_group(seq_group)
+    _, out = scheduler.schedule(session_id_block, PreservedSessions())
+    assert len(out.scheduled_seq_groups) == 0
+    assert out.blocks_to_swap_out == []
+    assert len(out.blocks_to_compress) == 4
+    assert block_manager.get_seq_id_device(
+        session_seq.seq_id) == Device.COMPRESSED
+    assert block_manager.get_num_free_cpu_blocks() == 8
+
+    _, out = scheduler.schedule(session_id_block, PreservedSessions())
+    assert get_sequence_groups(out) == [seq_group]
+    scheduler.abort_seq_group("1")
+
+    # Its next turn decompresses the reused blocks.
+    _, next_turn = create_dummy_prompt("2", prompt_length=20, block_size=4)
+    next_turn.session_id = "session"
+    next_turn.computed_block_seq = session_id_block.pop("session")
+    next_turn.session_reuse = 12
+    scheduler.add_seq_group(next_turn)
+    session_id_arrived = PreservedSessions()
+    session_id_arrived["session"] = next_turn.computed_block_seq
+    _, out = scheduler.schedule(session_id_block, session_id_arrived)
+    assert get_sequence_groups(out) == [next_turn]
+    assert out.blocks_to_swap_in == []
+    assert len(out.blocks_to_decompress) == 3
+    assert next_turn.computed_block_nums == [
+        gpu for _, gpu in out.blocks_to_decompress
+    ]
+    assert block_manager.get_num_free_compressed_blocks() == 8
+
+
+def test_admission_reserves_blocks_for_sessions():
+    scheduler = initialize_scheduler()
+    scheduler.scheduler_config.session_admission_horizon = 10.0
+    scheduler.reserve_session_blocks(6)
+
+    # The new request would leave fewer free blocks than reserved, so the
+    # returning session behind it is scheduled first.
+    _, new_group = create_dummy_prompt("0", prompt_length=12, block_size=4)
+    _, session_group = create_dummy_prompt("1", prompt_length=4, block_size=4)
+    session_group.session_id = "session"
+    scheduler.add_seq_group(new_group)
+    scheduler.add_seq_group(session_group)
+    _, out = scheduler.schedule(PreservedSessions(), PreservedSessions())
+    assert get_sequence_groups(out) == [session_group]
+    assert list(scheduler.waiting) == [new_group]
+
+    # The request is admitted once it has waited for the horizon.
+    new_group.metrics.arrival_time -= 10.0
+    _, out = scheduler.schedule(PreservedSessions(), PreservedSessions())
+    assert get_sequence_groups(out) == [new_group]
+
+
+def test_admission_without_reservation():
+    scheduler = initialize_scheduler()
+    scheduler.scheduler_config.session_admission_horizon = 10.0
+    scheduler.reserve_session_blocks(2)
+    _, seq_group = create_dummy_prompt("0", prompt_length=12, block_size=4)
+    scheduler.add_seq_group(seq_group)
+    _, out = scheduler.schedule(PreservedSessions(), PreservedSessions())
+    assert get_sequence_groups(out) == [seq_group]
+
+
+def test_migrate_preserved_session():
+    src, dst = initialize_scheduler(), initialize_scheduler()
+    session_seq = preserve_session(src, "0", prompt_length=16)
+    token_ids = src.get_retained_token_ids(session_seq.seq_id)
+    src_block_numbers = src.get_seq_id_gpu_block_numbers(session_seq.seq_id,
+                                                         num_blocks=3)
+    assert src_block_numbers == src.block_manager.get_block_table(
+        session_seq)[:3]
+
+    assert dst.migrate_in_seq_id(session_seq.seq_id, 1, src_block_numbers,
+                                 token_ids)
+    dst_block_numbers = dst.block_manager.block_tables[session_seq.seq_id]
+    assert len(dst_block_numbers) == 3
+    assert dst.get_num_retained_tokens(session_seq.seq_id) == 12
+    assert dst.block_manager.get_num_free_gpu_blocks() == 5
+
+    # The copy is issued with the next step of the destination; the source
+    # blocks are still retained until it has run.
+    _, out = dst.schedule(PreservedSessions(), PreservedSessions())
+    assert not out.is_empty()
+    assert out.blocks_to_migrate == [
+        (1, src_block, dst_block.block_number)
+        for src_block, dst_block in zip(src_block_numbers, dst_block_numbers)
+    ]
+    assert out.migrated_seq_ids == [(1, session_seq.seq_id)]
+    assert src.get_num_retained_tokens(session_seq.seq_id) == 15
+    _, out = dst.schedule(PreservedSessions(), PreservedSessions())
+    assert out.blocks_to_migrate == [] and out.is_empty()
+
+    # The blocks do not fit.
+    assert not dst.migrate_in_seq_id(100, 1, list(range(6)), token_ids)
+
+
+def test_restore_preserved_session():
+    src, dst = initialize_scheduler(), initialize_scheduler()
+    session_seq = preserve_session(src, "0", prompt_length=16)
+    seq_id = session_seq.seq_id
+    token_ids = src.get_retained_token_ids(seq_id)
+    assert src.get_seq_id_device(seq_id) == Device.GPU
+    saved_block_numbers = src.get_seq_id_block_numbers(seq_id)
+    assert saved_block_numbers == src.block_manager.get_block_table(
+        session_seq)
+
+    # The saved blocks are loaded into new GPU blocks right away, not by the
+    # next step.
+    mapping = dst.restore_seq_id(seq_id, saved_block_numbers, token_ids)
+    dst_block_numbers = dst.get_seq_id_block_numbers(seq_id)
+    assert mapping == list(zip(saved_block_numbers, dst_block_numbers))
+    assert np.array_equal(dst.get_retained_token_ids(seq_id), token_ids)
+    _, out = dst.schedule(PreservedSessions(), PreservedSessions())
+    assert out.is_empty()
+
+    # The blocks do not fit.
+    assert dst.restore_seq_id(100, list(range(6)), token_ids) is None
+
+
+@pytest.mark.parametrize("use_v2_block_manager", [False, True])
+def test_num_cached_tokens(use_v2_block_manager: bool):
+    scheduler = initialize_scheduler(
+        use_v2_block_manager=use_v2_block_manager)
+    session_seq = preserve_session(scheduler, "0", prompt_length=12)
+    session_id_block = PreservedSessions()
+    session_id_arrived = PreservedSessions()
+
+    # A prompt without a session computes every token.
+    _, seq_group = create_dummy_prompt("1", prompt_length=6, block_size=4)
+    scheduler.add_seq_group(seq_group)
+    _, out = scheduler.schedule(session_id_block, session_id_arrived)
+    assert get_sequence_groups(out) == [seq_group]
+    assert seq_group.num_cached_tokens == 0
+    scheduler.abort_seq_group("1")
+
+    # The next turn reuses the blocks of the whole previous turn.
+    _, next_turn = create_dummy_prompt("2", prompt_length=14, block_size=4)
+    next_turn.session_id = "session"
+    next_turn.computed_block_seq = session_seq.seq_id
+    next_turn.session_reuse = 12
+    session_id_arrived["session"] = session_seq.seq_id
+    scheduler.add_seq_group(next_turn)
+    metas, out = scheduler.schedule(session_id_block, session_id_arrived)
+    assert get_sequence_groups(out) == [next_turn]
+    assert next_turn.num_cached_tokens == 12
+    output = RequestOutput.from_seq_group(next_turn)
+    assert output.num_cached_tokens == 12
+
+    # Decode steps keep the count of the prompt.
+    append_new_token_seq_group(metas[0].token_chunk_size, next_turn, 1)
+    _, out = scheduler.schedule(session_id_block, session_id_arrived)
+    assert get_sequence_groups(out) == [next_turn]
+    assert next_turn.num_cached_tokens == 12
+
+
+def test_priority_policy_schedules_highest_first():
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 1, 16, scheduling_policy="priority")
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    _, batch = create_dummy_prompt("0", prompt_length=block_size)
+    scheduler.add_seq_group(batch)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [batch]
+    append_new_token(out, 1)
+
+    # An interactive request preempts the running batch request, which
+    # only fits in max_num_seqs again after it.
+    _, interactive = create_dummy_prompt("1", prompt_length=block_size)
+    interactive.priority = 1.0
+    scheduler.add_seq_group(interactive)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [interactive]
+    assert out.preempted == 1
+    assert list(scheduler.waiting) == [batch]
+    assert batch.is_prefill()
+
+    # Requests of equal priority are not preempted.
+    _, other = create_dummy_prompt("2", prompt_length=block_size)
+    other.priority = 1.0
+    scheduler.add_seq_group(other)
+    append_new_token(out, 1)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [interactive]
+    assert out.preempted == 0
+    assert list(scheduler.waiting) == [other, batch]
+
+
+def test_priority_policy_does_not_preempt_for_reserved_blocks():
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 2, 32, scheduling_policy="priority")
+    scheduler_config.session_admission_horizon = 10.0
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    _, batch = create_dummy_prompt("0", prompt_length=20, block_size=4)
+    scheduler.add_seq_group(batch)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [batch]
+    append_new_token(out, 1)
+
+    # The interactive request does not fit, and would not be admitted into
+    # the blocks reserved for sessions even if the batch request gave up
+    # its blocks, so it is not preempted.
+    scheduler.reserve_session_blocks(6)
+    _, interactive = create_dummy_prompt("1", prompt_length=16, block_size=4)
+    interactive.priority = 1.0
+    scheduler.add_seq_group(interactive)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [batch]
+    assert out.preempted == 0
+    assert list(scheduler.waiting) == [interactive]
+
+
+def test_priority_policy_releases_idle_sessions_before_preempting():
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 2, 32, scheduling_policy="priority")
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+    session_seq = preserve_session(scheduler, "0", prompt_length=16)
+    session_id_block = PreservedSessions()
+    session_id_block["idle"] = session_seq.seq_id
+
+    _, batch = create_dummy_prompt("1", prompt_length=8, block_size=4)
+    scheduler.add_seq_group(batch)
+    _, out = scheduler.schedule(session_id_block, PreservedSessions())
+    assert get_sequence_groups(out) == [batch]
+    append_new_token(out, 1)
+
+    # The interactive request lacks one block, which the idle session gives
+    # up instead of the running batch request.
+    _, interactive = create_dummy_prompt("2", prompt_length=12, block_size=4)
+    interactive.priority = 1.0
+    scheduler.add_seq_group(interactive)
+    _, out = scheduler.schedule(session_id_block, PreservedSessions())
+    assert get_sequence_groups(out) == [interactive]
+    assert out.preempted == 0
+    assert len(out.blocks_to_swap_out) == 4
+    assert batch in scheduler.running
+    assert dict(session_id_block) == {"idle": session_seq.seq_id}
+    assert scheduler.block_manager.is_seq_id_swapped(session_seq.seq_id)
+
+
+def test_edf_policy():
+    policy = PolicyFactory.get_policy("edf")
+    _, relaxed = create_dummy_prompt("0", prompt_length=4)
+    relaxed.slo = RequestSLO(ttft=10.0, tpot=0.1)
+    _, urgent = create_dummy_prompt("1", prompt_length=4)
+    urgent.slo = RequestSLO(ttft=1.0)
+    _, best_effort = create_dummy_prompt("2", prompt_length=4)
+    now = time.time()
+    assert list(
+        policy.sort_by_priority(
+            now, deque([best_effort, relaxed,
+                        urgent]))) == [urgent, relaxed, best_effort]
+
+    # After the first token, the next one is due one TPOT later.
+    relaxed.metrics.first_token_time = relaxed.metrics.arrival_time
+    relaxed.get_seqs()[0].append_token_id(1, {1: Logprob(1)})
+    assert policy.get_deadline(relaxed) == pytest.approx(
+        relaxed.metrics.arrival_time + 0.1)
+    urgent.metrics.first_token_time = urgent.metrics.arrival_time
+    urgent.get_seqs()[0].append_token_id(1, {1: Logprob(1)})
+    # Without a TPOT SLO, decodes go last.
+    assert list(policy.sort_by_priority(
+        now, deque([urgent, relaxed]))) == [relaxed, urgent]
+
+
+def test_sjf_policy():
+    policy = PolicyFactory.get_policy("sjf", default_output_len=8)
+    _, long = create_dummy_prompt("0", prompt_length=4)
+    _, short = create_dummy_prompt("1", prompt_length=4)
+    short.sampling_params.max_tokens = 2
+    _, long_prompt = create_dummy_prompt("2", prompt_length=400)
+    now = time.time()
+    assert list(policy.sort_by_priority(
+        now, deque([long_prompt, long, short]))) == [short, long, long_prompt]
+    assert policy.get_remaining_work(long) == pytest.approx(8 + 0.02 * 4)
+
+    # Finished requests move the predicted output length.
+    for _ in range(4):
+        long.get_seqs()[0].append_token_id(1, {1: Logprob(1)})
+    policy.observe_finished(long)
+    assert policy.mean_output_len == pytest.approx(8 + 0.1 * (4 - 8))
+
+
+@pytest.mark.parametrize("use_v2_block_manager", [False, True])
+def test_free_seq_after_free_finished_seq(use_v2_block_manager: bool):
+    scheduler = initialize_scheduler(
+        use_v2_block_manager=use_v2_block_manager)
+    seq, seq_group = create_dummy_prompt("0", prompt_length=16, block_size=4)
+    scheduler._allocate_and_set_running(seq_group)
+    seq.status = SequenceStatus.FINISHED_STOPPED
+    num_free_blocks = scheduler.block_manager.get_num_free_gpu_blocks()
+
+    # The last block goes first, then the rest of the sequence.
+    scheduler.free_finished_seq(seq, 1)
+    assert seq.n_blocks == 3
+    scheduler.free_seq(seq)
+    assert seq.n_blocks == 0
+    assert (scheduler.block_manager.get_num_free_gpu_blocks() ==
+            num_free_blocks + 4)
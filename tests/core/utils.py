@@ -40,6 +40,18 @@ def create_dummy_prompt(
     return prompt, seq_group
 
 
+def preserve_session(scheduler, request_id: str,
+                     prompt_length: int) -> Sequence:
+    """Run a finished turn through the block manager and keep its blocks as
+    a preserved session, like `free_finished_seq_groups` does."""
+    seq, seq_group = create_dummy_prompt(request_id,
+                                         prompt_length=prompt_length,
+                                         block_size=4)
+    scheduler._allocate_and_set_running(seq_group)
+    scheduler.block_manager.retain(seq)
+    return seq
+
+
 def create_dummy_prompt_encoder_decoder(
     request_id: str,
     decoder_prompt_length: int,
@@ -140,3 +140,48 @@ def test_multiple_sampling_params(llm: LLM):
     # sampling_params is None, default params should be applied
     outputs = llm.generate(PROMPTS, sampling_params=None)
     assert len(PROMPTS) == len(outputs)
+
+
+@pytest.mark.skip_global_cleanup
+def test_session_turns(llm: LLM):
+    sampling_params = SamplingParams(temperature=0.0, max_tokens=8)
+    session_ids = [f"test-session-{i}" for i in range(len(PROMPTS))]
+
+    # The first turn of every session, batched.
+    first_turns = llm.generate(PROMPTS,
+                               sampling_params=sampling_params,
+                               session_id=session_ids)
+    next_prompts = [{
+        "prompt_token_ids":
+        list(output.prompt_token_ids) + list(output.outputs[0].token_ids) +
+        [2]
+    } for output in first_turns]
+
+    # The second turns reuse the preserved KV and match a fresh prefill.
+    outputs = llm.generate(next_prompts,
+                           sampling_params=sampling_params,
+                           session_id=session_ids)
+    expected = llm.generate(next_prompts, sampling_params=sampling_params)
+    assert_outputs_equal(outputs, expected)
+    for session_id in session_ids:
+        llm.free_session(session_id)
+
+    # Every session has a single turn in flight.
+    with pytest.raises(ValueError):
+        llm.generate(PROMPTS[:2],
+                     sampling_params=sampling_params,
+                     session_id=["s", "s"])
+
+
+@pytest.mark.skip_global_cleanup
+def test_chat_session(llm: LLM):
+    sampling_params = SamplingParams(temperature=0.0, max_tokens=8)
+    with llm.chat_session() as session:
+        session.generate(PROMPTS[0], sampling_params)
+        output = session.generate(" and", sampling_params)
+        assert len(session.token_ids) == (len(output.prompt_token_ids) +
+                                          len(output.outputs[0].token_ids))
+
+    expected = llm.generate({"prompt_token_ids": output.prompt_token_ids},
+                            sampling_params=sampling_params)
+    assert_outputs_equal([output], expected)
@@ -8,7 +8,8 @@ from prometheus_client import REGISTRY
 from vllm import EngineArgs, LLMEngine
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_llm_engine import AsyncLLMEngine
-from vllm.engine.metrics import RayPrometheusStatLogger
+from vllm.engine.metrics import (PrometheusStatLogger, RayPrometheusStatLogger,
+                                 Stats)
 from vllm.sampling_params import SamplingParams
 
 from ..conftest import cleanup
@@ -386,3 +387,51 @@ def test_engine_log_metrics_ray(
         assert logger._i > 0, ".log must be called at least once"
 
     ray.get(_inner.remote())
+
+
+def test_session_metrics():
+    labels = {"model_name": "session-model"}
+    stat_logger = PrometheusStatLogger(local_interval=5,
+                                       labels=labels,
+                                       max_model_len=1024)
+    stats = Stats(now=time.time(),
+                  num_running_sys=0,
+                  num_waiting_sys=0,
+                  num_swapped_sys=0,
+                  gpu_cache_usage_sys=0.0,
+                  cpu_cache_usage_sys=0.0,
+                  num_prompt_tokens_iter=0,
+                  num_generation_tokens_iter=0,
+                  time_to_first_tokens_iter=[0.1, 0.2, 0.3],
+                  time_per_output_tokens_iter=[],
+                  num_preemption_iter=0,
+                  time_e2e_requests=[],
+                  num_prompt_tokens_requests=[],
+                  num_generation_tokens_requests=[],
+                  best_of_requests=[],
+                  n_requests=[],
+                  finished_reason_requests=[],
+                  num_preserved_blocks_sys=42,
+                  time_to_first_tokens_session_iter=[0.1],
+                  time_to_first_tokens_non_session_iter=[0.2, 0.3],
+                  session_reused_tokens_iter=[0, 100, 500],
+                  session_evictions_iter={
+                      "memory": 2,
+                      "ttl": 1
+                  })
+    stat_logger.log(stats)
+
+    def get(name: str, **extra_labels) -> float:
+        return REGISTRY.get_sample_value(name, {**labels, **extra_labels})
+
+    assert get("vllm:num_preserved_blocks") == 42
+    assert get("vllm:session_turns_total") == 3
+    assert get("vllm:session_hits_total") == 2
+    assert get("vllm:session_reused_tokens_count") == 3
+    assert get("vllm:session_reused_tokens_sum") == 600
+    assert get("vllm:session_evictions_total", reason="memory") == 2
+    assert get("vllm:session_evictions_total", reason="ttl") == 1
+    assert get("vllm:session_time_to_first_token_seconds_count",
+               session="true") == 1
+    assert get("vllm:session_time_to_first_token_seconds_count",
+               session="false") == 2
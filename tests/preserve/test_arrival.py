@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from vllm.preserve.arrival import (EMAArrivalEstimator,
+                                   QuantileArrivalEstimator, QuantileSketch,
+                                   replay_arrivals)
+from vllm.preserve.session_config import SessionConfig
+from vllm.preserve.simulator import TraceRequest
+
+
+def test_quantile_sketch():
+    sketch = QuantileSketch(max_samples=4)
+    for value in [5.0, 1.0, 3.0, 2.0, 4.0]:
+        sketch.add(value)
+    # The oldest sample was dropped.
+    assert len(sketch) == 4
+    assert sketch.quantile(0.0) == 1.0
+    assert sketch.quantile(0.5) == 2.5
+    assert sketch.quantile(1.0) == 4.0
+    assert sketch.cdf(2.0) == 0.5
+    assert sketch.cdf(0.5) == 0.0
+
+
+def test_ema_matches_session_config_update():
+    config = SessionConfig(100, 30, 100, 3.0, 0.0, -1)
+    EMAArrivalEstimator().observe("s", config, 160, 6.0, 100)
+    assert config.p == pytest.approx((2 * 30 + 60) / 3)
+    assert config.tau == pytest.approx((2 * 3.0 + 6.0) / 3)
+
+
+def test_arrival_prob_is_conditional():
+    config = SessionConfig(100, 10, 100, 10.0, 0.0, 100)
+    # Memoryless without a fitted distribution.
+    assert config.get_arrival_prob(0.0, 5.0) == pytest.approx(
+        config.get_arrival_prob(20.0, 5.0))
+
+    sketch = QuantileSketch()
+    for value in [10.0, 10.0, 12.0, 12.0]:
+        sketch.add(value)
+    config.inter_arrival = sketch
+    assert config.get_arrival_prob(0.0, 5.0) == 0.0
+    assert config.get_arrival_prob(8.0, 5.0) == 1.0
+    config.continue_prob = 0.5
+    # Once past the usual time, a session is likely over.
+    assert config.get_arrival_prob(0.0, 20.0) == pytest.approx(0.5)
+    assert config.get_arrival_prob(13.0, 20.0) == 0.0
+
+
+def test_new_sessions_start_from_their_tenant():
+    estimator = QuantileArrivalEstimator(min_samples=2)
+    for session_idx in range(3):
+        session_id = f"tenant/{session_idx}"
+        config = SessionConfig(-1, 100, 500, 2.0, 0.0, -1)
+        estimator.start(session_id, config)
+        for turn_idx in range(1, 4):
+            estimator.observe(session_id, config, 500 + 40 * turn_idx,
+                              30.0 * turn_idx, 500)
+        estimator.remove(session_id)
+
+    config = SessionConfig(-1, 100, 500, 2.0, 100.0, -1)
+    estimator.start("tenant/new", config)
+    assert config.tau == 30.0
+    assert config.p == 40.0
+    # 9 turns were followed by another one, 3 sessions ended.
+    assert config.continue_prob == pytest.approx(10 / 14)
+
+    other = SessionConfig(-1, 100, 500, 2.0, 100.0, -1)
+    estimator.start("other/new", other)
+    assert other.tau == 2.0
+    assert other.continue_prob is None
+
+
+def _sample_trace(seed: int):
+    rng = random.Random(seed)
+    trace = []
+    for session_idx in range(40):
+        arrival_time = 7.0 * session_idx
+        prompt_len = 256
+        for _ in range(rng.randint(2, 6)):
+            trace.append(
+                TraceRequest(arrival_time, prompt_len, 32,
+                             f"tenant/{session_idx}"))
+            prompt_len += 96
+            # Users mostly answer within seconds, and sometimes come back
+            # after a break.
+            arrival_time += (rng.uniform(4.0, 6.0)
+                             if rng.random() < 0.8 else rng.uniform(60, 90))
+    return trace
+
+
+def test_replay_measures_forecast_error():
+    trace = _sample_trace(0)
+    ema = replay_arrivals(trace, EMAArrivalEstimator(), horizon=10.0)
+    quantile = replay_arrivals(trace,
+                               QuantileArrivalEstimator(),
+                               horizon=10.0)
+    num_sessions = len({request.session_id for request in trace})
+    for error in (ema, quantile):
+        assert error.num_turns == len(trace) - num_sessions
+        assert error.num_forecasts == len(trace)
+    # The medians ignore the breaks, and the tenant teaches new sessions
+    # its growth and how often sessions go on.
+    assert quantile.tau_mae < ema.tau_mae
+    assert quantile.growth_mae < ema.growth_mae
+    assert quantile.brier_score < ema.brier_score
@@ -0,0 +1,152 @@
+import random
+
+import pytest
+
+from vllm.preserve.eviction import (FIFO, IndexedHeap, PreservedSessions,
+                                    ReuseValue, SessionEvictionPolicyFactory)
+from vllm.preserve.registry import SessionRegistry
+from vllm.preserve.session_config import SessionConfig
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_indexed_heap(seed: int):
+    random.seed(seed)
+    heap = IndexedHeap()
+    priorities = {}
+    for _ in range(500):
+        op = random.random()
+        if op < 0.5 or not priorities:
+            key = str(random.randrange(64))
+            priorities[key] = random.random()
+            heap.push(key, priorities[key])
+        elif op < 0.8:
+            key = random.choice(list(priorities))
+            heap.remove(key)
+            del priorities[key]
+        else:
+            key = heap.pop()
+            assert priorities[key] == min(priorities.values())
+            del priorities[key]
+        assert len(heap) == len(priorities)
+    popped = [heap.pop() for _ in range(len(heap))]
+    assert popped == sorted(priorities, key=priorities.get)
+
+
+def test_fifo_selects_oldest():
+    sessions = PreservedSessions(FIFO())
+    for i in range(4):
+        sessions[f"s{i}"] = i
+    assert sessions.select_victim() == "s0"
+    # Selecting does not remove the session.
+    assert len(sessions) == 4
+    assert sessions.select_victim(lambda _, seq_id: seq_id % 2 == 1) == "s1"
+    del sessions["s0"]
+    assert sessions.select_victim() == "s1"
+    assert sessions.select_victim(lambda *_: False) is None
+
+
+
+def test_select_victims_covers_blocks():
+    sessions = PreservedSessions(FIFO())
+    num_blocks = {0: 1, 1: 2, 2: 8, 3: 1}
+    for seq_id in num_blocks:
+        sessions[f"s{seq_id}"] = seq_id
+    assert sessions.select_victims(0, num_blocks.get) == []
+    assert sessions.select_victims(3, num_blocks.get) == ["s0", "s1"]
+    # The large session alone frees enough, so the small ones ranked before
+    # it are spared.
+    assert sessions.select_victims(5, num_blocks.get) == ["s2"]
+    assert sessions.select_victims(
+        5, num_blocks.get, lambda _, seq_id: seq_id != 2) == ["s0", "s1", "s3"]
+    # Selecting does not remove the sessions.
+    assert len(sessions) == 4
+
+
+def test_reuse_value_ranking():
+    now = 100.0
+    configs = {
+        # Long history, slow to come back.
+        "slow": SessionConfig(1000, 100, 1000, 50.0, now - 10, 15),
+        # Short history, comes back often.
+        "fast": SessionConfig(200, 100, 200, 2.0, now - 10, 15),
+        # Next turn expected in 0.5s.
+        "imminent": SessionConfig(4000, 100, 4000, 10.0, now - 9.5, 15),
+    }
+    num_tokens = {0: 1000, 1: 200, 2: 4000}
+    policy = ReuseValue()
+    sessions = PreservedSessions(policy, configs, num_tokens.get)
+    sessions["slow"] = 0
+    sessions["fast"] = 1
+    sessions["imminent"] = 2
+
+    # 1000 tokens / 50s is worth less than 200 tokens / 2s.
+    assert sessions.select_victim(now=now) == "slow"
+    assert policy.is_protected(now, configs["imminent"])
+    # The imminent session is only evicted as a last resort.
+    assert sessions.select_victim(lambda s, _: s != "slow", now=now) == "fast"
+    assert sessions.select_victim(lambda s, _: s == "imminent",
+                                  now=now) == "imminent"
+
+
+def test_reuse_value_reranks_overdue_sessions():
+    clock = [5.0]
+    configs = {
+        "large": SessionConfig(4000, 100, 4000, 10.0, 0.0, 15),
+        "small": SessionConfig(200, 100, 200, 10.0, 0.0, 15),
+    }
+    num_tokens = {0: 4000, 1: 200}
+    sessions = PreservedSessions(ReuseValue(), configs, num_tokens.get,
+                                 clock=lambda: clock[0])
+    sessions["large"] = 0
+    sessions["small"] = 1
+    assert sessions.select_victim() == "small"
+
+    # Much later, the large session is long overdue while the small one had
+    # another turn and is expected back in 3s.
+    clock[0] = 1000.0
+    configs["small"].prev_time = 993.0
+    assert sessions.select_victim() == "large"
+
+
+def test_pending_continue_prob():
+    config = SessionConfig(100, 100, 100, 10.0, 0.0, 15)
+    config.continue_prob = 0.5
+    assert config.get_pending_continue_prob(0.0) == 0.5
+    # The longer the next turn is late, the less likely it is to come.
+    assert (config.get_pending_continue_prob(10.0) <
+            config.get_pending_continue_prob(5.0) < 0.5)
+    assert config.get_pending_continue_prob(1000.0) < 1e-6
+
+
+def test_pin_and_priority():
+    registry = SessionRegistry()
+    sessions = PreservedSessions(FIFO(), registry.configs,
+                                 session_registry=registry)
+    for i in range(3):
+        sessions[f"s{i}"] = i
+    registry.get_or_create("s0").pinned = True
+    # Pinned sessions are never victims, not even as a last resort.
+    assert sessions.select_victim() == "s1"
+    assert sessions.select_victim(lambda s, _: s == "s0") is None
+
+    # A higher priority outranks the policy.
+    registry.get_or_create("s1").priority = 1.0
+    sessions.refresh("s1")
+    assert sessions.select_victim() == "s2"
+    registry.get_or_create("s0").pinned = False
+    assert sessions.select_victim() == "s0"
+
+
+def test_reuse_value_last_round():
+    config = SessionConfig(100, 100, 100, 1.0, 0.0, 3)
+    config.prev_time = 5.0
+    policy = ReuseValue()
+    # Past its expected number of rounds, the session is worth nothing.
+    assert policy.get_priority(5.5, config, 1000) == 0.0
+    assert not policy.is_protected(6.0, config)
+
+
+def test_factory():
+    assert isinstance(SessionEvictionPolicyFactory.get_policy("fifo"), FIFO)
+    assert isinstance(SessionEvictionPolicyFactory.get_policy("reuse_value"),
+                      ReuseValue)
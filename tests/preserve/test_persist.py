@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from vllm.preserve.arrival import QuantileSketch
+from vllm.preserve.persist import (PersistedSession, has_manifest,
+                                   load_manifest, remove_manifest,
+                                   save_manifest)
+from vllm.preserve.registry import SessionInfo
+from vllm.preserve.session_config import SessionConfig
+
+METADATA = {"model": "facebook/opt-125m", "block_size": 16}
+
+
+def test_save_and_load_sessions(tmp_path):
+    config = SessionConfig(100, 30.5, 160, 4.0, 10.0, 5)
+    config.update(200, 14.0, 3)
+    config.inter_arrival = QuantileSketch(max_samples=3)
+    for value in [4.0, 1.0, 3.0, 2.0]:
+        config.inter_arrival.add(value)
+    config.continue_prob = 0.75
+    sessions = [
+        PersistedSession(
+            SessionInfo("tenant/a",
+                        config,
+                        pinned=True,
+                        priority=2.0,
+                        last_seen=14.0,
+                        num_turns=2,
+                        num_prompt_tokens=200,
+                        output_reuse_ratio=0.5), 0, [0, 1], np.arange(32)),
+        PersistedSession(SessionInfo("tenant/b"), 1, [0, 2],
+                         np.arange(100, 120)),
+    ]
+    save_manifest(str(tmp_path), METADATA, 3, sessions)
+    assert has_manifest(str(tmp_path))
+
+    num_blocks, loaded = load_manifest(str(tmp_path), METADATA)
+    assert num_blocks == 3
+    assert [session.info.session_id
+            for session in loaded] == ["tenant/a", "tenant/b"]
+    a, b = loaded
+    assert a.info.pinned and a.info.priority == 2.0
+    assert a.info.num_turns == 2 and a.info.output_reuse_ratio == 0.5
+    assert (a.virtual_engine, a.block_numbers) == (0, [0, 1])
+    assert np.array_equal(a.token_ids, np.arange(32))
+    assert vars(a.info.config).keys() == vars(config).keys()
+    for name in ("ip", "p", "prev_p", "prev_time", "tau", "t0", "rounds",
+                 "continue_prob"):
+        assert getattr(a.info.config, name) == getattr(config, name)
+    # The oldest sample was dropped before saving.
+    assert list(a.info.config.inter_arrival) == [1.0, 3.0, 2.0]
+    assert a.info.config.get_arrival_prob(20.0, 5.0) == pytest.approx(
+        config.get_arrival_prob(20.0, 5.0))
+
+    assert b.info.config is None
+    assert (b.virtual_engine, b.block_numbers) == (1, [0, 2])
+    assert np.array_equal(b.token_ids, np.arange(100, 120))
+
+
+def test_load_rejects_other_metadata(tmp_path):
+    save_manifest(str(tmp_path), METADATA, 0, [])
+    num_blocks, sessions = load_manifest(str(tmp_path), METADATA)
+    assert (num_blocks, sessions) == (0, [])
+    with pytest.raises(ValueError):
+        load_manifest(str(tmp_path), dict(METADATA, block_size=32))
+
+    remove_manifest(str(tmp_path))
+    assert not has_manifest(str(tmp_path))
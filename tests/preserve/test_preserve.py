@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from vllm.preserve.preserve import (SessionForecaster, longest_common_prefix,
+                                    sp_at_time)
+from vllm.preserve.session_config import SessionConfig
+
+
+@pytest.mark.parametrize("cached, tokens, expected", [
+    ([], [1, 2, 3], 0),
+    ([1, 2, 3], [], 0),
+    ([1, 2, 3], [1, 2, 3, 4, 5], 3),
+    ([1, 2, 3, 4, 5], [1, 2, 3], 3),
+    ([1, 2, 3, 4], [1, 2, 7, 4], 2),
+    ([9, 2, 3], [1, 2, 3], 0),
+])
+def test_longest_common_prefix(cached, tokens, expected):
+    cached_token_ids = np.asarray(cached, dtype=np.int64)
+    assert longest_common_prefix(cached_token_ids, tokens) == expected
+
+
+def test_longest_common_prefix_ignores_template_delimiters():
+    # The match must not depend on any chat template token; an edit in the
+    # middle of the history only invalidates the tokens after it.
+    history = list(range(100, 164))
+    cached_token_ids = np.asarray(history, dtype=np.int64)
+    edited = history[:40] + [7] + history[41:] + [1, 2, 3]
+    assert longest_common_prefix(cached_token_ids, edited) == 40
+    assert longest_common_prefix(cached_token_ids, history + [1, 2]) == 64
+
+
+def _random_configs(rng, num_sessions, t0):
+    return {
+        f"s{i}": SessionConfig(int(rng.integers(1, 3000)),
+                               float(rng.uniform(10, 500)), 0,
+                               float(rng.uniform(0.5, 20)),
+                               t0 + float(rng.uniform(0, 30)),
+                               int(rng.integers(1, 20)))
+        for i in range(num_sessions)
+    }
+
+
+def test_session_forecaster_matches_per_session_sum():
+    rng = np.random.default_rng(0)
+    model_max_len = 4096
+    t0 = 1.7e9
+    configs = _random_configs(rng, 200, t0)
+    forecaster = SessionForecaster(model_max_len)
+    for session_id, config in configs.items():
+        forecaster.update(session_id, config)
+
+    # Avoid the breakpoints themselves, where the strict comparisons of
+    # sp_at_time decide which side a point falls on.
+    times = t0 + rng.uniform(-5, 400, size=500)
+    expected = [
+        sum(sp_at_time(c, model_max_len, t) for c in configs.values())
+        for t in times
+    ]
+    np.testing.assert_allclose(forecaster.evaluate(times), expected,
+                               rtol=1e-9, atol=1e-3)
+
+
+def test_session_forecaster_incremental_updates():
+    rng = np.random.default_rng(1)
+    model_max_len = 2048
+    t0 = 1.7e9
+    configs = _random_configs(rng, 50, t0)
+    forecaster = SessionForecaster(model_max_len)
+    for session_id, config in configs.items():
+        forecaster.update(session_id, config)
+    times = t0 + rng.uniform(0, 200, size=100)
+    forecaster.evaluate(times)
+
+    # Change, remove and add sessions after the events were built.
+    configs["s3"].update(4000, t0 + 40, 3000)
+    forecaster.update("s3", configs["s3"])
+    for session_id in ("s0", "s7", "s8"):
+        forecaster.remove(session_id)
+        del configs[session_id]
+    forecaster.remove("unknown")
+    extra = _random_configs(np.random.default_rng(2), 30, t0)
+    for session_id, config in extra.items():
+        session_id = "x" + session_id
+        configs[session_id] = config
+        forecaster.update(session_id, config)
+    assert len(forecaster) == len(configs)
+
+    expected = [
+        sum(sp_at_time(c, model_max_len, t) for c in configs.values())
+        for t in times
+    ]
+    np.testing.assert_allclose(forecaster.evaluate(times), expected,
+                               rtol=1e-9, atol=1e-3)
+
+
+def test_session_forecaster_forecast():
+    forecaster = SessionForecaster(model_max_len=1000, resolution=128)
+    times, tokens = forecaster.forecast(10.0)
+    assert times.tolist() == [10.0] and tokens.tolist() == [0.0]
+
+    # Grows from 200 tokens by 100 tokens per second, saturates at t=18 and
+    # ends at t=30.
+    forecaster.update("a", SessionConfig(200, 100, 0, 1.0, 10.0, 20))
+    times, tokens = forecaster.forecast(10.0)
+    # The points around the saturation and before the end vary by less than
+    # `resolution` and are merged.
+    assert times.tolist() == [10.0, 17.99, 30.01]
+    assert tokens.tolist() == [200, 999, 0]
+
+    forecaster.update("b", SessionConfig(100, 10, 0, 1.0, 10.0, 100))
+    times, tokens = forecaster.forecast(10.0)
+    assert times[0] == 10.0 and tokens[0] == 300
+    assert times[-1] == 110.01 and tokens[-1] == 0
+    assert np.all(np.diff(times) > 0)
+    assert np.all(np.abs(np.diff(tokens[:-1])) >= 100)
+
+    # Only the events after `now` are forecast.
+    forecaster.remove("b")
+    times, tokens = forecaster.forecast(25.0)
+    assert times.tolist() == [25.0, 30.01]
+    assert tokens.tolist() == [1000, 0]
+
+
+def test_session_forecaster_max_growth():
+    forecaster = SessionForecaster(model_max_len=1000)
+    assert forecaster.get_max_growth(10.0, 5.0) == 0.0
+
+    # Grows from 200 tokens by 100 tokens per second until t=18, then holds
+    # 1000 tokens until t=30.
+    forecaster.update("a", SessionConfig(200, 100, 0, 1.0, 10.0, 20))
+    assert forecaster.get_max_growth(10.0, 5.0) == pytest.approx(500)
+    assert forecaster.get_max_growth(10.0, 50.0) == pytest.approx(800)
+    assert forecaster.get_max_growth(20.0, 50.0) == 0.0
@@ -0,0 +1,25 @@
+from vllm.preserve.reaper import SessionReaper
+
+
+def test_session_reaper():
+    reaper = SessionReaper(ttl=10.0)
+    reaper.touch("a", now=0.0)
+    reaper.touch("b", now=1.0)
+    reaper.touch("c", now=2.0)
+    assert reaper.pop_expired(9.0) == []
+
+    # Touching a session restarts its timer, discarding stops it.
+    reaper.touch("a", now=5.0)
+    reaper.discard("c")
+    reaper.discard("unknown")
+    assert reaper.pop_expired(12.0) == ["b"]
+    assert "a" in reaper and "b" not in reaper
+    assert reaper.pop_expired(15.0) == ["a"]
+    assert len(reaper) == 0
+
+
+def test_session_reaper_disabled():
+    reaper = SessionReaper()
+    reaper.touch("a", now=0.0)
+    assert len(reaper) == 0
+    assert reaper.pop_expired(float("inf")) == []
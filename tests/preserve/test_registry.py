@@ -0,0 +1,61 @@
+from vllm.preserve.registry import SessionRegistry
+from vllm.preserve.session_config import SessionConfig
+
+
+def test_with_prefix():
+    registry = SessionRegistry()
+    for session_id in ["b/2", "a/1", "b/1", "c", "b"]:
+        registry.get_or_create(session_id)
+    assert registry.with_prefix("b/") == ["b/1", "b/2"]
+    assert registry.with_prefix("b") == ["b", "b/1", "b/2"]
+    assert registry.with_prefix("") == ["a/1", "b", "b/1", "b/2", "c"]
+    assert registry.with_prefix("d") == []
+
+    assert registry.remove("b/1") is not None
+    assert registry.remove("b/1") is None
+    assert registry.with_prefix("b/") == ["b/2"]
+    assert len(registry) == 4
+
+
+def test_get_or_create_keeps_state():
+    registry = SessionRegistry()
+    info = registry.get_or_create("s")
+    info.pinned = True
+    info.priority = 2.0
+    assert registry.get_or_create("s") is info
+    assert registry.is_pinned("s")
+    assert registry.get_priority("s") == 2.0
+    assert not registry.is_pinned("unknown")
+    assert registry.get_priority("unknown") == 0.0
+
+
+def test_configs_view():
+    registry = SessionRegistry()
+    registry.get_or_create("pinned-before-first-turn").pinned = True
+    config = SessionConfig(100, 10, 100, 1.0, 0.0, 3)
+    registry.get_or_create("s").config = config
+    # Sessions without a forecast are not in the view.
+    assert dict(registry.configs) == {"s": config}
+    assert registry.configs.get("pinned-before-first-turn") is None
+
+
+def test_predict_reusable_tokens():
+    info = SessionRegistry().get_or_create("s")
+    # Everything is retained until the reuse of a turn was observed.
+    info.num_prompt_tokens = 100
+    assert info.get_num_reusable_tokens(150) == 150
+
+    # The next turn re-rendered the reply: only the prompt is reused.
+    info.observe_reuse(150, 100)
+    assert info.output_reuse_ratio == 0.0
+    info.num_prompt_tokens = 200
+    assert info.get_num_reusable_tokens(260) == 200
+
+    # All the trimmed prefix was reused, so it may have been too short.
+    info.observe_reuse(192, 192)
+    assert info.output_reuse_ratio == 1.0
+
+    info.num_prompt_tokens = 300
+    assert info.get_num_reusable_tokens(340) == 340
+    info.observe_reuse(340, 320)
+    assert info.output_reuse_ratio == 0.5
@@ -0,0 +1,19 @@
+from vllm.preserve.routing import SessionRouter
+
+
+def test_route_without_session():
+    router = SessionRouter(queue_token_cost=100)
+    assert router.route([3, 1, 2], num_prompt_tokens=500) == 1
+    assert router.route([2, 2], num_prompt_tokens=500) == 0
+
+
+def test_route_session():
+    router = SessionRouter(queue_token_cost=100, migration_cost_ratio=0.1)
+    # Migrating 1000 reused tokens costs as much as one queued request.
+    assert router.route([1, 0], 1200, home=0, num_reused_tokens=1000) == 0
+    assert router.route([2, 0], 1200, home=0, num_reused_tokens=1000) == 1
+    assert router.route([0, 0], 1200, home=1, num_reused_tokens=1000) == 1
+    # Larger sessions are more expensive to move.
+    assert router.route([5, 0], 8000, home=0, num_reused_tokens=7000) == 0
+    assert router.route([2, 9, 0], 8000, home=0,
+                        num_reused_tokens=1000) == 2
@@ -0,0 +1,90 @@
+import pytest
+
+from vllm.config import SchedulerConfig
+from vllm.preserve.simulator import CostModel, Simulator, TraceRequest
+
+
+def _make_trace(with_sessions: bool):
+    trace = []
+    for session_idx in range(4):
+        prompt_len = 64
+        for turn_idx in range(3):
+            trace.append(
+                TraceRequest(arrival_time=session_idx + 10.0 * turn_idx,
+                             prompt_len=prompt_len,
+                             output_len=8,
+                             session_id=(f"s{session_idx}"
+                                         if with_sessions else None)))
+            prompt_len += 8 + 32
+    return trace
+
+
+@pytest.mark.parametrize("use_v2_block_manager", [False, True])
+@pytest.mark.parametrize("enable_chunked_prefill", [False, True])
+def test_simulator_reuses_sessions(use_v2_block_manager: bool,
+                                   enable_chunked_prefill: bool):
+
+    def run(with_sessions: bool):
+        scheduler_config = SchedulerConfig(
+            256 if enable_chunked_prefill else 1024,
+            16,
+            1024,
+            use_v2_block_manager=use_v2_block_manager,
+            enable_chunked_prefill=enable_chunked_prefill)
+        simulator = Simulator(scheduler_config,
+                              Simulator.make_cache_config(16, 256, 64),
+                              CostModel(step_overhead=1e-3))
+        return simulator.run(_make_trace(with_sessions))
+
+    result = run(with_sessions=True)
+    assert result.num_finished == result.num_requests == 12
+    assert result.num_session_turns == 8
+    assert result.session_hit_rate == 1.0
+    assert len(result.ttfts) == 12
+    assert result.num_output_tokens == 12 * 8
+
+    baseline = run(with_sessions=False)
+    assert baseline.num_session_turns == 0
+    # The reused tokens are not prefilled again, except for the partial
+    # last block of every turn.
+    assert result.num_prefilled_tokens < baseline.num_prefilled_tokens
+    assert (result.num_prefilled_tokens + result.num_reused_tokens >=
+            baseline.num_prefilled_tokens)
+    assert (result.summary()["p50_ttft_ms"] <
+            baseline.summary()["p50_ttft_ms"])
+
+
+def test_simulator_expires_sessions():
+    scheduler_config = SchedulerConfig(1024, 16, 1024, session_ttl=5.0)
+    simulator = Simulator(scheduler_config,
+                          Simulator.make_cache_config(16, 256, 64))
+    result = simulator.run(_make_trace(with_sessions=True))
+    # The next turns arrive after the sessions expired.
+    assert result.num_session_turns == 8
+    assert result.num_session_hits == 0
+
+
+@pytest.mark.parametrize("use_v2_block_manager", [False, True])
+def test_simulator_trims_rerendered_replies(use_v2_block_manager: bool):
+    trace = []
+    prompt_len = 64
+    for turn_idx in range(4):
+        trace.append(
+            TraceRequest(arrival_time=10.0 * turn_idx,
+                         prompt_len=prompt_len,
+                         output_len=32,
+                         session_id="s",
+                         rerender_output=True))
+        prompt_len += 32 + 32
+    scheduler_config = SchedulerConfig(
+        1024, 16, 1024, use_v2_block_manager=use_v2_block_manager)
+    simulator = Simulator(scheduler_config,
+                          Simulator.make_cache_config(16, 256, 64))
+    result = simulator.run(trace)
+    assert result.session_hit_rate == 1.0
+
+    # Once the reply was seen re-rendered, only the prompt of the last turn
+    # stays retained.
+    seq_id = simulator.session_id_blocks["s"]
+    assert simulator.scheduler.get_num_seq_id_blocks(seq_id) == (
+        trace[-1].prompt_len // 16)
@@ -1,7 +1,8 @@
 import pytest
 
-from vllm.sequence import (CompletionSequenceGroupOutput, SamplerOutput,
-                           SequenceData, SequenceOutput)
+from vllm.sequence import (CompletionSequenceGroupOutput,
+                           FinishedSequenceHeap, Logprob, SamplerOutput,
+                           Sequence, SequenceData, SequenceOutput)
 
 from .core.utils import create_dummy_prompt
 
@@ -95,3 +96,44 @@ def test_sequence_group_stage():
     assert seq_group.is_prefill() is True
     seq_group.update_num_computed_tokens(1)
     assert seq_group.is_prefill() is False
+
+
+def _create_seq(seq_id: int, logprob: float) -> Sequence:
+    seq = Sequence(seq_id,
+                   inputs={
+                       "prompt": "0",
+                       "prompt_token_ids": [0],
+                   },
+                   block_size=4)
+    seq.append_token_id(1, {1: Logprob(logprob)})
+    return seq
+
+
+def test_finished_sequence_heap():
+    heap = FinishedSequenceHeap(capacity=2,
+                                key=lambda seq: seq.get_cumulative_logprob())
+    worst, mid, best = (_create_seq(0, -3.0), _create_seq(1, -2.0),
+                        _create_seq(2, -1.0))
+    assert heap.best() is None
+    assert heap.push(mid) is None
+    assert heap.push(worst) is None
+    # The worst sequence is evicted when the heap is full.
+    assert heap.push(best) is worst
+    assert heap.push(_create_seq(3, -4.0)).seq_id == 3
+    assert heap.best() is best
+    assert set(heap) == {mid, best}
+
+
+def test_sequence_group_keeps_best_session_branch():
+    _, seq_group = create_dummy_prompt("1", 4, best_of=2)
+    seq_group.session_id = "session"
+    first, second = _create_seq(10, -2.0), _create_seq(11, -1.0)
+    # Only the best finished branch keeps its blocks.
+    assert seq_group.save_request(first) is None
+    assert seq_group.save_request(second) is first
+    assert seq_group.save_request(_create_seq(12, -5.0)).seq_id == 12
+    assert seq_group._finished_seq.best() is second
+
+    # Without a session, finished sequences are freed right away.
+    _, seq_group = create_dummy_prompt("2", 4)
+    assert seq_group.save_request(first) is first
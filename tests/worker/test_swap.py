@@ -1,8 +1,11 @@
+import pytest
 import torch
 
 from vllm.engine.arg_utils import EngineArgs
 from vllm.sequence import ExecuteModelRequest
 from vllm.utils import get_distributed_init_method, get_ip, get_open_port
+from vllm.worker.cache_engine import (compress_blocks, copy_blocks_between,
+                                      decompress_blocks)
 from vllm.worker.worker import Worker
 
 
@@ -87,3 +90,48 @@ def test_swap() -> None:
         for src, dst in execute_model_req.blocks_to_swap_in:
             assert allclose(gpu_key_cache[dst], cpu_key_cache[src])
             assert allclose(gpu_value_cache[dst], cpu_value_cache[src])
+
+
+def test_copy_blocks_between_disk(tmp_path) -> None:
+    # (2, num_blocks, block_size * num_heads * head_size) like most backends.
+    cpu_cache = torch.rand(2, 8, 16)
+    disk_cache = torch.from_file(str(tmp_path / "layer_0.kv"),
+                                 shared=True,
+                                 size=2 * 4 * 16,
+                                 dtype=torch.float).view(2, 4, 16)
+
+    copy_blocks_between(cpu_cache, disk_cache, 1,
+                        torch.tensor([[5, 0], [2, 3]]))
+    reloaded = torch.from_file(str(tmp_path / "layer_0.kv"),
+                               shared=True,
+                               size=2 * 4 * 16,
+                               dtype=torch.float).view(2, 4, 16)
+    assert torch.equal(reloaded[:, 0], cpu_cache[:, 5])
+    assert torch.equal(reloaded[:, 3], cpu_cache[:, 2])
+
+    restored = torch.zeros(2, 8, 16)
+    copy_blocks_between(reloaded, restored, 1, torch.tensor([[3, 7]]))
+    assert torch.equal(restored[:, 7], cpu_cache[:, 2])
+
+
+@pytest.mark.parametrize("kv_dtype,storage_dtype,max_error",
+                         [("fp8", torch.uint8, 0.07), ("int8", torch.int8,
+                                                       0.005)])
+def test_compress_blocks(kv_dtype: str, storage_dtype: torch.dtype,
+                         max_error: float) -> None:
+    # (num_blocks, 2, block_size, num_heads, head_size) like flash attention.
+    gpu_cache = torch.randn(8, 2, 4, 2, 8, dtype=torch.half)
+    gpu_cache[5] *= 100
+    compressed_cache = torch.zeros(4, 2, 4, 2, 8, dtype=storage_dtype)
+    scales = torch.ones(4, 1, 1, 1, 1)
+
+    compress_blocks(gpu_cache, compressed_cache, scales, 0,
+                    torch.tensor([[5, 0], [2, 3]]), kv_dtype)
+    restored = torch.zeros_like(gpu_cache)
+    decompress_blocks(compressed_cache, scales, restored, 0,
+                      torch.tensor([[0, 1], [3, 7]]), kv_dtype)
+    for src, dst in [(5, 1), (2, 7)]:
+        # Every block keeps its own scale.
+        error = (restored[dst].float() - gpu_cache[src].float()).abs().max()
+        assert error <= max_error * gpu_cache[src].float().abs().max()
+    assert torch.equal(restored[0], torch.zeros_like(restored[0]))
@@ -426,6 +426,18 @@ class CacheConfig:
         cache_dtype: Data type for kv cache storage.
         num_gpu_blocks_override: Number of GPU blocks to use. This overrides the
             profiled num_gpu_blocks if specified. Does nothing if None.
+        disk_swap_space: Size of the memory-mapped disk swap space per GPU
+            (in GiB), used to keep preserved sessions evicted from the CPU
+            swap space. Only supported on GPU.
+        disk_swap_path: Directory of the disk swap files. Defaults to the
+            system temporary directory.
+        session_kv_compression: Data type ("fp8" or "int8") that idle
+            preserved sessions are compressed to on GPU, instead of being
+            swapped out or freed. Disabled if None.
+        compressed_kv_space: Size of the GPU memory holding the compressed
+            preserved sessions per GPU (in GiB), taken from the KV cache.
+        session_persist_path: Directory that the preserved sessions are saved
+            to on shutdown and restored from on startup. Disabled if None.
     """
 
     def __init__(
@@ -438,10 +450,20 @@ class CacheConfig:
         sliding_window: Optional[int] = None,
         enable_prefix_caching: bool = False,
         cpu_offload_gb: float = 0,
+        disk_swap_space: float = 0,
+        disk_swap_path: Optional[str] = None,
+        session_kv_compression: Optional[str] = None,
+        compressed_kv_space: float = 0,
+        session_persist_path: Optional[str] = None,
     ) -> None:
         self.block_size = block_size
         self.gpu_memory_utilization = gpu_memory_utilization
         self.swap_space_bytes = swap_space * _GB
+        self.disk_swap_space_bytes = int(disk_swap_space * _GB)
+        self.disk_swap_path = disk_swap_path
+        self.session_kv_compression = session_kv_compression
+        self.compressed_kv_space_bytes = int(compressed_kv_space * _GB)
+        self.session_persist_path = session_persist_path
         self.num_gpu_blocks_override = num_gpu_blocks_override
         self.cache_dtype = cache_dtype
         self.sliding_window = sliding_window
@@ -454,6 +476,8 @@ class CacheConfig:
         # Will be set after profiling.
         self.num_gpu_blocks = None
         self.num_cpu_blocks = None
+        self.num_disk_blocks = 0
+        self.num_compressed_blocks = 0
 
     def metrics_info(self):
         # convert cache_config to dict(key: str, value: str) for prometheus
@@ -465,6 +489,25 @@ class CacheConfig:
             raise ValueError(
                 "GPU memory utilization must be less than 1.0. Got "
                 f"{self.gpu_memory_utilization}.")
+        if self.disk_swap_space_bytes < 0:
+            raise ValueError("Disk swap space must be non-negative. Got "
+                             f"{self.disk_swap_space_bytes / _GB} GiB.")
+        if self.session_kv_compression not in (None, "fp8", "int8"):
+            raise ValueError("Unknown session KV compression: "
+                             f"{self.session_kv_compression}. Supported "
+                             "values are 'fp8' and 'int8'.")
+        if self.session_kv_compression is not None:
+            if self.cache_dtype != "auto":
+                raise ValueError(
+                    "Session KV compression requires kv_cache_dtype 'auto', "
+                    f"got {self.cache_dtype}.")
+            if self.compressed_kv_space_bytes <= 0:
+                raise ValueError(
+                    "Session KV compression requires a positive compressed "
+                    "KV space.")
+        elif self.compressed_kv_space_bytes != 0:
+            raise ValueError(
+                "Compressed KV space requires session KV compression.")
 
     def _verify_cache_dtype(self) -> None:
         if self.cache_dtype == "auto":
@@ -778,6 +821,20 @@ class SchedulerConfig:
             swapping. However, when the sequence group has multiple sequences
             (e.g., beam search), recomputation is not currently supported. In
             such a case, we use swapping instead.
+        session_eviction_policy: The policy ranking the preserved sessions
+            that give up their KV cache blocks under memory pressure.
+        session_admission_horizon: If positive, new requests without a
+            session are delayed for up to this many seconds while the session
+            memory forecast expects returning sessions to need the free GPU
+            blocks within this horizon.
+        session_ttl: If set, sessions idle for longer than this many seconds
+            are freed, together with their preserved KV cache blocks.
+        max_preserved_blocks: If set, the maximum number of KV cache blocks,
+            on any device, preserved for idle sessions.
+        session_arrival_estimator: The estimator fitting when the next turn
+            of a session arrives and how much its prompt grows.
+        scheduling_policy: The policy ordering the waiting, running and
+            swapped requests.
     """
 
     def __init__(self,
@@ -789,7 +846,13 @@ class SchedulerConfig:
                  delay_factor: float = 0.0,
                  enable_chunked_prefill: bool = False,
                  embedding_mode: Optional[bool] = False,
-                 preemption_mode: Optional[str] = None) -> None:
+                 preemption_mode: Optional[str] = None,
+                 session_eviction_policy: str = "reuse_value",
+                 session_admission_horizon: float = 0.0,
+                 session_ttl: Optional[float] = None,
+                 max_preserved_blocks: Optional[int] = None,
+                 session_arrival_estimator: str = "ema",
+                 scheduling_policy: str = "fcfs") -> None:
         if max_num_batched_tokens is not None:
             self.max_num_batched_tokens = max_num_batched_tokens
         else:
@@ -818,6 +881,12 @@ class SchedulerConfig:
         self.chunked_prefill_enabled = enable_chunked_prefill
         self.embedding_mode = embedding_mode
         self.preemption_mode = preemption_mode
+        self.session_eviction_policy = session_eviction_policy
+        self.session_admission_horizon = session_admission_horizon
+        self.session_ttl = session_ttl
+        self.max_preserved_blocks = max_preserved_blocks
+        self.session_arrival_estimator = session_arrival_estimator
+        self.scheduling_policy = scheduling_policy
         self._verify_args()
 
     def _verify_args(self) -> None:
@@ -843,6 +912,22 @@ class SchedulerConfig:
                 f"({self.num_lookahead_slots}) must be greater than or "
                 "equal to 0.")
 
+        if self.session_admission_horizon < 0:
+            raise ValueError(
+                "session_admission_horizon "
+                f"({self.session_admission_horizon}) must be greater than or "
+                "equal to 0.")
+
+        if self.session_ttl is not None and self.session_ttl <= 0:
+            raise ValueError(
+                f"session_ttl ({self.session_ttl}) must be greater than 0.")
+
+        if (self.max_preserved_blocks is not None
+                and self.max_preserved_blocks < 0):
+            raise ValueError(
+                f"max_preserved_blocks ({self.max_preserved_blocks}) must be "
+                "greater than or equal to 0.")
+
 
 class DeviceConfig:
 
@@ -221,12 +221,17 @@ class BlockTable:
         self._blocks.reset()
 
     def free_(self, num_block:int) -> None:
-        """Frees the memory occupied by the blocks in the BlockTable.
+        """Frees the memory occupied by the last `num_block` blocks in the
+        BlockTable.
         """
+        if num_block <= 0:
+            return
         assert self._is_allocated
         for block in self.blocks[-num_block:]:
             self._allocator.free(block)
         self._blocks.reset_(num_block)
+        self._num_full_slots = min(self._num_full_slots,
+                                   len(self._blocks) * self._block_size)
 
     @property
     def physical_block_ids(self) -> List[int]:
@@ -365,6 +370,9 @@ class BlockTable:
         than the block size, since the last allocated block may be partially
         full.
         """
+        if not token_ids:
+            # E.g. a chunked prefill whose prompt fills its last block.
+            return []
         first_chunk_size = self._block_size - (self._num_full_slots %
                                                self._block_size)
         token_blocks = [token_ids[:first_chunk_size]]
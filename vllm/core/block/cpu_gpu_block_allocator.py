@@ -217,6 +217,12 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
     def get_num_total_blocks(self, device: Device) -> int:
         return self._allocators[device].get_num_total_blocks()
 
+    def get_device(self, absolute_id: int) -> Device:
+        """Returns the device of the block with the given absolute id."""
+        allocator = self._block_ids_to_allocator[absolute_id]
+        return (Device.GPU
+                if allocator is self._allocators[Device.GPU] else Device.CPU)
+
     def get_physical_block_id(self, device: Device, absolute_id: int) -> int:
         """Returns the zero-offset block id on certain device given the 
         absolute block id.
@@ -231,6 +237,12 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
         """
         return self._allocators[device].get_physical_block_id(absolute_id)
 
+    def get_refcount(self, absolute_id: int) -> int:
+        """Returns the number of references to the block with the given
+        absolute id, 0 if it is free."""
+        return self._block_ids_to_allocator[absolute_id].get_refcount(
+            absolute_id)
+
     def swap(self, blocks: List[Block], src_device: Device,
              dst_device: Device) -> Dict[int, int]:
         """Execute the swap for the given blocks from source_device
@@ -299,7 +311,7 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
         return self._allocators[device].mark_blocks_as_accessed(block_ids, now)
 
     def mark_blocks_as_computed(self, block_ids: List[int]) -> None:
-        """Mark blocks as accessed, only use for prefix caching."""
+        """Mark blocks as computed, only use for prefix caching."""
         # Prefix caching only supported on GPU.
         device = Device.GPU
         return self._allocators[device].mark_blocks_as_computed(block_ids)
@@ -133,6 +133,10 @@ class BlockAllocator(ABC):
     def get_physical_block_id(self, absolute_id: int) -> int:
         pass
 
+    @abstractmethod
+    def get_refcount(self, absolute_id: int) -> int:
+        pass
+
     @abstractmethod
     def swap_out(self, blocks: List[Block]) -> None:
         pass
@@ -266,10 +270,18 @@ class DeviceAwareBlockAllocator(ABC):
              dst_device: Device) -> Dict[int, int]:
         pass
 
+    @abstractmethod
+    def get_device(self, absolute_id: int) -> Device:
+        pass
+
     @abstractmethod
     def get_physical_block_id(self, device: Device, absolute_id: int) -> int:
         pass
 
+    @abstractmethod
+    def get_refcount(self, absolute_id: int) -> int:
+        pass
+
     @abstractmethod
     def allocate_or_get_null_block(self) -> Block:
         """
@@ -204,6 +204,11 @@ class NaiveBlockAllocator(BlockAllocator):
         """
         return sorted(self._all_block_indices).index(absolute_id)
 
+    def get_refcount(self, absolute_id: int) -> int:
+        """Returns the number of references to the block with the given
+        absolute id, 0 if it is free."""
+        return self._refcounter.get(absolute_id)
+
     @property
     def refcounter(self):
         return self._refcounter
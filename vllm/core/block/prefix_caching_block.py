@@ -400,6 +400,11 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         """
         return sorted(self.all_block_ids).index(absolute_id)
 
+    def get_refcount(self, absolute_id: int) -> int:
+        """Returns the number of references to the block with the given
+        absolute id, 0 if it is free."""
+        return self._refcounter.get(absolute_id)
+
     @property
     def all_block_ids(self) -> FrozenSet[int]:
         return self._hashless_allocator.all_block_ids
@@ -501,7 +506,16 @@ class PrefixCachingBlockAllocator(BlockAllocator):
                     "Mark block as accessed which is not belonged to GPU")
 
     def mark_blocks_as_computed(self, block_ids: List[int]) -> None:
-        raise NotImplementedError("Marking as computed is incremental")
+        """Mark in-use blocks as computed, so that other sequences can skip
+        their prefill before they are freed.
+
+        Blocks are otherwise only known to be computed once they are freed.
+        This is used for the full blocks retained by finished sequences,
+        whose KV is complete.
+        """
+        for block_id in block_ids:
+            if self._block_tracker[block_id].active:
+                self._block_tracker[block_id].computed = True
 
     def _track_block_id(self, block_id: Optional[BlockId],
                         computed: bool) -> None:
@@ -7,6 +7,8 @@ from typing import Dict, List, Optional
 from typing import Sequence as GenericSequence
 from typing import Set, Tuple
 
+import numpy as np
+
 from vllm.block import BlockTable, PhysicalTokenBlock
 from vllm.core.block.utils import check_no_caching_or_swa_for_blockmgr_encdec
 from vllm.core.evictor_v1 import EvictionPolicy, Evictor, make_evictor
@@ -186,6 +188,9 @@ class UncachedBlockAllocator(BlockAllocatorBase):
             raise ValueError("Out of memory! No free blocks are available.")
         block = self.free_blocks.pop()
         block.ref_count = 1
+        # Only the hash of a copied block is known, see `_swap_block_table`.
+        block.block_hash = -1 if block_hash is None else block_hash
+        block.num_hashed_tokens = num_hashed_tokens
         return block
 
     def free(self, block: PhysicalTokenBlock) -> None:
@@ -221,10 +226,14 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         watermark: float = 0.01,
         sliding_window: Optional[int] = None,
         enable_caching: bool = False,
+        num_disk_blocks: int = 0,
+        num_compressed_blocks: int = 0,
     ) -> None:
         self.block_size = block_size
         self.num_total_gpu_blocks = num_gpu_blocks
         self.num_total_cpu_blocks = num_cpu_blocks
+        self.num_total_disk_blocks = num_disk_blocks
+        self.num_total_compressed_blocks = num_compressed_blocks
 
         if enable_caching and sliding_window is not None:
             raise NotImplementedError(
@@ -254,24 +263,45 @@ class BlockSpaceManagerV1(BlockSpaceManager):
                 Device.GPU, block_size, num_gpu_blocks)
             self.cpu_allocator = UncachedBlockAllocator(
                 Device.CPU, block_size, num_cpu_blocks)
+        # Only preserved sessions are moved to disk, and never shared there.
+        self.disk_allocator: BlockAllocatorBase = UncachedBlockAllocator(
+            Device.DISK, block_size, num_disk_blocks)
+        # Nor are they shared once compressed on GPU.
+        self.compressed_allocator: BlockAllocatorBase = UncachedBlockAllocator(
+            Device.COMPRESSED, block_size, num_compressed_blocks)
         # Mapping: seq_id -> BlockTable.
         self.block_tables: Dict[int, BlockTable] = {}
         # Mapping: req_id -> BlockTable
         # Note that each SequenceGroup has a unique
         # request ID
         self.cross_block_tables: Dict[str, BlockTable] = {}
+        # Mapping: seq_id -> token ids whose KV is held by the block table of
+        # a finished sequence that is preserved for its session's next turn.
+        self.retained_token_ids: Dict[int, np.ndarray] = {}
+        # Mapping: block hash -> GPU block retained for a session, which the
+        # identical full blocks of other sessions share. Without prefix
+        # caching, the hash is only set by `retain` and may be stale.
+        self.retained_blocks: Dict[int, PhysicalTokenBlock] = {}
 
     def _get_seq_num_required_blocks(self, seq: Sequence) -> int:
         return 0 if seq is None else seq.n_blocks
 
-    def can_allocate(self, seq_group: SequenceGroup) -> AllocStatus:
+    def get_num_required_gpu_blocks(self, seq_group: SequenceGroup) -> int:
+        """Get the number of free GPU blocks the allocation of a waiting
+        sequence group takes."""
         # FIXME(woosuk): Here we assume that all sequences in the group share
         # the same prompt. This may not be true for preempted sequences.
 
-        check_no_caching_or_swa_for_blockmgr_encdec(self, seq_group)
-
+        seq = seq_group.get_seqs(status=SequenceStatus.WAITING)[0]
+        # Blocks retained on GPU for the session are reused or freed by the
+        # allocation; those demoted to CPU have to be swapped back in.
+        num_retained_gpu_blocks = 0
+        if not self.is_seq_id_swapped(seq_group.computed_block_seq):
+            num_retained_gpu_blocks = self._get_num_retained_gpu_blocks(
+                seq_group.computed_block_seq, seq_group.session_reuse,
+                seq.n_blocks)
         self_num_required_blocks = self._get_seq_num_required_blocks(
-            seq_group.get_seqs(status=SequenceStatus.WAITING)[0]) - len(self.block_tables.get(seq_group.computed_block_seq, []))
+            seq) - num_retained_gpu_blocks
         cross_num_required_blocks = self._get_seq_num_required_blocks(
             seq_group.get_encoder_seq())
         num_required_blocks = self_num_required_blocks + \
@@ -281,6 +311,30 @@ class BlockSpaceManagerV1(BlockSpaceManager):
 
             num_required_blocks = min(num_required_blocks,
                                       self.block_sliding_window)
+        return num_required_blocks
+
+    def _get_num_retained_gpu_blocks(self, seq_id: Optional[int],
+                                     session_reuse: int,
+                                     num_prompt_blocks: int) -> int:
+        """Get the number of GPU blocks retained for `seq_id` that the
+        allocation of its next turn either reuses or returns to the pool.
+
+        The blocks past the reused prefix that are shared with other
+        sessions, by deduplication or by a fork, are only dereferenced.
+        """
+        block_table = self.block_tables.get(seq_id, [])
+        num_reused_blocks = min(len(block_table),
+                                max(0, session_reuse) // self.block_size,
+                                num_prompt_blocks)
+        num_freed_blocks = sum(
+            1 for block in set(block_table[num_reused_blocks:])
+            if block.ref_count == 1)
+        return num_reused_blocks + num_freed_blocks
+
+    def can_allocate(self, seq_group: SequenceGroup) -> AllocStatus:
+        check_no_caching_or_swa_for_blockmgr_encdec(self, seq_group)
+
+        num_required_blocks = self.get_num_required_gpu_blocks(seq_group)
         num_free_gpu_blocks = self.gpu_allocator.get_num_free_blocks()
 
         # Use watermark to avoid frequent cache eviction.
@@ -304,6 +358,7 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         
         if (len(block_table) > 0):
             del self.block_tables[computed_block_seq]
+        self.retained_token_ids.pop(computed_block_seq, None)
 
         # print(f"Session reuse:{session_reuse}, Sequence block:{seq.n_blocks}, Block table len:{len(block_table)}")
         if (session_reuse == -1): session_reuse = 0
@@ -643,12 +698,10 @@ class BlockSpaceManagerV1(BlockSpaceManager):
                           if self.block_sliding_window is not None else
                           block_table)
         for block in set(blocks_to_free):
-            if block.device == Device.GPU:
-                self.gpu_allocator.free(block)
-            else:
-                self.cpu_allocator.free(block)
+            self._get_allocator(block.device).free(block)
 
     def free(self, seq: Sequence) -> None:
+        self.retained_token_ids.pop(seq.seq_id, None)
         if seq.seq_id not in self.block_tables:
             # Already freed or haven't been scheduled yet.
             return
@@ -657,6 +710,7 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         del self.block_tables[seq.seq_id]
 
     def free_seq_id(self, seq_id: int) -> None:
+        self.retained_token_ids.pop(seq_id, None)
         if seq_id not in self.block_tables:
             # Already freed or haven't been scheduled yet.
             return
@@ -664,6 +718,269 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         self._free_block_table(block_table)
         del self.block_tables[seq_id]
 
+    def fork_seq_id(self, src_seq_id: int, dst_seq_id: int) -> None:
+        """Retain `dst_seq_id` in the blocks retained for `src_seq_id`,
+        sharing them by reference count.
+
+        The shared blocks are never written: the next turn of either session
+        only reuses their full blocks, and its first write to a shared last
+        block goes through the copy-on-write of `append_slots`.
+        """
+        src_block_table = self.block_tables[src_seq_id]
+        self.block_tables[dst_seq_id] = src_block_table.copy()
+        for block in set(src_block_table):
+            block.ref_count += 1
+        if src_seq_id in self.retained_token_ids:
+            self.retained_token_ids[dst_seq_id] = self.retained_token_ids[
+                src_seq_id]
+
+    def _get_allocator(self, device: Device) -> BlockAllocatorBase:
+        if device == Device.GPU:
+            return self.gpu_allocator
+        if device == Device.CPU:
+            return self.cpu_allocator
+        if device == Device.COMPRESSED:
+            return self.compressed_allocator
+        return self.disk_allocator
+
+    def get_seq_id_device(self, seq_id: int) -> Optional[Device]:
+        """Get the device holding the blocks retained for `seq_id`.
+
+        The blocks of a retained sequence are always moved together, so they
+        live on a single device.
+        """
+        block_table = self.block_tables.get(seq_id)
+        if not block_table:
+            return None
+        return block_table[0].device
+
+    def is_seq_id_swapped(self, seq_id: int) -> bool:
+        """Whether the blocks retained for `seq_id` were moved out of the GPU
+        cache, possibly into the compressed GPU cache."""
+        return self.get_seq_id_device(seq_id) in (Device.CPU, Device.DISK,
+                                                  Device.COMPRESSED)
+
+    def get_num_seq_id_blocks(self, seq_id: int) -> int:
+        return len(set(self.block_tables.get(seq_id, [])))
+
+    def get_num_freeable_seq_id_blocks(self, seq_id: int) -> int:
+        """Get the number of blocks retained for `seq_id` that releasing it
+        returns to the pool of its device, i.e. those no other session
+        shares."""
+        return sum(1 for block in set(self.block_tables.get(seq_id, []))
+                   if block.ref_count == 1)
+
+    def can_swap_out_seq_id(self, seq_id: int) -> bool:
+        return (self.get_num_seq_id_blocks(seq_id) <=
+                self.cpu_allocator.get_num_free_blocks())
+
+    def can_disk_out_seq_id(self, seq_id: int) -> bool:
+        return (self.get_num_seq_id_blocks(seq_id) <=
+                self.disk_allocator.get_num_free_blocks())
+
+    def can_compress_seq_id(self, seq_id: int) -> bool:
+        return (self.get_num_seq_id_blocks(seq_id) <=
+                self.compressed_allocator.get_num_free_blocks())
+
+    def swap_out_seq_id(self, seq_id: int) -> List[Tuple[int, int]]:
+        """Demote the blocks retained for `seq_id` from GPU to CPU.
+
+        Returns the GPU -> CPU block number mapping to be applied by the cache
+        engine.
+        """
+        # GPU block -> CPU block.
+        mapping: Dict[PhysicalTokenBlock, PhysicalTokenBlock] = {}
+        self.block_tables[seq_id] = \
+            self._swap_block_table(self.block_tables[seq_id],
+                                   self.gpu_allocator,
+                                   self.cpu_allocator,
+                                   mapping)
+        return [(gpu_block.block_number, cpu_block.block_number)
+                for gpu_block, cpu_block in mapping.items()]
+
+    def disk_out_seq_id(self, seq_id: int) -> List[Tuple[int, int]]:
+        """Demote the blocks retained for `seq_id` from CPU to disk.
+
+        Returns the CPU -> disk block number mapping to be applied by the
+        cache engine.
+        """
+        # CPU block -> disk block.
+        mapping: Dict[PhysicalTokenBlock, PhysicalTokenBlock] = {}
+        self.block_tables[seq_id] = \
+            self._swap_block_table(self.block_tables[seq_id],
+                                   self.cpu_allocator,
+                                   self.disk_allocator,
+                                   mapping)
+        return [(cpu_block.block_number, disk_block.block_number)
+                for cpu_block, disk_block in mapping.items()]
+
+    def compress_seq_id(self, seq_id: int) -> List[Tuple[int, int]]:
+        """Compress the blocks retained for `seq_id` from the GPU cache into
+        the compressed GPU cache.
+
+        Returns the GPU -> compressed block number mapping to be applied by
+        the cache engine.
+        """
+        # GPU block -> compressed block.
+        mapping: Dict[PhysicalTokenBlock, PhysicalTokenBlock] = {}
+        self.block_tables[seq_id] = \
+            self._swap_block_table(self.block_tables[seq_id],
+                                   self.gpu_allocator,
+                                   self.compressed_allocator,
+                                   mapping)
+        return [(gpu_block.block_number, compressed_block.block_number)
+                for gpu_block, compressed_block in mapping.items()]
+
+    def swap_in_seq_id(self, seq_id: int,
+                       num_blocks: int) -> List[Tuple[int, int]]:
+        """Bring the first `num_blocks` blocks retained for `seq_id` back to
+        GPU, from either CPU, disk or the compressed cache. The remaining
+        blocks would be dropped by the next allocation, so they are freed
+        without being copied.
+
+        Returns the CPU (disk, compressed) -> GPU block number mapping to be
+        applied by the cache engine.
+        """
+        block_table = self.block_tables[seq_id]
+        src_allocator = self._get_allocator(self.get_seq_id_device(seq_id))
+        self._free_block_table(block_table[num_blocks:])
+        # CPU (disk, compressed) block -> GPU block.
+        mapping: Dict[PhysicalTokenBlock, PhysicalTokenBlock] = {}
+        self.block_tables[seq_id] = \
+            self._swap_block_table(block_table[:num_blocks],
+                                   src_allocator,
+                                   self.gpu_allocator,
+                                   mapping)
+        return [(src_block.block_number, gpu_block.block_number)
+                for src_block, gpu_block in mapping.items()]
+
+    def get_seq_id_gpu_block_numbers(self, seq_id: int,
+                                     num_blocks: int) -> Optional[List[int]]:
+        """Get the GPU block numbers of the first `num_blocks` blocks
+        retained for `seq_id`, or None if they are not on GPU."""
+        if self.get_seq_id_device(seq_id) != Device.GPU:
+            return None
+        return [block.block_number
+                for block in self.block_tables[seq_id][:num_blocks]]
+
+    def get_seq_id_block_numbers(self, seq_id: int) -> List[int]:
+        """Get the block numbers of the blocks retained for `seq_id`, on the
+        device given by `get_seq_id_device`."""
+        return [block.block_number for block in self.block_tables[seq_id]]
+
+    def can_migrate_in(self, num_blocks: int) -> bool:
+        # The prefix caching allocator needs the block hashes, which are not
+        # known for blocks copied from another block manager.
+        return (not self.enable_caching and num_blocks > 0
+                and self.gpu_allocator.get_num_free_blocks() - num_blocks >=
+                self.watermark_blocks)
+
+    def migrate_in_seq_id(self, seq_id: int, src_block_numbers: List[int],
+                          token_ids: np.ndarray) -> List[Tuple[int, int]]:
+        """Retain `seq_id` in new GPU blocks that receive a copy of the
+        blocks of another block manager.
+
+        Returns the source -> GPU block number mapping to be applied by the
+        cache engine.
+        """
+        mapping: Dict[int, PhysicalTokenBlock] = {}
+        block_table: BlockTable = []
+        for src_block_number in src_block_numbers:
+            if src_block_number in mapping:
+                block = mapping[src_block_number]
+                block.ref_count += 1
+            else:
+                block = self.gpu_allocator.allocate()
+                mapping[src_block_number] = block
+            block_table.append(block)
+        self.block_tables[seq_id] = block_table
+        self.retained_token_ids[seq_id] = token_ids[:len(block_table) *
+                                                    self.block_size]
+        return [(src_block_number, block.block_number)
+                for src_block_number, block in mapping.items()]
+
+    def retain(self, seq: Sequence) -> None:
+        """Remember the tokens covered by the block table of a finished
+        sequence, so that the next turn of its session can be matched against
+        them."""
+        block_table = self.block_tables.get(seq.seq_id)
+        if block_table is None:
+            return
+        # The KV of the last sampled token is never computed.
+        num_tokens = min(
+            len(block_table) * self.block_size,
+            seq.get_len() - 1)
+        self.retained_token_ids[seq.seq_id] = np.asarray(
+            seq.get_token_ids()[:num_tokens], dtype=np.int64)
+        self._share_retained_blocks(seq, block_table,
+                                    num_tokens // self.block_size)
+
+    def _share_retained_blocks(self, seq: Sequence, block_table: BlockTable,
+                               num_full_blocks: int) -> None:
+        """Replace the first `num_full_blocks` blocks of `block_table` with
+        the identical GPU blocks already retained for other sessions, e.g.
+        those of a common system prompt, and index the others.
+
+        With prefix caching, the allocator already shares identical blocks.
+        """
+        if self.enable_caching or self.block_sliding_window is not None:
+            return
+        for logical_idx in range(num_full_blocks):
+            block = block_table[logical_idx]
+            num_hashed_tokens = seq.num_hashed_tokens_of_block(logical_idx)
+            if (block.block_hash == -1
+                    or block.num_hashed_tokens != num_hashed_tokens):
+                # Blocks reused from the previous turn are already hashed.
+                block.block_hash = seq.hash_of_block(logical_idx)
+                block.num_hashed_tokens = num_hashed_tokens
+            shared_block = self._get_retained_block(block.block_hash)
+            if shared_block is None:
+                self.retained_blocks[block.block_hash] = block
+            elif shared_block is not block:
+                shared_block.ref_count += 1
+                self.gpu_allocator.free(block)
+                block_table[logical_idx] = shared_block
+        if len(self.retained_blocks) > 2 * self.num_total_gpu_blocks:
+            # Drop the blocks that were freed since they were indexed.
+            self.retained_blocks = {
+                block_hash: block
+                for block_hash, block in self.retained_blocks.items()
+                if self._get_retained_block(block_hash) is not None
+            }
+
+    def _get_retained_block(self,
+                            block_hash: int) -> Optional[PhysicalTokenBlock]:
+        block = self.retained_blocks.get(block_hash)
+        if (block is None or block.ref_count == 0
+                or block.block_hash != block_hash
+                or block.device != Device.GPU):
+            return None
+        return block
+
+    def get_retained_token_ids(self, seq_id: int) -> Optional[np.ndarray]:
+        return self.retained_token_ids.get(seq_id)
+
+    def trim_seq_id(self, seq_id: int, num_tokens: int) -> int:
+        """Free the blocks retained for `seq_id` past the full blocks of its
+        first `num_tokens` tokens.
+
+        Returns the number of retained tokens left.
+        """
+        block_table = self.block_tables.get(seq_id)
+        token_ids = self.retained_token_ids.get(seq_id)
+        if block_table is None or token_ids is None:
+            return 0
+        if (num_tokens >= len(token_ids)
+                or self.block_sliding_window is not None):
+            return len(token_ids)
+        num_blocks = num_tokens // self.block_size
+        while len(block_table) > num_blocks:
+            block = block_table.pop()
+            self._get_allocator(block.device).free(block)
+        token_ids = token_ids[:num_blocks * self.block_size]
+        self.retained_token_ids[seq_id] = token_ids
+        return len(token_ids)
+
     def free_last_blocks(self, seq: Sequence, num_blocks: int) -> None:
         if seq.seq_id not in self.block_tables:
             # Already freed or hasn't been scheduled yet.
@@ -672,10 +989,7 @@ class BlockSpaceManagerV1(BlockSpaceManager):
             # if not self.block_tables[seq.seq_id]:
             #     break
             block = self.block_tables[seq.seq_id].pop()
-            if block.device == Device.GPU:
-                self.gpu_allocator.free(block)
-            else:
-                self.cpu_allocator.free(block)
+            self._get_allocator(block.device).free(block)
         
     def free_cross(self, seq_group: SequenceGroup) -> None:
         if seq_group.request_id not in self.cross_block_tables:
@@ -690,6 +1004,7 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         for block_table in self.block_tables.values():
             self._free_block_table(block_table)
         self.block_tables.clear()
+        self.retained_token_ids.clear()
         # Free cross-attention block tables
         for block_table in self.cross_block_tables.values():
             self._free_block_table(block_table)
@@ -709,6 +1024,12 @@ class BlockSpaceManagerV1(BlockSpaceManager):
     def get_num_free_cpu_blocks(self) -> int:
         return self.cpu_allocator.get_num_free_blocks()
 
+    def get_num_free_disk_blocks(self) -> int:
+        return self.disk_allocator.get_num_free_blocks()
+
+    def get_num_free_compressed_blocks(self) -> int:
+        return self.compressed_allocator.get_num_free_blocks()
+
     def access_all_blocks_in_seq(
         self,
         seq: Sequence,
@@ -4,6 +4,8 @@ from typing import Dict, List, Optional
 from typing import Sequence as GenericSequence
 from typing import Tuple
 
+import numpy as np
+
 from vllm.core.block.block_table import BlockTable
 from vllm.core.block.cpu_gpu_block_allocator import CpuGpuBlockAllocator
 from vllm.core.block.interfaces import Block
@@ -67,10 +69,16 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         watermark: float = 0.01,
         sliding_window: Optional[int] = None,
         enable_caching: bool = False,
+        num_disk_blocks: int = 0,
+        num_compressed_blocks: int = 0,
     ) -> None:
         self.block_size = block_size
         self.num_total_gpu_blocks = num_gpu_blocks
         self.num_total_cpu_blocks = num_cpu_blocks
+        # The disk tier and the compressed cache of preserved sessions are
+        # only managed by BlockSpaceManagerV1.
+        self.num_total_disk_blocks = num_disk_blocks
+        self.num_total_compressed_blocks = num_compressed_blocks
 
         self.sliding_window = sliding_window
         # max_block_sliding_window is the max number of blocks that need to be
@@ -107,12 +115,15 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         self._last_access_blocks_tracker = LastAccessBlocksTracker(
             self.block_allocator)
 
-    def can_allocate(self, seq_group: SequenceGroup) -> AllocStatus:
+        # Mapping: seq_id -> token ids whose KV is held by the block table of
+        # a finished sequence that is preserved for its session's next turn.
+        self.retained_token_ids: Dict[SeqId, np.ndarray] = {}
+
+    def get_num_required_gpu_blocks(self, seq_group: SequenceGroup) -> int:
+        """Get the number of free GPU blocks the allocation of a waiting
+        sequence group takes."""
         # FIXME(woosuk): Here we assume that all sequences in the group share
         # the same prompt. This may not be true for preempted sequences.
-
-        check_no_caching_or_swa_for_blockmgr_encdec(self, seq_group)
-
         seq = seq_group.get_seqs(status=SequenceStatus.WAITING)[0]
         num_required_blocks = BlockTable.get_num_required_blocks(
             seq.get_token_ids(),
@@ -129,6 +140,35 @@ class BlockSpaceManagerV2(BlockSpaceManager):
             num_required_blocks = min(num_required_blocks,
                                       self.max_block_sliding_window)
 
+        # Blocks retained on GPU for the session are reused or freed by the
+        # allocation; those demoted to CPU have to be swapped back in.
+        if (self.get_seq_id_device(seq_group.computed_block_seq) == Device.GPU):
+            num_required_blocks -= self._get_num_retained_gpu_blocks(
+                seq_group.computed_block_seq, seq_group.session_reuse,
+                seq.get_len())
+        return num_required_blocks
+
+    def _get_num_retained_gpu_blocks(self, seq_id: int, session_reuse: int,
+                                     num_prompt_tokens: int) -> int:
+        """Get the number of GPU blocks retained for `seq_id` that the
+        allocation of its next turn either reuses or returns to the pool.
+
+        The blocks past the reused prefix that are shared with other
+        sequences, by a fork or by the prefix cache, are only dereferenced.
+        """
+        block_ids = self.block_tables[seq_id].physical_block_ids
+        num_reused_blocks = min(len(block_ids),
+                                max(0, session_reuse) // self.block_size,
+                                num_prompt_tokens // self.block_size)
+        num_freed_blocks = sum(
+            1 for block_id in set(block_ids[num_reused_blocks:])
+            if self.block_allocator.get_refcount(block_id) == 1)
+        return num_reused_blocks + num_freed_blocks
+
+    def can_allocate(self, seq_group: SequenceGroup) -> AllocStatus:
+        check_no_caching_or_swa_for_blockmgr_encdec(self, seq_group)
+
+        num_required_blocks = self.get_num_required_gpu_blocks(seq_group)
         num_free_gpu_blocks = self.block_allocator.get_num_free_blocks(
             device=Device.GPU)
 
@@ -141,7 +181,27 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         else:
             return AllocStatus.LATER
 
-    def _allocate_sequence(self, seq: Sequence) -> BlockTable:
+    def _allocate_sequence(self,
+                           seq: Sequence,
+                           retained_block_table: Optional[BlockTable] = None,
+                           num_reused_blocks: int = 0) -> BlockTable:
+        if num_reused_blocks > 0:
+            assert retained_block_table is not None
+            # Share the reused prefix of the retained blocks, and only
+            # allocate blocks for the rest of the prompt.
+            block_table = BlockTable(
+                block_size=self.block_size,
+                block_allocator=self.block_allocator,
+                _blocks=self.block_allocator.fork(
+                    retained_block_table.blocks[num_reused_blocks - 1]),
+                max_block_sliding_window=self.max_block_sliding_window,
+            )
+            num_reused_tokens = num_reused_blocks * self.block_size
+            block_table.append_token_ids(
+                seq.get_token_ids()[num_reused_tokens:],
+                num_computed_slots=num_reused_tokens)
+            return block_table
+
         block_table = BlockTable(
             block_size=self.block_size,
             block_allocator=self.block_allocator,
@@ -161,13 +221,41 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         # NOTE: Here we assume that all sequences in the group have the same
         # prompt.
         seq = waiting_seqs[0]
-        block_table: BlockTable = self._allocate_sequence(seq)
+        computed_block_seq = seq_group.computed_block_seq
+        retained_block_table = None
+        num_reused_blocks = 0
+        if self.get_seq_id_device(computed_block_seq) == Device.GPU:
+            retained_block_table = self.block_tables[computed_block_seq]
+            num_reused_blocks = min(
+                len(retained_block_table.blocks),
+                max(0, seq_group.session_reuse) // self.block_size,
+                seq.get_len() // self.block_size)
+            # Free the blocks that are not reused before allocating the new
+            # ones.
+            retained_block_table.free_(
+                len(retained_block_table.blocks) - num_reused_blocks)
+
+        block_table: BlockTable = self._allocate_sequence(
+            seq, retained_block_table, num_reused_blocks)
         self.block_tables[seq.seq_id] = block_table
+        if computed_block_seq is not None:
+            self.free_seq_id(computed_block_seq)
 
         # Track seq
         self._computed_blocks_tracker.add_seq(seq.seq_id)
         self._last_access_blocks_tracker.add_seq(seq.seq_id)
 
+        if computed_block_seq is not None:
+            computed_block_nums = (
+                block_table.physical_block_ids[:num_reused_blocks])
+            if self.enable_caching:
+                # The prompt may share more blocks with other requests than
+                # with the previous turn of its session.
+                cached_block_nums = self.get_common_computed_block_ids([seq])
+                if len(cached_block_nums) > len(computed_block_nums):
+                    computed_block_nums = cached_block_nums
+            seq_group.computed_block_nums = list(computed_block_nums)
+
         # Assign the block table for each sequence.
         for seq in waiting_seqs[1:]:
             self.block_tables[seq.seq_id] = block_table.fork()
@@ -257,24 +345,200 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         return new_cows
 
     def free(self, seq: Sequence) -> None:
-        seq_id = seq.seq_id
+        self.free_seq_id(seq.seq_id)
 
+    def free_seq_id(self, seq_id: int) -> None:
+        self.retained_token_ids.pop(seq_id, None)
         if seq_id not in self.block_tables:
             # Already freed or haven't been scheduled yet.
             return
 
-        # Update seq block ids with the latest access time
-        self._last_access_blocks_tracker.update_seq_blocks_last_access(
-            seq_id, self.block_tables[seq.seq_id].physical_block_ids)
+        block_table = self.block_tables[seq_id]
+        if self.get_seq_id_device(seq_id) == Device.GPU:
+            # Update seq block ids with the latest access time
+            self._last_access_blocks_tracker.update_seq_blocks_last_access(
+                seq_id, block_table.physical_block_ids)
 
         # Untrack seq
         self._last_access_blocks_tracker.remove_seq(seq_id)
         self._computed_blocks_tracker.remove_seq(seq_id)
 
         # Free table/blocks
-        self.block_tables[seq_id].free()
+        if block_table.blocks:
+            block_table.free()
         del self.block_tables[seq_id]
 
+    def fork_seq_id(self, src_seq_id: int, dst_seq_id: int) -> None:
+        """Retain `dst_seq_id` in the blocks retained for `src_seq_id`,
+        sharing them by reference count. A later write to a shared block is
+        copied on write by the block allocator."""
+        self.block_tables[dst_seq_id] = self.block_tables[src_seq_id].fork()
+        self._computed_blocks_tracker.add_seq(dst_seq_id)
+        self._last_access_blocks_tracker.add_seq(dst_seq_id)
+        if src_seq_id in self.retained_token_ids:
+            self.retained_token_ids[dst_seq_id] = self.retained_token_ids[
+                src_seq_id]
+
+    def retain(self, seq: Sequence) -> None:
+        """Remember the tokens covered by the block table of a finished
+        sequence, so that the next turn of its session can be matched against
+        them.
+
+        With prefix caching, the full blocks are also marked as computed, so
+        that other requests sharing their prefix skip it while the session is
+        preserved.
+        """
+        block_table = self.block_tables.get(seq.seq_id)
+        if block_table is None or not block_table.blocks:
+            return
+        # The KV of the last sampled token is never computed.
+        num_tokens = min(block_table.num_full_slots, seq.get_len() - 1)
+        self.retained_token_ids[seq.seq_id] = np.asarray(
+            seq.get_token_ids()[:num_tokens], dtype=np.int64)
+        if self.enable_caching:
+            self.block_allocator.mark_blocks_as_computed(
+                block_table.physical_block_ids[:num_tokens //
+                                               self.block_size])
+
+    def get_retained_token_ids(self, seq_id: int) -> Optional[np.ndarray]:
+        return self.retained_token_ids.get(seq_id)
+
+    def trim_seq_id(self, seq_id: int, num_tokens: int) -> int:
+        """Free the blocks retained for `seq_id` past the full blocks of its
+        first `num_tokens` tokens.
+
+        Returns the number of retained tokens left.
+        """
+        block_table = self.block_tables.get(seq_id)
+        token_ids = self.retained_token_ids.get(seq_id)
+        if block_table is None or token_ids is None:
+            return 0
+        if (num_tokens >= len(token_ids)
+                or self.max_block_sliding_window is not None):
+            return len(token_ids)
+        num_blocks = num_tokens // self.block_size
+        block_table.free_(len(block_table.blocks) - num_blocks)
+        token_ids = token_ids[:num_blocks * self.block_size]
+        self.retained_token_ids[seq_id] = token_ids
+        return len(token_ids)
+
+    def get_seq_id_device(self, seq_id: Optional[int]) -> Optional[Device]:
+        """Get the device holding the blocks retained for `seq_id`.
+
+        The blocks of a retained sequence are always moved together, so they
+        live on a single device.
+        """
+        block_table = self.block_tables.get(seq_id)  # type: ignore
+        if block_table is None or not block_table.blocks:
+            return None
+        return self.block_allocator.get_device(
+            block_table.physical_block_ids[0])
+
+    def is_seq_id_swapped(self, seq_id: int) -> bool:
+        """Whether the blocks retained for `seq_id` were moved out of GPU."""
+        return self.get_seq_id_device(seq_id) == Device.CPU
+
+    def get_num_seq_id_blocks(self, seq_id: int) -> int:
+        block_table = self.block_tables.get(seq_id)
+        if block_table is None:
+            return 0
+        return len(set(block_table.physical_block_ids))
+
+    def get_num_freeable_seq_id_blocks(self, seq_id: int) -> int:
+        """Get the number of blocks retained for `seq_id` that releasing it
+        returns to the pool of its device, i.e. those no other sequence
+        shares."""
+        block_table = self.block_tables.get(seq_id)
+        if block_table is None:
+            return 0
+        return sum(1 for block_id in set(block_table.physical_block_ids)
+                   if self.block_allocator.get_refcount(block_id) == 1)
+
+    def can_swap_out_seq_id(self, seq_id: int) -> bool:
+        return (self.get_num_seq_id_blocks(seq_id) <=
+                self.block_allocator.get_num_free_blocks(Device.CPU))
+
+    def swap_out_seq_id(self, seq_id: int) -> List[Tuple[int, int]]:
+        """Demote the blocks retained for `seq_id` from GPU to CPU.
+
+        Returns the GPU -> CPU physical block id mapping to be applied by the
+        cache engine.
+        """
+        return self._swap_block_table(self.block_tables[seq_id], Device.GPU,
+                                      Device.CPU)
+
+    def swap_in_seq_id(self, seq_id: int,
+                       num_blocks: int) -> List[Tuple[int, int]]:
+        """Bring the first `num_blocks` blocks retained for `seq_id` back to
+        GPU. The remaining blocks would be dropped by the next allocation, so
+        they are freed without being copied.
+
+        Returns the CPU -> GPU physical block id mapping to be applied by the
+        cache engine.
+        """
+        block_table = self.block_tables[seq_id]
+        block_table.free_(len(block_table.blocks) - num_blocks)
+        return self._swap_block_table(block_table, Device.CPU, Device.GPU)
+
+    def _swap_block_table(self, block_table: BlockTable, src_device: Device,
+                          dst_device: Device) -> List[Tuple[int, int]]:
+        blocks = block_table.blocks
+        if len(blocks) == 0:
+            return []
+        swap_mapping = self.block_allocator.swap(blocks=blocks,
+                                                 src_device=src_device,
+                                                 dst_device=dst_device)
+        # Refresh the block ids of the table (post-swap)
+        block_table.update(blocks)
+        return [(self.block_allocator.get_physical_block_id(
+            src_device, src_block_id),
+                 self.block_allocator.get_physical_block_id(
+                     dst_device, dst_block_id))
+                for src_block_id, dst_block_id in swap_mapping.items()]
+
+    def get_seq_id_gpu_block_numbers(self, seq_id: int,
+                                     num_blocks: int) -> Optional[List[int]]:
+        """Get the GPU block numbers of the first `num_blocks` blocks
+        retained for `seq_id`, or None if they are not on GPU."""
+        if self.get_seq_id_device(seq_id) != Device.GPU:
+            return None
+        return self.block_tables[seq_id].physical_block_ids[:num_blocks]
+
+    def get_seq_id_block_numbers(self, seq_id: int) -> List[int]:
+        """Get the physical block ids of the blocks retained for `seq_id`,
+        on the device given by `get_seq_id_device`."""
+        return self.block_tables[seq_id].physical_block_ids
+
+    def can_migrate_in(self, num_blocks: int) -> bool:
+        # Copied blocks would be cached under hashes whose KV is only written
+        # by the next step, so migration is disabled with prefix caching.
+        return (not self.enable_caching and num_blocks > 0
+                and self.block_allocator.get_num_free_blocks(Device.GPU) -
+                num_blocks >= self.watermark_blocks)
+
+    def migrate_in_seq_id(self, seq_id: int, src_block_numbers: List[int],
+                          token_ids: np.ndarray) -> List[Tuple[int, int]]:
+        """Retain `seq_id` in new GPU blocks that receive a copy of the
+        blocks of another block manager.
+
+        Returns the source -> GPU block number mapping to be applied by the
+        cache engine.
+        """
+        token_ids = token_ids[:len(src_block_numbers) * self.block_size]
+        block_table = BlockTable(
+            block_size=self.block_size,
+            block_allocator=self.block_allocator,
+            max_block_sliding_window=self.max_block_sliding_window,
+        )
+        block_table.allocate(token_ids.tolist())
+        self.block_tables[seq_id] = block_table
+        self.retained_token_ids[seq_id] = token_ids
+
+        # Track seq
+        self._computed_blocks_tracker.add_seq(seq_id)
+        self._last_access_blocks_tracker.add_seq(seq_id)
+        return list(zip(src_block_numbers, block_table.physical_block_ids))
+
     def free_last_blocks(self, seq: Sequence, num_blocks: int) -> None:
         seq_id = seq.seq_id
 
@@ -478,6 +742,12 @@ class BlockSpaceManagerV2(BlockSpaceManager):
     def get_num_free_cpu_blocks(self) -> int:
         return self.block_allocator.get_num_free_blocks(Device.CPU)
 
+    def get_num_free_disk_blocks(self) -> int:
+        return 0
+
+    def get_num_free_compressed_blocks(self) -> int:
+        return 0
+
     def _can_swap(self,
                   seq_group: SequenceGroup,
                   device: Device,
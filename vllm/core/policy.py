@@ -1,10 +1,13 @@
+import math
 from collections import deque
-from typing import Deque
+from typing import Deque, Tuple
 
 from vllm.sequence import SequenceGroup
 
 
 class Policy:
+    """Ranks sequence groups. The group with the highest priority is
+    scheduled first and preempted last."""
 
     def get_priority(
         self,
@@ -13,6 +16,15 @@ class Policy:
     ) -> float:
         raise NotImplementedError
 
+    def get_sort_key(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple[float, float]:
+        # Ties are broken in arrival order.
+        return (self.get_priority(now, seq_group),
+                now - seq_group.metrics.arrival_time)
+
     def sort_by_priority(
         self,
         now: float,
@@ -21,10 +33,14 @@ class Policy:
         return deque(
             sorted(
                 seq_groups,
-                key=lambda seq_group: self.get_priority(now, seq_group),
+                key=lambda seq_group: self.get_sort_key(now, seq_group),
                 reverse=True,
             ))
 
+    def observe_finished(self, seq_group: SequenceGroup) -> None:
+        """Called with every sequence group once it has finished."""
+        pass
+
 
 class FCFS(Policy):
 
@@ -36,9 +52,100 @@ class FCFS(Policy):
         return now - seq_group.metrics.arrival_time
 
 
+class StrictPriority(Policy):
+    """Schedules the requests with the highest `priority` first, in arrival
+    order among equal priorities."""
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> float:
+        return seq_group.priority
+
+
+class EDF(Policy):
+    """Earliest deadline first. Before its first token, the deadline of a
+    request is its arrival time plus its TTFT SLO; after it, the n-th output
+    token is due n TPOT SLOs after the first one. Requests without an SLO
+    for their current phase go last.
+    """
+
+    def get_deadline(self, seq_group: SequenceGroup) -> float:
+        slo = seq_group.slo
+        if slo is None:
+            return math.inf
+        first_token_time = seq_group.metrics.first_token_time
+        if first_token_time is None:
+            if slo.ttft is None:
+                return math.inf
+            return seq_group.metrics.arrival_time + slo.ttft
+        if slo.tpot is None:
+            return math.inf
+        output_len = seq_group.get_seqs()[0].get_output_len()
+        return first_token_time + output_len * slo.tpot
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> float:
+        return -self.get_deadline(seq_group)
+
+
+class SJF(Policy):
+    """Shortest predicted job first. The remaining work of a request is its
+    prompt tokens still to be prefilled, each costing `prefill_token_cost`
+    decode steps, plus its predicted remaining output tokens.
+
+    The output length is predicted by an exponential moving average of the
+    output lengths of finished requests, starting from
+    `default_output_len`, and capped by the `max_tokens` of the request.
+    """
+
+    def __init__(self,
+                 prefill_token_cost: float = 0.02,
+                 default_output_len: int = 128,
+                 weight: float = 0.1) -> None:
+        self.prefill_token_cost = prefill_token_cost
+        self.weight = weight
+        self.mean_output_len = float(default_output_len)
+
+    def get_remaining_work(self, seq_group: SequenceGroup) -> float:
+        output_len = self.mean_output_len
+        sampling_params = seq_group.sampling_params
+        if (sampling_params is not None
+                and sampling_params.max_tokens is not None):
+            output_len = min(output_len, sampling_params.max_tokens)
+        seq = seq_group.get_seqs()[0]
+        # A request running past its prediction has at least one more token.
+        remaining_output = max(output_len - seq.get_output_len(), 1.0)
+        num_prefill_tokens = (seq.data.get_num_uncomputed_tokens()
+                              if seq_group.is_prefill() else 0)
+        return self.prefill_token_cost * num_prefill_tokens + remaining_output
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> float:
+        return -self.get_remaining_work(seq_group)
+
+    def observe_finished(self, seq_group: SequenceGroup) -> None:
+        output_len = max(seq.get_output_len()
+                         for seq in seq_group.get_seqs())
+        self.mean_output_len += self.weight * (output_len -
+                                               self.mean_output_len)
+
+
 class PolicyFactory:
 
-    _POLICY_REGISTRY = {'fcfs': FCFS}
+    _POLICY_REGISTRY = {
+        'fcfs': FCFS,
+        'priority': StrictPriority,
+        'edf': EDF,
+        'sjf': SJF,
+    }
 
     @classmethod
     def get_policy(cls, policy_name: str, **kwargs) -> Policy:
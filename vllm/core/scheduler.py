@@ -4,16 +4,21 @@ import random
 import time
 from collections import deque
 from dataclasses import dataclass, field
-from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+from typing import (Callable, Deque, Dict, Iterable, List, Optional, Set,
+                    Tuple, Union)
+
+import numpy as np
 
 from vllm.config import CacheConfig, LoRAConfig, SchedulerConfig
 from vllm.core.interfaces import AllocStatus, BlockSpaceManager
-from vllm.core.policy import Policy, PolicyFactory
+from vllm.core.policy import FCFS, Policy, PolicyFactory
 from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
+from vllm.preserve.eviction import PreservedSessions
 from vllm.prompt_adapter.request import PromptAdapterRequest
 from vllm.sequence import (Sequence, SequenceData, SequenceGroup,
                            SequenceGroupMetadata, SequenceStatus)
+from vllm.utils import Device
 
 logger = init_logger(__name__)
 
@@ -24,6 +29,10 @@ ENABLE_ARTIFICIAL_PREEMPT = bool(
 ARTIFICIAL_PREEMPTION_PROB = 0.5
 ARTIFICIAL_PREEMPTION_MAX_CNT = 500
 
+# The default scheduling only schedules prefills while fewer sequence groups
+# than this are running.
+MAX_RUNNING_FOR_PREFILL = 15
+
 
 class PreemptionMode(enum.Enum):
     """Preemption modes.
@@ -131,10 +140,28 @@ class SchedulerOutputs:
     # The number of requests in the running queue
     running_queue_size: int
     preempted: int
+    # Blocks to move to disk. List of CPU -> disk block number.
+    blocks_to_disk_out: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to restore from disk. List of disk -> GPU block number.
+    blocks_to_disk_in: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to compress. List of GPU -> compressed block number.
+    blocks_to_compress: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to decompress. List of compressed -> GPU block number.
+    blocks_to_decompress: List[Tuple[int, int]] = field(
+        default_factory=list)
+    # Blocks to copy from other virtual engines. List of (source virtual
+    # engine, source GPU block number, GPU block number).
+    blocks_to_migrate: List[Tuple[int, int, int]] = field(
+        default_factory=list)
+    # Sequences migrated by `blocks_to_migrate`, whose blocks in the source
+    # virtual engine can be freed after this step. List of (source virtual
+    # engine, seq id).
+    migrated_seq_ids: List[Tuple[int, int]] = field(default_factory=list)
 
     def __post_init__(self):
         # Swap in and swap out should never happen at the same time.
-        assert not (self.blocks_to_swap_in and self.blocks_to_swap_out)
+        assert not ((self.blocks_to_swap_in or self.blocks_to_disk_in)
+                    and self.blocks_to_swap_out)
 
         self.num_loras: int = len(self.lora_requests)
         if self.num_loras > 0:
@@ -145,7 +172,11 @@ class SchedulerOutputs:
     def is_empty(self) -> bool:
         # NOTE: We do not consider the ignored sequence groups.
         return (not self.scheduled_seq_groups and not self.blocks_to_swap_in
-                and not self.blocks_to_swap_out and not self.blocks_to_copy)
+                and not self.blocks_to_swap_out and not self.blocks_to_copy
+                and not self.blocks_to_disk_out and not self.blocks_to_disk_in
+                and not self.blocks_to_compress
+                and not self.blocks_to_decompress
+                and not self.blocks_to_migrate)
     
     def _sort_by_lora_ids(self):
         self.scheduled_seq_groups = sorted(
@@ -191,6 +222,10 @@ class SchedulerRunningOutputs:
     blocks_to_copy: List[Tuple[int, int]]
     # The number of slots for lookahead decoding.
     num_lookahead_slots: int
+    # The preserved session blocks to move from CPU to disk.
+    blocks_to_disk_out: List[Tuple[int, int]] = field(default_factory=list)
+    # The preserved session blocks to compress.
+    blocks_to_compress: List[Tuple[int, int]] = field(default_factory=list)
 
     @classmethod
     def create_empty(cls) -> "SchedulerRunningOutputs":
@@ -202,6 +237,8 @@ class SchedulerRunningOutputs:
             blocks_to_swap_out=[],
             blocks_to_copy=[],
             num_lookahead_slots=0,
+            blocks_to_disk_out=[],
+            blocks_to_compress=[],
         )
 
 
@@ -250,6 +287,15 @@ class SchedulerPrefillOutputs:
     # Ignored sequence groups.
     ignored_seq_groups: List[SequenceGroup]
     num_lookahead_slots: int
+    # The preserved session blocks to swap in. List of CPU -> GPU block number.
+    blocks_to_swap_in: List[Tuple[int, int]] = field(default_factory=list)
+    # The preserved session blocks to restore. List of disk -> GPU block
+    # number.
+    blocks_to_disk_in: List[Tuple[int, int]] = field(default_factory=list)
+    # The preserved session blocks to decompress. List of compressed -> GPU
+    # block number.
+    blocks_to_decompress: List[Tuple[int, int]] = field(
+        default_factory=list)
 
     @classmethod
     def create_empty(cls) -> "SchedulerPrefillOutputs":
@@ -257,6 +303,9 @@ class SchedulerPrefillOutputs:
             seq_groups=[],
             ignored_seq_groups=[],
             num_lookahead_slots=0,
+            blocks_to_swap_in=[],
+            blocks_to_disk_in=[],
+            blocks_to_decompress=[],
         )
 
 
@@ -293,13 +342,23 @@ class Scheduler:
         if num_cpu_blocks:
             num_cpu_blocks //= pipeline_parallel_size
 
+        num_disk_blocks = cache_config.num_disk_blocks
+        if num_disk_blocks:
+            num_disk_blocks //= pipeline_parallel_size
+
+        num_compressed_blocks = cache_config.num_compressed_blocks
+        if num_compressed_blocks:
+            num_compressed_blocks //= pipeline_parallel_size
+
         # Create the block space manager.
         self.block_manager = BlockSpaceManagerImpl(
             block_size=self.cache_config.block_size,
             num_gpu_blocks=num_gpu_blocks,
             num_cpu_blocks=num_cpu_blocks,
             sliding_window=self.cache_config.sliding_window,
-            enable_caching=self.cache_config.enable_prefix_caching)
+            enable_caching=self.cache_config.enable_prefix_caching,
+            num_disk_blocks=num_disk_blocks,
+            num_compressed_blocks=num_compressed_blocks)
 
         # Sequence groups in the WAITING state.
         # Contain new prefill or preempted requests.
@@ -324,6 +383,22 @@ class Scheduler:
         self.user_specified_preemption_mode = scheduler_config.preemption_mode
         # Finished sequence but their sequence group has not finished
         self._finished_queue: Deque[Sequence] = deque()
+        # GPU blocks kept free for the sessions forecast to return within
+        # the admission horizon.
+        self.num_reserved_session_blocks = 0
+        # Preserved sessions copied from other virtual engines since the last
+        # step.
+        self._blocks_to_migrate: List[Tuple[int, int, int]] = []
+        self._migrated_seq_ids: List[Tuple[int, int]] = []
+        # Preserved sessions freed under memory pressure since last call.
+        self._num_evicted_sessions = 0
+        # The policy ordering the waiting, running and swapped queues. The
+        # waiting queue is kept in arrival order under FCFS, so it is only
+        # sorted by the other policies.
+        self.policy = PolicyFactory.get_policy(
+            scheduler_config.scheduling_policy)
+        self._waiting_policy: Optional[Policy] = (
+            None if isinstance(self.policy, FCFS) else self.policy)
 
         # The following field is test-only. It is used to inject artificial
         # preemption.
@@ -342,6 +417,14 @@ class Scheduler:
         """The number of new tokens."""
         return 1
 
+    def reserve_session_blocks(self, num_blocks: int) -> None:
+        """Keep `num_blocks` GPU blocks free for returning sessions.
+
+        New requests without a session are not scheduled into the reserved
+        blocks until they have waited `session_admission_horizon` seconds.
+        """
+        self.num_reserved_session_blocks = num_blocks
+
     def add_seq_group(self, seq_group: SequenceGroup) -> None:
         # Add sequence groups to the waiting queue.
         self.waiting.append(seq_group)
@@ -412,8 +495,8 @@ class Scheduler:
         policy: Policy,
         enable_chunking: bool = False,
         finished_queue: deque = None,
-        session_id_block: Dict[str, int] = None,
-        session_id_arrived: Dict[str, int] = None
+        session_id_block: Optional[PreservedSessions] = None,
+        session_id_arrived: Optional[PreservedSessions] = None
     ) -> Tuple[deque, SchedulerRunningOutputs]:
         """Schedule sequence groups that are running.
 
@@ -439,6 +522,8 @@ class Scheduler:
         # Blocks that need to be swapped or copied before model execution.
         blocks_to_swap_out: List[Tuple[int, int]] = []
         blocks_to_copy: List[Tuple[int, int]] = []
+        blocks_to_disk_out: List[Tuple[int, int]] = []
+        blocks_to_compress: List[Tuple[int, int]] = []
 
         decode_seq_groups: List[ScheduledSequenceGroup] = []
         prefill_seq_groups: List[ScheduledSequenceGroup] = []
@@ -476,12 +561,12 @@ class Scheduler:
                     victim_seq: Sequence = finished_queue[0]
                     self.free_seq(victim_seq)
                     finished_queue.popleft()
-                elif session_id_block is not None and len(session_id_block) > 0:
-                    seq_id = session_id_block.pop()
-                    self.free_seq_id(seq_id)
-                elif session_id_arrived is not None and len(session_id_arrived) > 0:
-                    seq_id = session_id_arrived.pop()
-                    self.free_seq_id(seq_id)
+                elif self._release_preserved_sessions(
+                        session_id_block, session_id_arrived, 1,
+                        blocks_to_swap_out, blocks_to_disk_out,
+                        blocks_to_compress):
+                    # A preserved session gave up its GPU blocks.
+                    continue
                 elif running_queue:
                     # Preempt the lowest-priority sequence groups.
                     victim_seq_group = running_queue.pop()
@@ -533,7 +618,9 @@ class Scheduler:
             blocks_to_swap_out=blocks_to_swap_out,
             blocks_to_copy=blocks_to_copy,
             num_lookahead_slots=self._get_num_lookahead_slots(
-                is_prefill=False))
+                is_prefill=False),
+            blocks_to_disk_out=blocks_to_disk_out,
+            blocks_to_compress=blocks_to_compress)
 
     def _schedule_swapped(
         self,
@@ -670,6 +757,8 @@ class Scheduler:
         budget: SchedulingBudget,
         curr_loras: Optional[Set[int]],
         enable_chunking: bool = False,
+        policy: Optional[Policy] = None,
+        restore_sessions: bool = True,
     ) -> Tuple[deque, SchedulerPrefillOutputs]:
         """Schedule sequence groups that are in prefill stage.
 
@@ -692,6 +781,10 @@ class Scheduler:
                 chunked number of tokens are scheduled  if
                 `budget.num_batched_tokens` has not enough capacity to schedule
                 all tokens.
+            policy: If given, the sorting policy to sort waiting_queue.
+                Otherwise the queue is scheduled in its current order.
+            restore_sessions: If False, returning sessions whose preserved
+                blocks were moved out of the GPU cache are left waiting.
 
         Returns:
             A tuple of remaining waiting_queue after scheduling and
@@ -699,9 +792,15 @@ class Scheduler:
         """
         ignored_seq_groups: List[SequenceGroup] = []
         seq_groups: List[SequenceGroup] = []
-        # We don't sort waiting queue because we assume it is sorted.
-        # Copy the queue so that the input queue is not modified.
-        waiting_queue = deque([s for s in waiting_queue])
+        blocks_to_swap_in: List[Tuple[int, int]] = []
+        blocks_to_disk_in: List[Tuple[int, int]] = []
+        blocks_to_decompress: List[Tuple[int, int]] = []
+        if policy is not None:
+            waiting_queue = policy.sort_by_priority(time.time(), waiting_queue)
+        else:
+            # We don't sort waiting queue because we assume it is sorted.
+            # Copy the queue so that the input queue is not modified.
+            waiting_queue = deque([s for s in waiting_queue])
 
         leftover_waiting_sequences: Deque[SequenceGroup] = deque()
         while self._passed_delay(time.time()) and waiting_queue:
@@ -736,6 +835,21 @@ class Scheduler:
                 waiting_queue.popleft()
                 continue
 
+            computed_block_seq = seq_group.computed_block_seq
+            if (not restore_sessions and computed_block_seq is not None
+                    and self.block_manager.is_seq_id_swapped(
+                        computed_block_seq)):
+                leftover_waiting_sequences.appendleft(seq_group)
+                waiting_queue.popleft()
+                continue
+
+            if not self._can_admit(seq_group, waiting_seqs[0]):
+                # Let the requests behind it, which may be returning
+                # sessions, use the blocks.
+                leftover_waiting_sequences.appendleft(seq_group)
+                waiting_queue.popleft()
+                continue
+
             # If the sequence group cannot be allocated, stop.
             can_allocate = self.block_manager.can_allocate(seq_group)
             if can_allocate == AllocStatus.LATER:
@@ -776,7 +890,9 @@ class Scheduler:
             if curr_loras is not None and lora_int_id > 0:
                 curr_loras.add(lora_int_id)
             waiting_queue.popleft()
-            self._allocate_and_set_running(seq_group)
+            self._allocate_and_set_running(seq_group, blocks_to_swap_in,
+                                           blocks_to_disk_in, enable_chunking,
+                                           blocks_to_decompress)
             seq_groups.append(
                 ScheduledSequenceGroup(seq_group=seq_group,
                                        token_chunk_size=num_new_tokens))
@@ -791,9 +907,101 @@ class Scheduler:
         return waiting_queue, SchedulerPrefillOutputs(
             seq_groups=seq_groups,
             ignored_seq_groups=ignored_seq_groups,
-            num_lookahead_slots=self._get_num_lookahead_slots(is_prefill=True))
+            num_lookahead_slots=self._get_num_lookahead_slots(is_prefill=True),
+            blocks_to_swap_in=blocks_to_swap_in,
+            blocks_to_disk_in=blocks_to_disk_in,
+            blocks_to_decompress=blocks_to_decompress)
 
-    def _schedule_default(self, session_id_block:Dict[str, int], session_id_arrived: Dict[str, int]) -> SchedulerOutputs:
+    def _preempt_for_waiting(
+        self,
+        budget: SchedulingBudget,
+        curr_loras: Optional[Set[int]],
+        session_id_block: Optional[PreservedSessions],
+        blocks_to_swap_out: List[Tuple[int, int]],
+        blocks_to_disk_out: List[Tuple[int, int]],
+        blocks_to_compress: List[Tuple[int, int]],
+    ) -> int:
+        """Preempt running requests ranked below the first waiting request by
+        the scheduling policy, lowest first, until the waiting request can be
+        scheduled.
+
+        The GPU blocks the waiting request lacks are first taken from the
+        idle preserved sessions in `session_id_block`, which are released
+        like in `_release_preserved_sessions`, and running requests are only
+        preempted for the rest. Preemption only frees GPU blocks and running
+        slots, so nothing is released or preempted if the waiting request is
+        held back by anything else: the prefill delay, the blocks reserved
+        for returning sessions or the LoRA slots. The victims are recomputed
+        later, so only sequence groups with a single sequence are preempted.
+        `budget` and `curr_loras` are updated in place. Returns the number of
+        preempted sequence groups.
+        """
+        if not self.waiting or not self.running:
+            return 0
+        now = time.time()
+        policy = self.policy
+        seq_group = policy.sort_by_priority(now, self.waiting)[0]
+        waiting_seqs = seq_group.get_seqs(status=SequenceStatus.WAITING)
+        if (not self._passed_delay(now)
+                or not self._can_admit(seq_group, waiting_seqs[0])):
+            return 0
+        if (curr_loras is not None and self.lora_config is not None
+                and seq_group.lora_int_id > 0
+                and seq_group.lora_int_id not in curr_loras
+                and len(curr_loras) >= self.lora_config.max_loras):
+            return 0
+        if self.block_manager.can_allocate(seq_group) == AllocStatus.NEVER:
+            return 0
+        num_missing_blocks = self._get_num_missing_gpu_blocks(seq_group)
+        if num_missing_blocks > 0 and session_id_block:
+            self._release_preserved_sessions(session_id_block, None,
+                                             num_missing_blocks,
+                                             blocks_to_swap_out,
+                                             blocks_to_disk_out,
+                                             blocks_to_compress)
+            num_missing_blocks = self._get_num_missing_gpu_blocks(seq_group)
+        priority = policy.get_priority(now, seq_group)
+        num_new_seqs = seq_group.get_max_num_running_seqs()
+        num_new_tokens = self._get_num_new_tokens(seq_group,
+                                                  SequenceStatus.WAITING,
+                                                  False, budget)
+        running_queue = policy.sort_by_priority(now, self.running)
+        preempted: List[SequenceGroup] = []
+        while running_queue:
+            if (num_missing_blocks <= 0
+                    and len(running_queue) < MAX_RUNNING_FOR_PREFILL
+                    and budget.can_schedule(num_new_tokens=num_new_tokens,
+                                            num_new_seqs=num_new_seqs)):
+                break
+            victim = running_queue[-1]
+            if (policy.get_priority(now, victim) >= priority
+                    or victim.get_max_num_running_seqs() > 1):
+                break
+            running_queue.pop()
+            budget.subtract_num_seqs(victim.request_id,
+                                     victim.get_max_num_running_seqs())
+            if (curr_loras is not None and victim.lora_int_id > 0
+                    and all(group.lora_int_id != victim.lora_int_id
+                            for group in running_queue)):
+                curr_loras.discard(victim.lora_int_id)
+            self.num_cumulative_preemption += 1
+            num_free_gpu_blocks = self.block_manager.get_num_free_gpu_blocks()
+            self._preempt_by_recompute(victim)
+            num_missing_blocks -= (
+                self.block_manager.get_num_free_gpu_blocks() -
+                num_free_gpu_blocks)
+            preempted.append(victim)
+
+        self.running = running_queue
+        self.waiting.extendleft(preempted)
+        return len(preempted)
+
+    def _schedule_default(
+        self,
+        session_id_block: Optional[PreservedSessions] = None,
+        session_id_arrived: Optional[PreservedSessions] = None,
+        release_blocked_sessions: bool = True,
+    ) -> SchedulerOutputs:
         """Schedule queued requests.
         
         The current policy is designed to optimize the throughput. First,
@@ -815,6 +1023,16 @@ class Scheduler:
             seq_group.lora_int_id for seq_group in self.running
             if seq_group.lora_int_id > 0) if self.lora_enabled else None
 
+        num_priority_preempted = 0
+        # The preserved sessions released for the first waiting request.
+        blocks_to_swap_out: List[Tuple[int, int]] = []
+        blocks_to_disk_out: List[Tuple[int, int]] = []
+        blocks_to_compress: List[Tuple[int, int]] = []
+        if self._waiting_policy is not None and not self.swapped:
+            num_priority_preempted = self._preempt_for_waiting(
+                budget, curr_loras, session_id_block, blocks_to_swap_out,
+                blocks_to_disk_out, blocks_to_compress)
+
         remaining_waiting, prefills = (self.waiting,
                                        SchedulerPrefillOutputs.create_empty())
         remaining_running, running_scheduled = (
@@ -823,16 +1041,20 @@ class Scheduler:
             self.swapped, SchedulerSwappedInOutputs.create_empty())
 
         # If any requests are swapped, prioritized swapped requests.
-        if not self.swapped and len(remaining_running) < 15:
+        if (not self.swapped
+                and len(remaining_running) < MAX_RUNNING_FOR_PREFILL):
+            # No session is restored into the GPU blocks of the sessions
+            # released above before they are copied out.
             remaining_waiting, prefills = self._schedule_prefills(
-                self.waiting, budget, curr_loras, enable_chunking=False)
-            for seq_group in prefills.seq_groups:
-                if type(seq_group) == ScheduledSequenceGroup:
-                    seq_group = seq_group.seq_group
-                if seq_group.session_id is not None and seq_group.session_id in session_id_arrived:
-                    del session_id_arrived[seq_group.session_id]
-
-        fcfs_policy = PolicyFactory.get_policy(policy_name="fcfs")
+                self.waiting,
+                budget,
+                curr_loras,
+                enable_chunking=False,
+                policy=self._waiting_policy,
+                restore_sessions=not (blocks_to_swap_out
+                                      or blocks_to_compress))
+            self._remove_arrived_sessions(prefills, session_id_arrived)
+
         # Don't schedule decodes if prefills are scheduled.
         # NOTE: If `_schedule_prefills` doesn't enable chunking, self.running
         # only contains decode requests, not chunked prefills.
@@ -841,7 +1063,7 @@ class Scheduler:
                 self.running,
                 budget,
                 curr_loras,
-                fcfs_policy,
+                self.policy,
                 enable_chunking=False,
                 finished_queue=self._finished_queue,
                 session_id_block=session_id_block,
@@ -849,10 +1071,13 @@ class Scheduler:
 
             # If any sequence group is preempted, do not swap in any sequence
             # group. because it means there's no slot for new running requests.
+            # The same holds when preserved sessions are being swapped out.
             if len(running_scheduled.preempted) + len(
-                    running_scheduled.swapped_out) == 0:
+                    running_scheduled.swapped_out) == 0 and not (
+                        running_scheduled.blocks_to_swap_out
+                        or blocks_to_swap_out):
                 remaining_swapped, swapped_in = self._schedule_swapped(
-                    self.swapped, budget, curr_loras, fcfs_policy)
+                    self.swapped, budget, curr_loras, self.policy)
 
         assert (budget.num_batched_tokens <=
                 self.scheduler_config.max_num_batched_tokens)
@@ -874,7 +1099,8 @@ class Scheduler:
         self.swapped = remaining_swapped
         self.swapped.extend(running_scheduled.swapped_out)
         preempted = (len(running_scheduled.preempted) +
-                     len(running_scheduled.swapped_out))
+                     len(running_scheduled.swapped_out) +
+                     num_priority_preempted)
 
         # There should be no prefill from running queue because this policy
         # doesn't allow chunked prefills.
@@ -890,8 +1116,10 @@ class Scheduler:
                                   swapped_in.decode_seq_groups),
             num_prefill_groups=len(prefills.seq_groups),
             num_batched_tokens=budget.num_batched_tokens,
-            blocks_to_swap_in=swapped_in.blocks_to_swap_in,
-            blocks_to_swap_out=running_scheduled.blocks_to_swap_out,
+            blocks_to_swap_in=swapped_in.blocks_to_swap_in +
+            prefills.blocks_to_swap_in,
+            blocks_to_swap_out=blocks_to_swap_out +
+            running_scheduled.blocks_to_swap_out,
             blocks_to_copy=running_scheduled.blocks_to_copy +
             swapped_in.blocks_to_copy,
             ignored_seq_groups=prefills.ignored_seq_groups +
@@ -899,26 +1127,78 @@ class Scheduler:
             num_lookahead_slots=running_scheduled.num_lookahead_slots,
             running_queue_size=len(self.running),
             preempted=preempted,
+            blocks_to_disk_out=blocks_to_disk_out +
+            running_scheduled.blocks_to_disk_out,
+            blocks_to_disk_in=prefills.blocks_to_disk_in,
+            blocks_to_compress=blocks_to_compress +
+            running_scheduled.blocks_to_compress,
+            blocks_to_decompress=prefills.blocks_to_decompress,
         )
 
         # print("Is empty? is waiting?", sched_output.is_empty(), len(self.waiting))
-        if sched_output.is_empty() and len(self.waiting) > 0:
-            # print("Lazy detection")
-            assert session_id_block or session_id_arrived
-            if session_id_block:
-                session_id, seq_id = list(session_id_block.items())[0] 
-                self.free_seq_id(seq_id)
-                del session_id_block[session_id]
-            else:
-                session_id, seq_id = list(session_id_arrived.items())[0]
-                self.free_seq_id(seq_id)
+        if not release_blocked_sessions:
+            return sched_output
+        return self._release_blocked_sessions(sched_output, session_id_block,
+                                              session_id_arrived,
+                                              self._schedule_default)
+
+    def _remove_arrived_sessions(
+            self, prefills: SchedulerPrefillOutputs,
+            session_id_arrived: Optional[PreservedSessions]) -> None:
+        """Forget the arrived sessions whose next turn has been scheduled; the
+        allocation took over their blocks."""
+        if not session_id_arrived:
+            return
+        for scheduled_seq_group in prefills.seq_groups:
+            session_id = scheduled_seq_group.seq_group.session_id
+            if session_id is not None and session_id in session_id_arrived:
                 del session_id_arrived[session_id]
-            return self._schedule_default(session_id_block, session_id_arrived)
-        else:
+
+    def _release_blocked_sessions(
+        self,
+        sched_output: SchedulerOutputs,
+        session_id_block: Optional[PreservedSessions],
+        session_id_arrived: Optional[PreservedSessions],
+        reschedule: Callable[..., SchedulerOutputs],
+    ) -> SchedulerOutputs:
+        """Release preserved sessions and schedule again with `reschedule`
+        if nothing could be scheduled while requests are waiting.
+
+        The sessions released are the lowest ranked ones that free the GPU
+        blocks missing for the head of the waiting queue, so that a single
+        extra scheduling pass is needed however many sessions go.
+        """
+        if not sched_output.is_empty() or len(self.waiting) == 0:
             return sched_output
-        
+        if not session_id_block and not session_id_arrived:
+            return sched_output
+        # Nothing can be scheduled, so the waiting requests are blocked by
+        # the GPU blocks of preserved sessions.
+        blocks_to_swap_out: List[Tuple[int, int]] = []
+        blocks_to_disk_out: List[Tuple[int, int]] = []
+        blocks_to_compress: List[Tuple[int, int]] = []
+        if not self._release_preserved_sessions(
+                session_id_block, session_id_arrived,
+                self._get_num_blocked_gpu_blocks(), blocks_to_swap_out,
+                blocks_to_disk_out, blocks_to_compress):
+            return sched_output
+        if blocks_to_swap_out or blocks_to_compress:
+            # The demoted blocks can only be reused once the swap out and the
+            # compression have been executed, so schedule them on their own.
+            sched_output.blocks_to_swap_out = blocks_to_swap_out
+            sched_output.blocks_to_disk_out = blocks_to_disk_out
+            sched_output.blocks_to_compress = blocks_to_compress
+            return sched_output
+        return reschedule(session_id_block,
+                          session_id_arrived,
+                          release_blocked_sessions=False)
 
-    def _schedule_chunked_prefill(self):
+    def _schedule_chunked_prefill(
+        self,
+        session_id_block: Optional[PreservedSessions] = None,
+        session_id_arrived: Optional[PreservedSessions] = None,
+        release_blocked_sessions: bool = True,
+    ) -> SchedulerOutputs:
         """Schedule queued requests.
         
         Chunked prefill allows to chunk prefill requests, batch them together
@@ -931,6 +1211,10 @@ class Scheduler:
         prefill and decodes requests to the same batch, while it improves
         inter token latency because decodes requests don't need to blocked
         by prefill requests.
+
+        A returning session only prefills the part of its prompt that is not
+        reused from its preserved KV, and preserved sessions give up their
+        blocks under memory pressure like in the default policy.
         """
         budget = SchedulingBudget(
             token_budget=self.scheduler_config.max_num_batched_tokens,
@@ -945,26 +1229,38 @@ class Scheduler:
         remaining_swapped, swapped_in = (
             self.swapped, SchedulerSwappedInOutputs.create_empty())
 
-        # Decoding should be always scheduled first by fcfs.
-        fcfs_policy = PolicyFactory.get_policy(policy_name="fcfs")
+        # Decoding should be always scheduled first.
         remaining_running, running_scheduled = self._schedule_running(
             self.running,
             budget,
             curr_loras,
-            fcfs_policy,
+            self.policy,
             enable_chunking=True,
-            finished_queue=self._finished_queue)
+            finished_queue=self._finished_queue,
+            session_id_block=session_id_block,
+            session_id_arrived=session_id_arrived)
 
         # Schedule swapped out requests.
         # If preemption happens, it means we don't have space for swap-in.
+        # The same holds when preserved sessions are being swapped out.
         if len(running_scheduled.preempted) + len(
-                running_scheduled.swapped_out) == 0:
+                running_scheduled.swapped_out) == 0 and not (
+                    running_scheduled.blocks_to_swap_out):
             remaining_swapped, swapped_in = self._schedule_swapped(
-                self.swapped, budget, curr_loras, fcfs_policy)
+                self.swapped, budget, curr_loras, self.policy)
 
         # Schedule new prefills.
+        # Sessions demoted in this step free their GPU blocks before they are
+        # copied out, so no session is restored into them in the same step.
         remaining_waiting, prefills = self._schedule_prefills(
-            self.waiting, budget, curr_loras, enable_chunking=True)
+            self.waiting,
+            budget,
+            curr_loras,
+            enable_chunking=True,
+            policy=self._waiting_policy,
+            restore_sessions=not (running_scheduled.blocks_to_swap_out
+                                  or running_scheduled.blocks_to_compress))
+        self._remove_arrived_sessions(prefills, session_id_arrived)
 
         assert (budget.num_batched_tokens <=
                 self.scheduler_config.max_num_batched_tokens)
@@ -987,7 +1283,7 @@ class Scheduler:
         # Update swapped requests.
         self.swapped = remaining_swapped
         self.swapped.extend(running_scheduled.swapped_out)
-        return SchedulerOutputs(
+        sched_output = SchedulerOutputs(
             scheduled_seq_groups=(prefills.seq_groups +
                                   running_scheduled.prefill_seq_groups +
                                   swapped_in.prefill_seq_groups +
@@ -997,7 +1293,8 @@ class Scheduler:
                                 len(swapped_in.prefill_seq_groups) +
                                 len(running_scheduled.prefill_seq_groups)),
             num_batched_tokens=budget.num_batched_tokens,
-            blocks_to_swap_in=swapped_in.blocks_to_swap_in,
+            blocks_to_swap_in=swapped_in.blocks_to_swap_in +
+            prefills.blocks_to_swap_in,
             blocks_to_swap_out=running_scheduled.blocks_to_swap_out,
             blocks_to_copy=running_scheduled.blocks_to_copy +
             swapped_in.blocks_to_copy,
@@ -1007,12 +1304,26 @@ class Scheduler:
             running_queue_size=len(self.running),
             preempted=(len(running_scheduled.preempted) +
                        len(running_scheduled.swapped_out)),
+            blocks_to_disk_out=running_scheduled.blocks_to_disk_out,
+            blocks_to_disk_in=prefills.blocks_to_disk_in,
+            blocks_to_compress=running_scheduled.blocks_to_compress,
+            blocks_to_decompress=prefills.blocks_to_decompress,
         )
+        if not release_blocked_sessions:
+            return sched_output
+        return self._release_blocked_sessions(sched_output, session_id_block,
+                                              session_id_arrived,
+                                              self._schedule_chunked_prefill)
 
-    def _schedule(self, session_id_block, session_id_arrived) -> SchedulerOutputs:
+    def _schedule(
+        self,
+        session_id_block: Optional[PreservedSessions] = None,
+        session_id_arrived: Optional[PreservedSessions] = None,
+    ) -> SchedulerOutputs:
         """Schedule queued requests."""
         if self.scheduler_config.chunked_prefill_enabled:
-            return self._schedule_chunked_prefill()
+            return self._schedule_chunked_prefill(session_id_block,
+                                                  session_id_arrived)
         else:
             return self._schedule_default(session_id_block, session_id_arrived)
 
@@ -1038,11 +1349,19 @@ class Scheduler:
     def _required_slots(self, seq_group: SequenceGroup) -> int:
         return self.block_manager.get_append_required_blocks(seq_group)
     
-    def schedule(self, session_id_blocks, session_id_arrived) -> Tuple[List[SequenceGroupMetadata], SchedulerOutputs]:
+    def schedule(
+        self,
+        session_id_blocks: Optional[PreservedSessions] = None,
+        session_id_arrived: Optional[PreservedSessions] = None,
+    ) -> Tuple[List[SequenceGroupMetadata], SchedulerOutputs]:
         # Schedule sequence groups.
         # This function call changes the internal states of the scheduler
         # such as self.running, self.swapped, and self.waiting.
         scheduler_outputs = self._schedule(session_id_blocks, session_id_arrived)
+        # Sessions migrated in are copied before the model runs in this step.
+        scheduler_outputs.blocks_to_migrate = self._blocks_to_migrate
+        scheduler_outputs.migrated_seq_ids = self._migrated_seq_ids
+        self._blocks_to_migrate, self._migrated_seq_ids = [], []
         now = time.time()
 
         # Create input data structures.
@@ -1092,6 +1411,9 @@ class Scheduler:
             # It assumes the scheduled_seq_groups is ordered by
             # prefill < decoding.
             is_prompt = seq_group.is_prefill()
+            if is_prompt and seq_group.num_cached_tokens is None:
+                seq_group.num_cached_tokens = self._get_num_cached_tokens(
+                    seq_group, common_computed_block_nums)
             seq_group_metadata = SequenceGroupMetadata(
                 request_id=seq_group.request_id,
                 is_prompt=is_prompt,
@@ -1130,27 +1452,113 @@ class Scheduler:
 
     def free_seq(self, seq: Sequence) -> None:
         """Free a sequence from a block table."""
-        seq.finished_removed = seq.n_blocks
+        if seq.is_finished():
+            # None of its blocks is left; see `Sequence.n_blocks`.
+            seq.finished_removed += seq.n_blocks
         self.block_manager.free(seq)
 
     def free_seq_id(self, seq_id: int) -> None:
         self.block_manager.free_seq_id(seq_id)
 
+    def fork_seq_id(self, src_seq_id: int, dst_seq_id: int) -> None:
+        """Retain `dst_seq_id` in the blocks retained for `src_seq_id`,
+        shared copy-on-write."""
+        self.block_manager.fork_seq_id(src_seq_id, dst_seq_id)
+
+    def get_retained_token_ids(self, seq_id: int) -> Optional[np.ndarray]:
+        """Get the token ids covered by the blocks retained for `seq_id`."""
+        return self.block_manager.get_retained_token_ids(seq_id)
+
+    def trim_seq_id(self, seq_id: int, num_tokens: int) -> int:
+        """Free the blocks retained for `seq_id` that the next turn of its
+        session is not expected to reuse, i.e. those past its first
+        `num_tokens` tokens. Returns the number of retained tokens left."""
+        return self.block_manager.trim_seq_id(seq_id, num_tokens)
+
+    def get_and_reset_num_evicted_sessions(self) -> int:
+        """Flushes the number of preserved sessions freed under memory
+        pressure."""
+        num_evicted_sessions = self._num_evicted_sessions
+        self._num_evicted_sessions = 0
+        return num_evicted_sessions
+
+    def get_num_seq_id_blocks(self, seq_id: int) -> int:
+        return self.block_manager.get_num_seq_id_blocks(seq_id)
+
+    def get_seq_id_gpu_block_numbers(self, seq_id: int,
+                                     num_blocks: int) -> Optional[List[int]]:
+        return self.block_manager.get_seq_id_gpu_block_numbers(
+            seq_id, num_blocks)
+
+    def migrate_in_seq_id(self, seq_id: int, src_virtual_engine: int,
+                          src_block_numbers: List[int],
+                          token_ids: np.ndarray) -> bool:
+        """Retain `seq_id`, preserved by the scheduler of
+        `src_virtual_engine`, in copies of its GPU blocks.
+
+        The blocks are copied before the model runs in the next step, after
+        which the source blocks can be freed. Returns False if the blocks do
+        not fit.
+        """
+        if not self.block_manager.can_migrate_in(len(src_block_numbers)):
+            return False
+        mapping = self.block_manager.migrate_in_seq_id(
+            seq_id, src_block_numbers, token_ids)
+        self._blocks_to_migrate.extend(
+            (src_virtual_engine, src_block, dst_block)
+            for src_block, dst_block in mapping)
+        self._migrated_seq_ids.append((src_virtual_engine, seq_id))
+        return True
+
+    def get_seq_id_device(self, seq_id: int) -> Optional[Device]:
+        return self.block_manager.get_seq_id_device(seq_id)
+
+    def get_seq_id_block_numbers(self, seq_id: int) -> List[int]:
+        return self.block_manager.get_seq_id_block_numbers(seq_id)
+
+    def restore_seq_id(self, seq_id: int, src_block_numbers: List[int],
+                       token_ids: np.ndarray) -> Optional[List[Tuple[int,
+                                                                     int]]]:
+        """Retain `seq_id` in new GPU blocks that receive the saved blocks
+        `src_block_numbers`, e.g. when sessions are restored after a
+        restart.
+
+        Returns the saved -> GPU block number mapping, to be loaded before
+        the next step, or None if the blocks do not fit.
+        """
+        if not self.block_manager.can_migrate_in(len(src_block_numbers)):
+            return None
+        return self.block_manager.migrate_in_seq_id(seq_id, src_block_numbers,
+                                                    token_ids)
+
+    def get_num_retained_tokens(self, seq_id: int) -> int:
+        retained_token_ids = self.get_retained_token_ids(seq_id)
+        return 0 if retained_token_ids is None else len(retained_token_ids)
+
     def free_finished_seq(self, seq: Sequence, num_blocks: int) -> None:
         seq.finished_removed += num_blocks
         self.block_manager.free_last_blocks(seq, num_blocks)
 
-    def free_finished_seq_groups(self) -> None:
+    def free_finished_seq_groups(self) -> Dict[str, int]:
+        """Free the finished sequence groups.
+
+        The finished sequence of a session keeps its blocks so that the next
+        turn can reuse them. Returns the mapping from those session ids to the
+        ids of their retained sequences.
+        """
         new_finished_queue = deque()
         session_id_block = {}
         for queue in [self.running, self.swapped, self.waiting]:
             for seq_group in queue:
                 if seq_group.is_finished():
                     self._finished_requests_ids.append(seq_group.request_id)
-                    if session_id := seq_group.session_id: 
-                        assert len(seq_group._finished_seq) == 1
-                        seq = seq_group._finished_seq[0]
-                        if seq.n_blocks > 0: #if not, it has already been freed.
+                    self.policy.observe_finished(seq_group)
+                    if session_id := seq_group.session_id:
+                        # Only the best finished sequence kept its blocks.
+                        seq = seq_group._finished_seq.best()
+                        # If it has no blocks, they have already been freed.
+                        if seq is not None and seq.n_blocks > 0:
+                            self.block_manager.retain(seq)
                             session_id_block[session_id] = seq.seq_id
                     else:
                         for seq in seq_group.get_seqs():
@@ -1165,11 +1573,184 @@ class Scheduler:
                              if not seq_group.is_finished())
         return session_id_block
 
-    def _allocate_and_set_running(self, seq_group: SequenceGroup) -> None:
+    def _release_preserved_sessions(
+        self,
+        session_id_block: Optional[PreservedSessions],
+        session_id_arrived: Optional[PreservedSessions],
+        num_blocks: int,
+        blocks_to_swap_out: List[Tuple[int, int]],
+        blocks_to_disk_out: List[Tuple[int, int]],
+        blocks_to_compress: Optional[List[Tuple[int, int]]] = None,
+    ) -> int:
+        """Release the GPU blocks held by the preserved sessions ranked
+        lowest by the session eviction policy, until `num_blocks` blocks are
+        released.
+
+        Idle sessions are released before the ones whose next turn has
+        arrived. A session is compressed on GPU if the compressed cache has
+        room for it and `blocks_to_compress` is given. Else it is demoted to
+        CPU swap space if it fits there, possibly after moving idle sessions
+        from CPU to disk, so that its next turn costs a swap in instead of a
+        full prefill. Otherwise its KV is freed and the session is forgotten.
+
+        Returns:
+            The number of GPU blocks released, 0 if no preserved session
+            holds GPU blocks.
+        """
+        num_released = 0
+        swapped_out_seq_ids: List[int] = []
+        for preserved in (session_id_block, session_id_arrived):
+            if not preserved or num_released >= num_blocks:
+                continue
+            victims = preserved.select_victims(
+                num_blocks - num_released,
+                self.block_manager.get_num_freeable_seq_id_blocks,
+                lambda _, seq_id: not self.block_manager.is_seq_id_swapped(
+                    seq_id))
+            for victim in victims:
+                seq_id = preserved[victim]
+                # Blocks shared with other sessions stay on GPU.
+                num_released += (
+                    self.block_manager.get_num_freeable_seq_id_blocks(seq_id))
+                if (blocks_to_compress is not None and
+                        self.block_manager.get_num_free_compressed_blocks()
+                        and self.block_manager.can_compress_seq_id(seq_id)):
+                    blocks_to_compress.extend(
+                        self.block_manager.compress_seq_id(seq_id))
+                    continue
+                if (not self.block_manager.can_swap_out_seq_id(seq_id)
+                        and session_id_block):
+                    self._demote_preserved_sessions_to_disk(
+                        self.block_manager.get_num_seq_id_blocks(seq_id),
+                        session_id_block, blocks_to_disk_out,
+                        swapped_out_seq_ids)
+                if self.block_manager.can_swap_out_seq_id(seq_id):
+                    blocks_to_swap_out.extend(
+                        self.block_manager.swap_out_seq_id(seq_id))
+                    swapped_out_seq_ids.append(seq_id)
+                else:
+                    self.free_seq_id(seq_id)
+                    del preserved[victim]
+                    self._num_evicted_sessions += 1
+        return num_released
+
+    def _get_num_blocked_gpu_blocks(self) -> int:
+        """Get the number of GPU blocks missing for the head of the waiting
+        queue to be allocated, at least 1."""
+        return max(self._get_num_missing_gpu_blocks(self.waiting[0]), 1)
+
+    def _get_num_missing_gpu_blocks(self, seq_group: SequenceGroup) -> int:
+        """Get the number of GPU blocks missing for a waiting sequence group
+        to be allocated, 0 or less if it fits."""
+        return (self.block_manager.get_num_required_gpu_blocks(seq_group) +
+                self.block_manager.watermark_blocks -
+                self.block_manager.get_num_free_gpu_blocks())
+
+    def _demote_preserved_sessions_to_disk(
+        self,
+        num_blocks: int,
+        session_id_block: PreservedSessions,
+        blocks_to_disk_out: List[Tuple[int, int]],
+        swapped_out_seq_ids: Iterable[int] = (),
+    ) -> None:
+        """Move idle sessions from CPU to disk, lowest ranked first, until
+        `num_blocks` CPU blocks are free. Nothing is moved if that is not
+        possible. The sessions in `swapped_out_seq_ids`, whose swap out is
+        not executed yet, are left on CPU."""
+        num_missing = num_blocks - self.block_manager.get_num_free_cpu_blocks()
+        num_free_disk_blocks = self.block_manager.get_num_free_disk_blocks()
+        victims: List[int] = []
+
+        def can_demote(_: str, seq_id: int) -> bool:
+            return (seq_id not in victims
+                    and seq_id not in swapped_out_seq_ids and
+                    self.block_manager.get_seq_id_device(seq_id) == Device.CPU
+                    and self.block_manager.get_num_seq_id_blocks(seq_id) <=
+                    num_free_disk_blocks)
+
+        while num_missing > 0:
+            session_id = session_id_block.select_victim(can_demote)
+            if session_id is None:
+                return
+            seq_id = session_id_block[session_id]
+            num_seq_blocks = self.block_manager.get_num_seq_id_blocks(seq_id)
+            victims.append(seq_id)
+            num_missing -= num_seq_blocks
+            num_free_disk_blocks -= num_seq_blocks
+        for seq_id in victims:
+            blocks_to_disk_out.extend(
+                self.block_manager.disk_out_seq_id(seq_id))
+
+    def _allocate_and_set_running(
+        self,
+        seq_group: SequenceGroup,
+        blocks_to_swap_in: Optional[List[Tuple[int, int]]] = None,
+        blocks_to_disk_in: Optional[List[Tuple[int, int]]] = None,
+        enable_chunking: bool = False,
+        blocks_to_decompress: Optional[List[Tuple[int, int]]] = None,
+    ) -> None:
+        computed_block_seq = seq_group.computed_block_seq
+        num_reused_tokens = self._get_num_reused_tokens(seq_group)
+        if (blocks_to_swap_in is not None and computed_block_seq is not None
+                and self.block_manager.is_seq_id_swapped(computed_block_seq)):
+            # Only the reused prefix of a demoted session comes back to GPU.
+            num_reused_blocks = max(
+                0, seq_group.session_reuse) // self.cache_config.block_size
+            device = self.block_manager.get_seq_id_device(computed_block_seq)
+            mapping = self.block_manager.swap_in_seq_id(computed_block_seq,
+                                                        num_reused_blocks)
+            if device == Device.DISK:
+                assert blocks_to_disk_in is not None
+                blocks_to_disk_in.extend(mapping)
+            elif device == Device.COMPRESSED:
+                assert blocks_to_decompress is not None
+                blocks_to_decompress.extend(mapping)
+            else:
+                blocks_to_swap_in.extend(mapping)
         self.block_manager.allocate(seq_group)
+        if enable_chunking and computed_block_seq is not None:
+            # The reused prefix is treated like an already prefilled chunk,
+            # since the model runner cannot skip cached blocks of a chunk.
+            assert num_reused_tokens <= len(
+                seq_group.computed_block_nums) * self.cache_config.block_size
+            seq_group.computed_block_nums = []
+            for seq in seq_group.get_seqs(status=SequenceStatus.WAITING):
+                seq.data.update_num_computed_tokens(num_reused_tokens)
         for seq in seq_group.get_seqs(status=SequenceStatus.WAITING):
             seq.status = SequenceStatus.RUNNING
 
+    def _get_num_reused_tokens(self, seq_group: SequenceGroup) -> int:
+        """Get the number of prompt tokens of a returning session whose KV is
+        reused from the blocks retained for its previous turn."""
+        computed_block_seq = seq_group.computed_block_seq
+        if computed_block_seq is None:
+            return 0
+        block_size = self.cache_config.block_size
+        seq = seq_group.get_seqs()[0]
+        # At least one prompt token is computed, for its logits.
+        num_reused_blocks = min(
+            self.block_manager.get_num_seq_id_blocks(computed_block_seq),
+            max(0, seq_group.session_reuse) // block_size,
+            (seq.get_len() - 1) // block_size)
+        return num_reused_blocks * block_size
+
+    def _get_num_cached_tokens(
+            self, seq_group: SequenceGroup,
+            computed_block_nums: Optional[List[int]]) -> int:
+        """Get the number of prompt tokens of a prompt scheduled for the
+        first time whose KV is not computed, but reused from the blocks
+        retained for its session or from the prefix cache."""
+        seq = seq_group.get_seqs(status=SequenceStatus.RUNNING)[0]
+        # With chunked prefill, the reused prefix counts as computed.
+        num_cached_tokens = seq.data.get_num_computed_tokens()
+        # The model runner skips the computed blocks, unless there is a
+        # sliding window.
+        if computed_block_nums and self.cache_config.sliding_window is None:
+            num_cached_tokens = max(
+                num_cached_tokens,
+                len(computed_block_nums) * self.cache_config.block_size)
+        return min(num_cached_tokens, seq.get_prompt_len())
+
     def _append_slots(
         self,
         seq_group: SequenceGroup,
@@ -1285,6 +1866,21 @@ class Scheduler:
         for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
             seq.status = SequenceStatus.SWAPPED
 
+    def _can_admit(self, seq_group: SequenceGroup, seq: Sequence) -> bool:
+        """Whether a waiting request may use the GPU blocks reserved for
+        returning sessions."""
+        horizon = self.scheduler_config.session_admission_horizon
+        if (horizon <= 0 or self.num_reserved_session_blocks == 0
+                or seq_group.session_id is not None
+                or seq.get_output_len() > 0):
+            return True
+        # Delay a request for at most the horizon.
+        if time.time() - seq_group.metrics.arrival_time >= horizon:
+            return True
+        num_free_gpu_blocks = self.block_manager.get_num_free_gpu_blocks()
+        return (num_free_gpu_blocks - seq.n_blocks >=
+                self.num_reserved_session_blocks)
+
     def _passed_delay(self, now: float) -> bool:
         if self.prev_prompt:
             self.last_prompt_latency = now - self.prev_time
@@ -1331,6 +1927,9 @@ class Scheduler:
         seqs = seq_group.get_seqs(status=status)
         for seq in seqs:
             num_new_tokens += seq.get_num_new_tokens()
+        if enable_chunking and status == SequenceStatus.WAITING:
+            # The reused prefix of a returning session is not prefilled.
+            num_new_tokens -= self._get_num_reused_tokens(seq_group)
         assert num_new_tokens > 0
         # Chunk if a running request cannot fit in.
         # If number of seq > 1, it means it is doing beam search in a
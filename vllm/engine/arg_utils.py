@@ -57,6 +57,11 @@ class EngineArgs:
     disable_sliding_window: bool = False
     use_v2_block_manager: bool = False
     swap_space: int = 4  # GiB
+    disk_swap_space: float = 0  # GiB
+    disk_swap_path: Optional[str] = None
+    session_kv_compression: Optional[str] = None
+    compressed_kv_space: float = 0  # GiB
+    session_persist_path: Optional[str] = None
     cpu_offload_gb: int = 0  # GiB
     gpu_memory_utilization: float = 0.90
     max_num_batched_tokens: Optional[int] = None
@@ -97,6 +102,12 @@ class EngineArgs:
     model_loader_extra_config: Optional[dict] = None
     ignore_patterns: Optional[Union[str, List[str]]] = None
     preemption_mode: Optional[str] = None
+    session_eviction_policy: str = 'reuse_value'
+    session_admission_horizon: float = 0.0
+    session_ttl: Optional[float] = None
+    max_preserved_blocks: Optional[int] = None
+    session_arrival_estimator: str = 'ema'
+    scheduling_policy: str = 'fcfs'
 
     scheduler_delay_factor: float = 0.0
     enable_chunked_prefill: Optional[bool] = None
@@ -321,6 +332,42 @@ class EngineArgs:
                             type=int,
                             default=EngineArgs.swap_space,
                             help='CPU swap space size (GiB) per GPU.')
+        parser.add_argument(
+            '--disk-swap-space',
+            type=float,
+            default=EngineArgs.disk_swap_space,
+            help='Size (GiB) per GPU of the memory-mapped disk store that '
+            'keeps the KV of preserved sessions evicted from the CPU swap '
+            'space. Default is 0, which disables the disk tier. Only '
+            'supported on GPU.')
+        parser.add_argument(
+            '--disk-swap-path',
+            type=nullable_str,
+            default=EngineArgs.disk_swap_path,
+            help='Directory holding the disk swap files. Defaults to the '
+            'system temporary directory.')
+        parser.add_argument(
+            '--session-kv-compression',
+            type=nullable_str,
+            choices=['fp8', 'int8', None],
+            default=EngineArgs.session_kv_compression,
+            help='Data type that the KV of idle preserved sessions is '
+            'compressed to on GPU, with one scale per block, before they are '
+            'swapped out or freed. Requires --compressed-kv-space.')
+        parser.add_argument(
+            '--compressed-kv-space',
+            type=float,
+            default=EngineArgs.compressed_kv_space,
+            help='Size (GiB) per GPU of the GPU memory, taken from the KV '
+            'cache, that holds the compressed preserved sessions.')
+        parser.add_argument(
+            '--session-persist-path',
+            type=nullable_str,
+            default=EngineArgs.session_persist_path,
+            help='Directory that the preserved sessions and the KV of their '
+            'retained blocks are saved to when the server shuts down, and '
+            'restored from when it starts, so that a restart does not '
+            'prefill every session again.')
         parser.add_argument(
             '--cpu-offload-gb',
             type=float,
@@ -635,6 +682,63 @@ class EngineArgs:
             help='If \'recompute\', the engine performs preemption by block '
             'swapping; If \'swap\', the engine performs preemption by block '
             'swapping.')
+        parser.add_argument(
+            '--session-eviction-policy',
+            type=str,
+            default=EngineArgs.session_eviction_policy,
+            choices=['fifo', 'reuse_value'],
+            help='The order in which preserved sessions give up their KV '
+            'cache blocks. \'fifo\' evicts the session preserved the '
+            'longest. \'reuse_value\' evicts the session with the fewest '
+            'expected reused tokens per second until its next turn, so that '
+            'overdue sessions go first, and spares sessions whose next turn '
+            'is imminent.')
+        parser.add_argument(
+            '--session-admission-horizon',
+            type=float,
+            default=EngineArgs.session_admission_horizon,
+            help='If positive, new requests without a session wait for up '
+            'to this many seconds while the forecast expects returning '
+            'sessions to need the free GPU blocks within this horizon. '
+            'This keeps new requests from evicting sessions that are about '
+            'to return. 0 disables admission control.')
+        parser.add_argument(
+            '--session-ttl',
+            type=float,
+            default=EngineArgs.session_ttl,
+            help='If set, sessions idle for longer than this many seconds '
+            'are freed with their preserved KV cache, so that clients that '
+            'disappear without ending their session do not leak memory.')
+        parser.add_argument(
+            '--max-preserved-blocks',
+            type=int,
+            default=EngineArgs.max_preserved_blocks,
+            help='If set, the maximum number of KV cache blocks, on any '
+            'device, preserved for idle sessions. Beyond it, the blocks of '
+            'the sessions ranked last by --session-eviction-policy are '
+            'freed in the background.')
+        parser.add_argument(
+            '--session-arrival-estimator',
+            type=str,
+            default=EngineArgs.session_arrival_estimator,
+            choices=['ema', 'quantile'],
+            help='How the time to the next turn of a session and the growth '
+            'of its prompt are fitted. \'ema\' averages the last turns of '
+            'each session. \'quantile\' keeps their distributions per '
+            'session and per tenant, the part of the session id before the '
+            'first \'/\', so that new sessions start from their tenant.')
+        parser.add_argument(
+            '--scheduling-policy',
+            type=str,
+            default=EngineArgs.scheduling_policy,
+            choices=['fcfs', 'priority', 'edf', 'sjf'],
+            help='The order in which waiting, running and swapped requests '
+            'are scheduled; the last ones are preempted first. \'fcfs\' '
+            'follows arrival order. \'priority\' schedules the requests '
+            'with the highest priority first. \'edf\' schedules the '
+            'request whose TTFT or TPOT SLO is due first. \'sjf\' '
+            'schedules the request with the shortest predicted remaining '
+            'work first.')
 
         parser.add_argument(
             "--served-model-name",
@@ -696,6 +800,11 @@ class EngineArgs:
         multimodal_config = MultiModalConfig()
 
         device_config = DeviceConfig(device=self.device)
+        if self.disk_swap_space > 0 and device_config.device_type == "cpu":
+            # The CPU worker does not run the disk swap-out/in operations.
+            raise ValueError(
+                "Disk swap space is only supported on GPU, but got "
+                f"--disk-swap-space={self.disk_swap_space} on CPU.")
         model_config = ModelConfig(
             model=self.model,
             tokenizer=self.tokenizer,
@@ -728,6 +837,11 @@ class EngineArgs:
             sliding_window=model_config.get_sliding_window(),
             enable_prefix_caching=self.enable_prefix_caching,
             cpu_offload_gb=self.cpu_offload_gb,
+            disk_swap_space=self.disk_swap_space,
+            disk_swap_path=self.disk_swap_path,
+            session_kv_compression=self.session_kv_compression,
+            compressed_kv_space=self.compressed_kv_space,
+            session_persist_path=self.session_persist_path,
         )
         parallel_config = ParallelConfig(
             pipeline_parallel_size=self.pipeline_parallel_size,
@@ -811,6 +925,12 @@ class EngineArgs:
             enable_chunked_prefill=self.enable_chunked_prefill,
             embedding_mode=model_config.embedding_mode,
             preemption_mode=self.preemption_mode,
+            session_eviction_policy=self.session_eviction_policy,
+            session_admission_horizon=self.session_admission_horizon,
+            session_ttl=self.session_ttl,
+            max_preserved_blocks=self.max_preserved_blocks,
+            session_arrival_estimator=self.session_arrival_estimator,
+            scheduling_policy=self.scheduling_policy,
         )
         lora_config = LoRAConfig(
             max_lora_rank=self.max_lora_rank,
@@ -1,8 +1,8 @@
 import asyncio
 import time
 from functools import partial
-from typing import (AsyncIterator, Callable, Dict, Iterable, List, Mapping,
-                    Optional, Set, Tuple, Type, Union)
+from typing import (Any, AsyncIterator, Callable, Dict, Iterable, List,
+                    Mapping, Optional, Set, Tuple, Type, Union)
 
 from transformers import PreTrainedTokenizer
 
@@ -12,7 +12,7 @@ from vllm.config import DecodingConfig, EngineConfig, ModelConfig
 from vllm.core.scheduler import SchedulerOutputs
 from vllm.engine.arg_utils import AsyncEngineArgs
 from vllm.engine.async_timeout import asyncio_timeout
-from vllm.engine.llm_engine import LLMEngine
+from vllm.engine.llm_engine import _SESSION_REAP_INTERVAL_SEC, LLMEngine
 from vllm.engine.metrics import StatLoggerBase
 from vllm.executor.executor_base import ExecutorAsyncBase
 from vllm.executor.ray_utils import initialize_ray_cluster, ray
@@ -24,7 +24,7 @@ from vllm.pooling_params import PoolingParams
 from vllm.preserve.session_config import SessionConfig
 from vllm.prompt_adapter.request import PromptAdapterRequest
 from vllm.sampling_params import SamplingParams
-from vllm.sequence import ExecuteModelRequest, SamplerOutput
+from vllm.sequence import ExecuteModelRequest, RequestSLO, SamplerOutput
 from vllm.usage.usage_lib import UsageContext
 
 logger = init_logger(__name__)
@@ -40,7 +40,8 @@ def _log_task_completion(task: asyncio.Task,
     """This function is only intended for the `engine.run_engine_loop()` task.
 
     In particular, that task runs a `while True` loop that can only exit if
-    there is an exception.
+    there is an exception, or cancels itself once `stop_background_loop()`
+    asks it to stop.
     """
 
     exception = None
@@ -245,6 +246,7 @@ class _AsyncLLMEngine(LLMEngine):
         and updates the scheduler with the model outputs. Finally, it decodes
         the sequences and returns the newly generated results.
         """
+        self._reserve_session_blocks()
         seq_group_metadata_list, scheduler_outputs = self.scheduler[
             virtual_engine].schedule(self.session_id_blocks[virtual_engine], self.session_id_arrived[virtual_engine])
 
@@ -256,6 +258,11 @@ class _AsyncLLMEngine(LLMEngine):
                 seq_group_metadata_list=seq_group_metadata_list,
                 blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
                 blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
+                blocks_to_disk_out=scheduler_outputs.blocks_to_disk_out,
+                blocks_to_disk_in=scheduler_outputs.blocks_to_disk_in,
+                blocks_to_compress=scheduler_outputs.blocks_to_compress,
+                blocks_to_decompress=scheduler_outputs.blocks_to_decompress,
+                blocks_to_migrate=scheduler_outputs.blocks_to_migrate,
                 blocks_to_copy=scheduler_outputs.blocks_to_copy,
                 virtual_engine=virtual_engine,
                 num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
@@ -263,6 +270,7 @@ class _AsyncLLMEngine(LLMEngine):
                 finished_requests_ids=finished_requests_ids)
             output = await self.model_executor.execute_model_async(
                 execute_model_req)
+            self._free_migrated_sessions(scheduler_outputs)
         else:
             output = []
         
@@ -327,7 +335,9 @@ class _AsyncLLMEngine(LLMEngine):
         session_id: Optional[str]=None,
         session_reuse: Optional[int]=-1,
         rounds: Optional[float] = -1,
-        default_config: Optional[AgentConfig] = None
+        default_config: Optional[AgentConfig] = None,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> None:
         if lora_request is not None and not self.lora_config:
             raise ValueError(f"Got lora_request {lora_request} but LoRA is "
@@ -352,7 +362,9 @@ class _AsyncLLMEngine(LLMEngine):
             session_id=session_id,
             session_reuse=session_reuse,
             rounds=rounds,
-            default_config=default_config
+            default_config=default_config,
+            priority=priority,
+            slo=slo,
         )
 
     async def check_health_async(self) -> None:
@@ -403,6 +415,8 @@ class AsyncLLMEngine:
         # task as well to prevent it from being garbage
         # collected
         self._background_loop_unshielded: Optional[asyncio.Task] = None
+        self._session_reaper_loop: Optional[asyncio.Task] = None
+        self._stop_requested = False
         self.start_engine_loop = start_engine_loop
         self._errored_with: Optional[BaseException] = None
         # Lazy initialized fields
@@ -537,12 +551,32 @@ class AsyncLLMEngine:
             raise RuntimeError("Background loop is already running.")
         # Initialize the RequestTracker here so it uses the right event loop.
         self._request_tracker = RequestTracker()
+        self._stop_requested = False
 
         self._background_loop_unshielded = asyncio.get_event_loop(
         ).create_task(self.run_engine_loop())
         self._background_loop_unshielded.add_done_callback(
             partial(_log_task_completion, error_callback=self._error_callback))
         self.background_loop = asyncio.shield(self._background_loop_unshielded)
+        self._session_reaper_loop = asyncio.get_event_loop().create_task(
+            self.run_session_reaper_loop())
+
+    async def stop_background_loop(self) -> None:
+        """Stop the background loop between steps.
+
+        The steps in flight are finished and no new one is started, so the
+        engine state can be used safely afterwards, e.g. to save the
+        preserved sessions on shutdown."""
+        if not self.is_running:
+            return
+        self._stop_requested = True
+        # Wake up the loop if it is waiting for new requests.
+        self._request_tracker.new_requests_event.set()
+        assert self._background_loop_unshielded is not None
+        await asyncio.wait([self._background_loop_unshielded])
+        if self._session_reaper_loop is not None:
+            self._session_reaper_loop.cancel()
+            await asyncio.wait([self._session_reaper_loop])
 
     def _init_engine(self, *args,
                      **kwargs) -> Union[_AsyncLLMEngine, "ray.ObjectRef"]:
@@ -615,6 +649,16 @@ class AsyncLLMEngine:
         else:
             self.engine.abort_request(request_ids, is_exception=is_exception)
 
+    async def run_session_reaper_loop(self):
+        """Release expired sessions periodically, also while the engine loop
+        is waiting for new requests."""
+        while not self.is_stopped:
+            await asyncio.sleep(_SESSION_REAP_INTERVAL_SEC)
+            if self.engine_use_ray:
+                await self.engine.reap_sessions.remote()  # type: ignore
+            else:
+                self.engine.reap_sessions()
+
     async def run_engine_loop(self):
         if self.engine_use_ray:
             pipeline_parallel_size = 1  # type: ignore
@@ -623,6 +667,15 @@ class AsyncLLMEngine:
                 self.engine.parallel_config.pipeline_parallel_size
         has_requests_in_progress = [False] * pipeline_parallel_size
         while True:
+            if self._stop_requested:
+                # Let the steps in flight finish, but start no new one.
+                if any(has_requests_in_progress):
+                    await asyncio.wait([
+                        task for task, in_progress in zip(
+                            requests_in_progress, has_requests_in_progress)
+                        if in_progress
+                    ])
+                raise asyncio.CancelledError
             if not any(has_requests_in_progress):
                 logger.debug("Waiting for new requests...")
                 # Stop the execute model loop in parallel workers until there
@@ -638,6 +691,8 @@ class AsyncLLMEngine:
                 else:
                     await self.engine.stop_remote_worker_execution_loop_async()
                 await self._request_tracker.wait_for_new_requests()
+                if self._stop_requested:
+                    raise asyncio.CancelledError
                 logger.debug("Got new requests!")
                 requests_in_progress = [
                     asyncio.create_task(self.engine_step(ve))
@@ -694,7 +749,9 @@ class AsyncLLMEngine:
         session_id: Optional[str] = None,
         session_reuse: Optional[int] = -1,
         rounds: Optional[float] = -1,
-        default_config: Optional[AgentConfig] = None
+        default_config: Optional[AgentConfig] = None,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> AsyncStream:
         if not self.is_running:
             if self.start_engine_loop:
@@ -721,7 +778,9 @@ class AsyncLLMEngine:
             session_id = session_id,
             session_reuse = session_reuse,
             rounds=rounds,
-            default_config=default_config)
+            default_config=default_config,
+            priority=priority,
+            slo=slo)
 
         return stream
 
@@ -736,7 +795,9 @@ class AsyncLLMEngine:
         session_id: Optional[str] = None,
         session_reuse: Optional[int] = -1,
         rounds: Optional[float] = -1,
-        default_config: Optional[AgentConfig] = None
+        default_config: Optional[AgentConfig] = None,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> AsyncIterator[RequestOutput]:
         """Generate outputs for a request.
 
@@ -754,6 +815,10 @@ class AsyncLLMEngine:
             trace_headers: OpenTelemetry trace headers.
             prompt_adapter_request: Prompt Adapter request to use 
                                             for generation, if any.
+            priority: The priority of the request, for the priority
+                scheduling policy. Higher values are scheduled first.
+            slo: The latency objectives of the request, for the EDF
+                scheduling policy.
 
         Yields:
             The output `RequestOutput` objects from the LLMEngine
@@ -812,7 +877,9 @@ class AsyncLLMEngine:
                 session_id=session_id,
                 session_reuse=session_reuse,
                 rounds = rounds,
-                default_config = default_config
+                default_config = default_config,
+                priority=priority,
+                slo=slo,
         ):
             yield LLMEngine.validate_output(output, RequestOutput)
 
@@ -821,6 +888,66 @@ class AsyncLLMEngine:
             session_id: str
     ):
         self.engine.free_session(session_id)
+
+    async def list_sessions(self, prefix: str = "") -> List[Dict[str, Any]]:
+        """Describe the known sessions whose id starts with `prefix`."""
+        if self.engine_use_ray:
+            return await self.engine.list_sessions.remote(  # type: ignore
+                prefix)
+        else:
+            return self.engine.list_sessions(prefix)
+
+    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Describe a known session, or return None."""
+        if self.engine_use_ray:
+            return await self.engine.get_session.remote(  # type: ignore
+                session_id)
+        else:
+            return self.engine.get_session(session_id)
+
+    async def fork_session(self, src_session_id: str,
+                           dst_session_id: str) -> bool:
+        """Start a session from the preserved KV of another, sharing its
+        blocks copy-on-write."""
+        if self.engine_use_ray:
+            return await self.engine.fork_session.remote(  # type: ignore
+                src_session_id, dst_session_id)
+        else:
+            return self.engine.fork_session(src_session_id, dst_session_id)
+
+    async def pin_session(self, session_id: str, pinned: bool = True) -> None:
+        """Pin or unpin the preserved KV of a session."""
+        if self.engine_use_ray:
+            await self.engine.pin_session.remote(  # type: ignore
+                session_id, pinned)
+        else:
+            self.engine.pin_session(session_id, pinned)
+
+    async def set_session_priority(self, session_id: str,
+                                   priority: float) -> None:
+        """Set the eviction priority of a session."""
+        if self.engine_use_ray:
+            await self.engine.set_session_priority.remote(  # type: ignore
+                session_id, priority)
+        else:
+            self.engine.set_session_priority(session_id, priority)
+
+    async def free_sessions(self, prefix: str) -> List[str]:
+        """Free every session whose id starts with `prefix`."""
+        if self.engine_use_ray:
+            return await self.engine.free_sessions.remote(  # type: ignore
+                prefix)
+        else:
+            return self.engine.free_sessions(prefix)
+
+    async def save_sessions(self, path: Optional[str] = None) -> int:
+        """Save the preserved sessions and their KV, to be restored after a
+        restart."""
+        if self.engine_use_ray:
+            return await self.engine.save_sessions.remote(  # type: ignore
+                path)
+        else:
+            return self.engine.save_sessions(path)
     
     async def encode(
         self,
@@ -911,7 +1038,9 @@ class AsyncLLMEngine:
         session_id: Optional[str] = None,
         session_reuse: Optional[int] = -1,
         rounds: Optional[float] = -1,
-        default_config: Optional[AgentConfig] = None
+        default_config: Optional[AgentConfig] = None,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> AsyncIterator[Union[RequestOutput, EmbeddingRequestOutput]]:
         """Common logic to process requests with SamplingParams or
         PoolingParams."""
@@ -928,7 +1057,9 @@ class AsyncLLMEngine:
             session_id = session_id,
             session_reuse = session_reuse,
             rounds=rounds,
-            default_config=default_config
+            default_config=default_config,
+            priority=priority,
+            slo=slo,
         )
 
         try:
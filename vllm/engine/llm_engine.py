@@ -1,10 +1,13 @@
+import copy
+import math
 import time
 from contextlib import contextmanager
 from typing import (TYPE_CHECKING, Any, ClassVar, Dict, Iterable, List,
                     Mapping, Optional)
 from typing import Sequence as GenericSequence
-from typing import Set, Type, TypeVar, Union
+from typing import Set, Tuple, Type, TypeVar, Union
 
+import numpy as np
 from transformers import PreTrainedTokenizer
 
 from vllm.entrypoints.openai.protocol import AgentConfig
@@ -31,12 +34,21 @@ from vllm.lora.request import LoRARequest
 from vllm.outputs import (EmbeddingRequestOutput, RequestOutput,
                           RequestOutputFactory)
 from vllm.pooling_params import PoolingParams
+from vllm.preserve.arrival import ArrivalEstimatorFactory
+from vllm.preserve.eviction import (PreservedSessions,
+                                    SessionEvictionPolicyFactory)
+from vllm.preserve.persist import (PersistedSession, has_manifest,
+                                   load_manifest, remove_manifest,
+                                   save_manifest)
+from vllm.preserve.reaper import SessionReaper
+from vllm.preserve.registry import SessionRegistry
+from vllm.preserve.routing import SessionRouter
 from vllm.preserve.session_config import SessionConfig
 from vllm.prompt_adapter.request import PromptAdapterRequest
 from vllm.sampling_params import SamplingParams
 from vllm.sequence import (EmbeddingSequenceGroupOutput, ExecuteModelRequest,
-                           PoolerOutput, SamplerOutput, Sequence,
-                           SequenceGroup, SequenceGroupMetadata,
+                           PoolerOutput, RequestSLO, SamplerOutput,
+                           Sequence, SequenceGroup, SequenceGroupMetadata,
                            SequenceStatus)
 from vllm.tracing import (SpanAttributes, SpanKind, extract_trace_context,
                           init_tracer)
@@ -46,12 +58,14 @@ from vllm.transformers_utils.tokenizer_group import (BaseTokenizerGroup,
                                                      get_tokenizer_group)
 from vllm.usage.usage_lib import (UsageContext, is_usage_stats_enabled,
                                   usage_message)
-from vllm.utils import Counter
+from vllm.utils import Counter, Device
+from vllm.worker.cache_engine import CacheEngine
 from vllm.version import __version__ as VLLM_VERSION
-from vllm.preserve.preserve import sum_sps
+from vllm.preserve.preserve import SessionForecaster, get_session_reuse
 
 logger = init_logger(__name__)
 _LOCAL_LOGGING_INTERVAL_SEC = 5
+_SESSION_REAP_INTERVAL_SEC = 1
 
 
 def _load_generation_config_dict(model_config: ModelConfig) -> Dict[str, Any]:
@@ -264,11 +278,19 @@ class LLMEngine:
             prompt_adapter_config=prompt_adapter_config,
         )
         
-        self.metrics_1 = []
-        self.metrics_2 = []
-        
-        self.session_configs: Dict[str, SessionConfig] = {}
-        self.gpu_cache_guess: List[(float, float)] = []
+        # Session stats since they were last logged, only collected when
+        # logging stats.
+        self._session_reused_tokens: List[int] = []
+        self._session_evictions: Dict[str, int] = {}
+
+        self.session_registry = SessionRegistry()
+        self.session_forecaster = SessionForecaster(
+            self.model_config.max_model_len,
+            resolution=8 * self.cache_config.block_size)
+        self.session_arrival_estimator = (
+            ArrivalEstimatorFactory.get_estimator(
+                self.scheduler_config.session_arrival_estimator))
+        self.gpu_cache_guess: List[Tuple[float, float]] = []
 
         self.time_lr = time_lr
 
@@ -326,8 +348,27 @@ class LLMEngine:
             for _ in range(parallel_config.pipeline_parallel_size)
         ]
 
-        self.session_id_blocks = [{} for _ in range(parallel_config.pipeline_parallel_size)]
-        self.session_id_arrived = [{} for _ in range(parallel_config.pipeline_parallel_size)]
+        # Preserved sessions of each virtual engine: idle ones, and the ones
+        # whose next turn is waiting to be scheduled.
+        session_eviction_policy = SessionEvictionPolicyFactory.get_policy(
+            scheduler_config.session_eviction_policy)
+        self.session_id_blocks = [
+            PreservedSessions(session_eviction_policy,
+                              self.session_registry.configs,
+                              scheduler.get_num_retained_tokens,
+                              self.session_registry)
+            for scheduler in self.scheduler
+        ]
+        self.session_id_arrived = [
+            PreservedSessions(session_eviction_policy,
+                              self.session_registry.configs,
+                              scheduler.get_num_retained_tokens,
+                              self.session_registry)
+            for scheduler in self.scheduler
+        ]
+        self.session_router = SessionRouter()
+        self.session_reaper = SessionReaper(scheduler_config.session_ttl)
+        self._next_session_reap_time = 0.0
 
         # Metric Logging.
         if self.log_stats:
@@ -368,11 +409,20 @@ class LLMEngine:
                 ),
             ))
 
+        # Bring back the sessions saved when the last server shut down.
+        session_persist_path = self.cache_config.session_persist_path
+        if (session_persist_path is not None
+                and not self.model_config.embedding_mode
+                and has_manifest(session_persist_path)):
+            self.restore_sessions(session_persist_path)
+
     def _initialize_kv_caches(self) -> None:
         """Initialize the KV cache in the worker(s).
 
         The workers will determine the number of blocks in both the GPU cache
-        and the swap CPU cache.
+        and the swap CPU cache. The disk swap space is split into blocks of
+        the same size, and the compressed KV space into blocks of the
+        compressed size.
         """
         num_gpu_blocks, num_cpu_blocks = (
             self.model_executor.determine_num_available_blocks())
@@ -387,6 +437,12 @@ class LLMEngine:
 
         self.cache_config.num_gpu_blocks = num_gpu_blocks
         self.cache_config.num_cpu_blocks = num_cpu_blocks
+        self.cache_config.num_disk_blocks = CacheEngine.get_num_disk_blocks(
+            self.cache_config, self.model_config, self.parallel_config)
+        self.cache_config.num_compressed_blocks = (
+            CacheEngine.get_num_compressed_blocks(self.cache_config,
+                                                  self.model_config,
+                                                  self.parallel_config))
 
         self.model_executor.initialize_cache(num_gpu_blocks, num_cpu_blocks)
 
@@ -400,8 +456,298 @@ class LLMEngine:
             if session_id in session_id_arrived:
                 scheduler.free_seq_id(session_id_arrived[session_id])
                 del session_id_arrived[session_id]
-        if session_id in self.session_configs:
-            del self.session_configs[session_id]
+        self.session_registry.remove(session_id)
+        self.session_forecaster.remove(session_id)
+        self.session_arrival_estimator.remove(session_id)
+        self.session_reaper.discard(session_id)
+
+    def free_sessions(self, prefix: str) -> List[str]:
+        """Free every session whose id starts with `prefix`, pinned or
+        not. Returns the ids of the freed sessions."""
+        session_ids = self.session_registry.with_prefix(prefix)
+        for session_id in session_ids:
+            self.free_session(session_id)
+        return session_ids
+
+    def fork_session(self, src_session_id: str, dst_session_id: str) -> bool:
+        """Start session `dst_session_id` from the preserved KV of the idle
+        session `src_session_id`, e.g. for the branches of an agent.
+
+        The new session shares the physical blocks of the source copy-on-
+        write, so N branches only prefill their N suffixes. It inherits the
+        forecast and the eviction priority of the source.
+
+        Returns False if the source has no preserved blocks to share.
+        """
+        if any(dst_session_id in preserved_sessions
+               for preserved_sessions in (self.session_id_blocks +
+                                          self.session_id_arrived)):
+            raise ValueError(f"Session {dst_session_id} already exists.")
+        for scheduler, session_id_block in zip(self.scheduler,
+                                               self.session_id_blocks):
+            if src_session_id not in session_id_block:
+                continue
+            src_seq_id = session_id_block[src_session_id]
+            if scheduler.get_num_seq_id_blocks(src_seq_id) == 0:
+                return False
+            dst_seq_id = next(self.seq_counter)
+            scheduler.fork_seq_id(src_seq_id, dst_seq_id)
+
+            src_info = self.session_registry.get_or_create(src_session_id)
+            dst_info = self.session_registry.get_or_create(dst_session_id)
+            dst_info.config = copy.copy(src_info.config)
+            dst_info.priority = src_info.priority
+            dst_info.last_seen = time.time()
+            if dst_info.config is not None:
+                self.session_forecaster.update(dst_session_id,
+                                               dst_info.config)
+            session_id_block[dst_session_id] = dst_seq_id
+            self.session_reaper.touch(dst_session_id, dst_info.last_seen)
+            return True
+        return False
+
+    def pin_session(self, session_id: str, pinned: bool = True) -> None:
+        """Pin a session, so that its preserved KV is never evicted, or
+        unpin it. The session may be pinned before its first turn."""
+        self.session_registry.get_or_create(session_id).pinned = pinned
+
+    def set_session_priority(self, session_id: str, priority: float) -> None:
+        """Set the eviction priority of a session. Sessions with a lower
+        priority are evicted first, whatever the eviction policy."""
+        self.session_registry.get_or_create(session_id).priority = priority
+        for preserved_sessions in (self.session_id_blocks +
+                                   self.session_id_arrived):
+            if session_id in preserved_sessions:
+                preserved_sessions.refresh(session_id)
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Describe a known session, or return None."""
+        info = self.session_registry.get(session_id)
+        if info is None:
+            return None
+        state = "active"
+        virtual_engine: Optional[int] = None
+        num_retained_blocks = 0
+        for idx, (session_id_block, session_id_arrived) in enumerate(
+                zip(self.session_id_blocks, self.session_id_arrived)):
+            for preserved_sessions, preserved_state in (
+                (session_id_block, "idle"), (session_id_arrived, "arrived")):
+                if session_id in preserved_sessions:
+                    state = preserved_state
+                    virtual_engine = idx
+                    num_retained_blocks = self.scheduler[
+                        idx].get_num_seq_id_blocks(
+                            preserved_sessions[session_id])
+        return {
+            "session_id": session_id,
+            "state": state,
+            "virtual_engine": virtual_engine,
+            "num_retained_blocks": num_retained_blocks,
+            "num_reused_tokens": info.num_reused_tokens,
+            "num_turns": info.num_turns,
+            "last_seen": info.last_seen,
+            "pinned": info.pinned,
+            "priority": info.priority,
+        }
+
+    def get_arrival_probs(self,
+                          horizon: float,
+                          now: Optional[float] = None) -> Dict[str, float]:
+        """Return the probability that the next turn of every idle session
+        arrives within `horizon` seconds."""
+        if now is None:
+            now = time.time()
+        arrival_probs: Dict[str, float] = {}
+        for session_id_block in self.session_id_blocks:
+            for session_id in session_id_block:
+                info = self.session_registry.get(session_id)
+                if info is not None and info.config is not None:
+                    arrival_probs[session_id] = (
+                        info.config.get_arrival_prob(now, horizon))
+        return arrival_probs
+
+    def list_sessions(self, prefix: str = "") -> List[Dict[str, Any]]:
+        """Describe the known sessions whose id starts with `prefix`, in
+        id order."""
+        sessions: List[Dict[str, Any]] = []
+        for session_id in self.session_registry.with_prefix(prefix):
+            session = self.get_session(session_id)
+            if session is not None:
+                sessions.append(session)
+        return sessions
+
+    def save_sessions(self, path: Optional[str] = None) -> int:
+        """Save the preserved sessions, their forecasts and the KV of their
+        retained blocks to `path`, by default the session persist path, for
+        `restore_sessions` to bring them back after a restart.
+
+        Blocks on CPU, disk or in the compressed cache are saved too. This
+        must not run concurrently with a step, e.g. it runs on shutdown.
+        Returns the number of saved sessions.
+        """
+        if path is None:
+            path = self.cache_config.session_persist_path
+        if path is None:
+            raise ValueError("No session persist path is set.")
+        # The blocks shared by several sessions are saved once.
+        file_block_numbers: Dict[Tuple[int, Device, int], int] = {}
+        blocks_to_save: List[Tuple[int, Device, int, int]] = []
+        sessions: List[PersistedSession] = []
+        for virtual_engine, scheduler in enumerate(self.scheduler):
+            for preserved_sessions in (
+                    self.session_id_blocks[virtual_engine],
+                    self.session_id_arrived[virtual_engine]):
+                for session_id, seq_id in preserved_sessions.items():
+                    info = self.session_registry.get(session_id)
+                    device = scheduler.get_seq_id_device(seq_id)
+                    token_ids = scheduler.get_retained_token_ids(seq_id)
+                    if info is None or device is None or token_ids is None:
+                        continue
+                    block_numbers: List[int] = []
+                    for block_number in scheduler.get_seq_id_block_numbers(
+                            seq_id):
+                        key = (virtual_engine, device, block_number)
+                        if key not in file_block_numbers:
+                            file_block_numbers[key] = len(file_block_numbers)
+                            blocks_to_save.append(
+                                key + (file_block_numbers[key], ))
+                        block_numbers.append(file_block_numbers[key])
+                    sessions.append(
+                        PersistedSession(info, virtual_engine, block_numbers,
+                                         token_ids))
+
+        # Sessions saved before are invalid once their blocks are
+        # overwritten.
+        remove_manifest(path)
+        if blocks_to_save:
+            self.model_executor.save_kv_cache(path, len(file_block_numbers),
+                                              blocks_to_save)
+        save_manifest(path, self._get_session_persist_metadata(),
+                      len(file_block_numbers), sessions)
+        logger.info("Saved %d sessions (%d blocks) to %s", len(sessions),
+                    len(file_block_numbers), path)
+        return len(sessions)
+
+    def restore_sessions(self, path: Optional[str] = None) -> int:
+        """Restore the sessions saved by `save_sessions` as idle sessions
+        whose retained blocks are on GPU.
+
+        Pinned sessions, then those with a higher priority, then the most
+        recent ones are restored first, until the GPU blocks run out.
+        Returns the number of restored sessions.
+        """
+        if path is None:
+            path = self.cache_config.session_persist_path
+        if path is None:
+            raise ValueError("No session persist path is set.")
+        num_blocks, sessions = load_manifest(
+            path, self._get_session_persist_metadata())
+        sessions.sort(key=lambda session: (session.info.pinned, session.info.
+                                           priority, session.info.last_seen),
+                      reverse=True)
+        now = time.time()
+        blocks_to_load: List[Tuple[int, int, int]] = []
+        num_restored = 0
+        for session in sessions:
+            session_id = session.info.session_id
+            if session_id in self.session_registry:
+                continue
+            virtual_engine = session.virtual_engine % len(self.scheduler)
+            seq_id = next(self.seq_counter)
+            mapping = self.scheduler[virtual_engine].restore_seq_id(
+                seq_id, session.block_numbers, session.token_ids)
+            if mapping is None:
+                continue
+            blocks_to_load.extend((virtual_engine, src_block, dst_block)
+                                  for src_block, dst_block in mapping)
+            self.session_registry.add(session.info)
+            if session.info.config is not None:
+                self.session_forecaster.update(session_id,
+                                               session.info.config)
+            self.session_id_blocks[virtual_engine][session_id] = seq_id
+            # The downtime does not count toward the TTL.
+            self.session_reaper.touch(session_id, now)
+            num_restored += 1
+
+        if blocks_to_load:
+            self.model_executor.load_kv_cache(path, num_blocks,
+                                              blocks_to_load)
+        logger.info("Restored %d of %d sessions (%d blocks) from %s",
+                    num_restored, len(sessions), len(blocks_to_load), path)
+        return num_restored
+
+    def _get_session_persist_metadata(self) -> Dict[str, Any]:
+        """What the saved blocks depend on."""
+        return {
+            "model": self.model_config.model,
+            "revision": self.model_config.revision,
+            "dtype": str(self.model_config.dtype),
+            "cache_dtype": self.cache_config.cache_dtype,
+            "block_size": self.cache_config.block_size,
+            "tensor_parallel_size": self.parallel_config.tensor_parallel_size,
+            "pipeline_parallel_size":
+            self.parallel_config.pipeline_parallel_size,
+        }
+
+    def reap_sessions(self, now: Optional[float] = None) -> List[str]:
+        """Free the sessions idle for longer than the session TTL, then the
+        preserved blocks of the idle sessions ranked last by the eviction
+        policy until they fit in `max_preserved_blocks`.
+
+        Returns the ids of the expired sessions.
+        """
+        if now is None:
+            now = time.time()
+        self._next_session_reap_time = now + _SESSION_REAP_INTERVAL_SEC
+        expired = []
+        for session_id in self.session_reaper.pop_expired(now):
+            if self.session_registry.is_pinned(session_id):
+                # Pinned sessions do not expire; check on them again later.
+                self.session_reaper.touch(session_id, now)
+                continue
+            expired.append(session_id)
+            if any(session_id in session_id_block
+                   for session_id_block in self.session_id_blocks):
+                self._record_session_eviction("ttl")
+            self.free_session(session_id)
+
+        max_preserved_blocks = self.scheduler_config.max_preserved_blocks
+        if max_preserved_blocks is None:
+            return expired
+        # Every virtual engine owns an equal share of the budget.
+        max_preserved_blocks //= len(self.scheduler)
+        for scheduler, session_id_block in zip(self.scheduler,
+                                               self.session_id_blocks):
+            num_preserved_blocks = sum(
+                scheduler.get_num_seq_id_blocks(seq_id)
+                for seq_id in session_id_block.values())
+            while num_preserved_blocks > max_preserved_blocks:
+                victim = session_id_block.select_victim(now=now)
+                if victim is None:
+                    break
+                seq_id = session_id_block.pop(victim)
+                num_preserved_blocks -= scheduler.get_num_seq_id_blocks(seq_id)
+                scheduler.free_seq_id(seq_id)
+                self._record_session_eviction("budget")
+        return expired
+
+    def _record_session_eviction(self, reason: str, count: int = 1) -> None:
+        if self.log_stats and count > 0:
+            self._session_evictions[reason] = (
+                self._session_evictions.get(reason, 0) + count)
+
+    def _reserve_session_blocks(self) -> None:
+        """Reserve on every scheduler the GPU blocks that the forecast
+        expects returning sessions to need within the admission horizon."""
+        horizon = self.scheduler_config.session_admission_horizon
+        if horizon <= 0:
+            return
+        growth = self.session_forecaster.get_max_growth(time.time(), horizon)
+        # Every virtual engine owns an equal share of the GPU blocks.
+        num_blocks = math.ceil(
+            growth / self.cache_config.block_size / len(self.scheduler))
+        for scheduler in self.scheduler:
+            scheduler.reserve_session_blocks(num_blocks)
 
     @classmethod
     def _get_executor_cls(cls,
@@ -554,21 +900,15 @@ class LLMEngine:
         session_id: Optional[str] = None,
         session_reuse: Optional[int] = -1,
         rounds: Optional[float] = -1,
-        default_config: Optional[AgentConfig] = None
+        default_config: Optional[AgentConfig] = None,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> None:
         # Create the sequences.
         block_size = self.cache_config.block_size
         seq_id = next(self.seq_counter)
         eos_token_id = self._get_eos_token_id(lora_request)
 
-        if session_id:
-            if session_id in self.session_configs:
-                self.session_configs[session_id].update(len(processed_inputs["prompt_token_ids"]), arrival_time, session_reuse, rounds)
-            else:
-                assert default_config is not None, "default_config must be provided for new session"
-                self.session_configs[session_id] = SessionConfig(default_config.ip, default_config.p, 
-                                                                 len(processed_inputs["prompt_token_ids"]), default_config.tau, arrival_time, rounds)
-
         seq = Sequence(seq_id, processed_inputs, block_size, eos_token_id,
                        lora_request, prompt_adapter_request)
 
@@ -583,7 +923,9 @@ class LLMEngine:
                 trace_headers=trace_headers,
                 prompt_adapter_request=prompt_adapter_request,
                 session_id=session_id,
-                session_reuse=session_reuse)
+                session_reuse=session_reuse,
+                priority=priority,
+                slo=slo)
         elif isinstance(params, PoolingParams):
             seq_group = self._create_sequence_group_with_pooling(
                 request_id,
@@ -593,34 +935,106 @@ class LLMEngine:
                 lora_request=lora_request,
                 prompt_adapter_request=prompt_adapter_request,
                 session_id=session_id,
-                session_reuse=session_reuse)
+                session_reuse=session_reuse,
+                priority=priority,
+                slo=slo)
         else:
             raise ValueError(
                 "Either SamplingParams or PoolingParams must be provided.")
         
-        preferred_scheduler = None
         costs = [
                 scheduler.get_num_unfinished_seq_groups()
                 for scheduler in self.scheduler
             ]
-        min_cost = min(costs)
-        preferred_scheduler = costs.index(min_cost)
+        prompt_token_ids = processed_inputs["prompt_token_ids"]
+        preferred_scheduler = self.session_router.route(
+            costs, len(prompt_token_ids))
 
         if session_id is not None:
+            self.session_reaper.discard(session_id)
+            reused_tokens = 0
+            session_info = self.session_registry.get_or_create(session_id)
             for idx, session_id_block in enumerate(self.session_id_blocks):
                 if session_id in session_id_block:
-                    if costs[idx]<=min_cost*2+1:
-                        preferred_scheduler = idx
-                        seq_group.computed_block_seq = session_id_block.pop(session_id)
-                        self.session_id_arrived[preferred_scheduler] = {session_id:seq_group.computed_block_seq, **self.session_id_arrived[preferred_scheduler]}
+                    seq_id = session_id_block.pop(session_id)
+                    reused_tokens = self._get_session_reuse(
+                        self.scheduler[idx], seq_id, prompt_token_ids,
+                        session_reuse)
+                    session_info.observe_reuse(
+                        self.scheduler[idx].get_num_retained_tokens(seq_id),
+                        reused_tokens)
+                    preferred_scheduler = self.session_router.route(
+                        costs, len(prompt_token_ids), idx, reused_tokens)
+                    if (preferred_scheduler != idx
+                            and not self._migrate_session(
+                                seq_id, idx, preferred_scheduler,
+                                reused_tokens)):
+                        self.scheduler[idx].free_seq_id(seq_id)
+                        self._record_session_eviction("reroute")
+                        reused_tokens = 0
                     else:
-                        self.scheduler[idx].free_seq_id(session_id_block[session_id])
-                        del session_id_block[session_id]
+                        seq_group.computed_block_seq = seq_id
+                        self.session_id_arrived[preferred_scheduler][
+                            session_id] = seq_id
                     break
-        
+            seq_group.session_reuse = reused_tokens
+            if self.log_stats:
+                self._session_reused_tokens.append(reused_tokens)
+
+            session_info.last_seen = arrival_time
+            session_info.num_turns += 1
+            session_info.num_reused_tokens = reused_tokens
+            session_info.num_prompt_tokens = len(prompt_token_ids)
+            if session_info.config is not None:
+                self.session_arrival_estimator.observe(
+                    session_id, session_info.config, len(prompt_token_ids),
+                    arrival_time, reused_tokens, rounds)
+            else:
+                assert default_config is not None, (
+                    "default_config must be provided for new session")
+                session_info.config = SessionConfig(
+                    default_config.ip, default_config.p,
+                    len(prompt_token_ids), default_config.tau, arrival_time,
+                    rounds)
+                self.session_arrival_estimator.start(session_id,
+                                                     session_info.config)
+            self.session_forecaster.update(session_id, session_info.config)
+
         min_cost_scheduler = self.scheduler[preferred_scheduler]
         min_cost_scheduler.add_seq_group(seq_group)
 
+    def _migrate_session(self, seq_id: int, src: int, dst: int,
+                         reused_tokens: int) -> bool:
+        """Move the reused blocks retained for `seq_id` from the scheduler
+        of virtual engine `src` to that of `dst`.
+
+        The source blocks are freed once the step of `dst` that copies them
+        has run. Returns False if the blocks are not on GPU or do not fit.
+        """
+        num_blocks = reused_tokens // self.cache_config.block_size
+        src_block_numbers = self.scheduler[
+            src].get_seq_id_gpu_block_numbers(seq_id, num_blocks)
+        if not src_block_numbers:
+            return False
+        token_ids = self.scheduler[src].get_retained_token_ids(seq_id)
+        return self.scheduler[dst].migrate_in_seq_id(seq_id, src,
+                                                     src_block_numbers,
+                                                     token_ids)
+
+    def _free_migrated_sessions(
+            self, scheduler_outputs: SchedulerOutputs) -> None:
+        for src, seq_id in scheduler_outputs.migrated_seq_ids:
+            self.scheduler[src].free_seq_id(seq_id)
+
+    @staticmethod
+    def _get_session_reuse(scheduler: Scheduler, seq_id: int,
+                           prompt_token_ids: List[int],
+                           session_reuse: Optional[int]) -> int:
+        """Get the number of prompt tokens whose KV can be reused from the
+        blocks retained for `seq_id`. See `get_session_reuse`."""
+        return get_session_reuse(scheduler.get_retained_token_ids(seq_id),
+                                 prompt_token_ids, session_reuse)
+
     def stop_remote_worker_execution_loop(self) -> None:
         self.model_executor.stop_remote_worker_execution_loop()
 
@@ -667,7 +1081,9 @@ class LLMEngine:
         session_id: Optional[str] = None,
         session_reuse: Optional[int] = -1,
         rounds: Optional[float] = -1,
-        default_config: Optional[AgentConfig] = None
+        default_config: Optional[AgentConfig] = None,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> None:
         """Add a request to the engine's request pool.
 
@@ -686,6 +1102,10 @@ class LLMEngine:
             arrival_time: The arrival time of the request. If None, we use
                 the current monotonic time.
             trace_headers: OpenTelemetry trace headers.
+            priority: The priority of the request, for the priority
+                scheduling policy. Higher values are scheduled first.
+            slo: The latency objectives of the request, for the EDF
+                scheduling policy.
 
         Details:
             - Set arrival_time to the current time if it is None.
@@ -734,7 +1154,9 @@ class LLMEngine:
             session_id=session_id,
             session_reuse=session_reuse,
             rounds=rounds,
-            default_config=default_config
+            default_config=default_config,
+            priority=priority,
+            slo=slo,
         )
 
     def _create_sequence_group_with_sampling(
@@ -747,7 +1169,9 @@ class LLMEngine:
         trace_headers: Optional[Mapping[str, str]] = None,
         prompt_adapter_request: Optional[PromptAdapterRequest] = None,
         session_id: str = None,
-        session_reuse: int = -1
+        session_reuse: int = -1,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> SequenceGroup:
         """Creates a SequenceGroup with SamplingParams."""
         max_logprobs = self.get_model_config().max_logprobs
@@ -775,8 +1199,9 @@ class LLMEngine:
             trace_headers=trace_headers,
             prompt_adapter_request=prompt_adapter_request,
             session_id=session_id,
-            session_reuse=session_reuse
-            )
+            session_reuse=session_reuse,
+            priority=priority,
+            slo=slo)
 
         return seq_group
 
@@ -789,7 +1214,9 @@ class LLMEngine:
         lora_request: Optional[LoRARequest],
         prompt_adapter_request: Optional[PromptAdapterRequest],
         session_id: Optional[str] = None,
-        session_reuse: Optional[int] = -1
+        session_reuse: Optional[int] = -1,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> SequenceGroup:
         """Creates a SequenceGroup with PoolingParams."""
         # Defensive copy of PoolingParams, which are used by the pooler
@@ -803,7 +1230,9 @@ class LLMEngine:
             pooling_params=pooling_params,
             prompt_adapter_request=prompt_adapter_request,
             session_id=session_id,
-            session_reuse=session_reuse)
+            session_reuse=session_reuse,
+            priority=priority,
+            slo=slo)
         return seq_group
 
     def abort_request(self, request_id: Union[str, Iterable[str]], is_exception:bool=True) -> None:
@@ -899,6 +1328,17 @@ class LLMEngine:
 
         for idx, scheduler in enumerate(self.scheduler):
             session_id_block = scheduler.free_finished_seq_groups()
+            for session_id, seq_id in list(session_id_block.items()):
+                session_info = self.session_registry.get_or_create(session_id)
+                session_info.last_seen = now
+                # Keep only the prefix the next turn is expected to reuse.
+                num_reusable_tokens = session_info.get_num_reusable_tokens(
+                    scheduler.get_num_retained_tokens(seq_id))
+                if scheduler.trim_seq_id(seq_id, num_reusable_tokens) == 0:
+                    scheduler.free_seq_id(seq_id)
+                    del session_id_block[session_id]
+                    continue
+                self.session_reaper.touch(session_id, now)
             self.session_id_blocks[idx].update(session_id_block)
             # if len(session_id_blockprint(self.session_id_blocks[idx], session_id_block)
         
@@ -970,6 +1410,9 @@ class LLMEngine:
             raise NotImplementedError(
                 "Pipeline parallelism is only supported through AsyncLLMEngine "
                 "as performance will be severely degraded otherwise.")
+        if time.time() >= self._next_session_reap_time:
+            self.reap_sessions()
+        self._reserve_session_blocks()
         seq_group_metadata_list, scheduler_outputs = self.scheduler[
             0].schedule(self.session_id_blocks[0], self.session_id_arrived[0])
 
@@ -980,12 +1423,18 @@ class LLMEngine:
                 seq_group_metadata_list=seq_group_metadata_list,
                 blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
                 blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
+                blocks_to_disk_out=scheduler_outputs.blocks_to_disk_out,
+                blocks_to_disk_in=scheduler_outputs.blocks_to_disk_in,
+                blocks_to_compress=scheduler_outputs.blocks_to_compress,
+                blocks_to_decompress=scheduler_outputs.blocks_to_decompress,
+                blocks_to_migrate=scheduler_outputs.blocks_to_migrate,
                 blocks_to_copy=scheduler_outputs.blocks_to_copy,
                 num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
                 running_queue_size=scheduler_outputs.running_queue_size,
                 finished_requests_ids=finished_requests_ids)
             output = self.model_executor.execute_model(
                 execute_model_req=execute_model_req)
+            self._free_migrated_sessions(scheduler_outputs)
         else:
             output = []
 
@@ -1061,12 +1510,17 @@ class LLMEngine:
                 for scheduler in self.scheduler)
             real_gpu_cache_usage_sys = 1.0 - (num_free_gpu / num_total_gpu)
         
-        current_time = round(time.time(), 2)
-        gpu_cache_guess = sum_sps(self.session_configs.values(), self.model_config.max_model_len, current_time, num_total_gpu)
-        # delta = num_total_gpu * real_gpu_cache_usage_sys * 16 - gpu_cache_guess[0][1]
-        # print("gpu_cache_guess", gpu_cache_guess, "real gpu", num_total_gpu * real_gpu_cache_usage_sys * 16, "time", current_time)
-        import math
-        self.gpu_cache_guess = [(time, usage + delta * math.exp((current_time - time) * self.time_lr)) for time, usage in gpu_cache_guess]
+        current_time = round(now, 2)
+        guess_times, guess_tokens = self.session_forecaster.forecast(
+            current_time)
+        if num_total_gpu is not None:
+            # Correct the forecast by its current error, fading out with time.
+            delta = (num_total_gpu * real_gpu_cache_usage_sys *
+                     self.cache_config.block_size - guess_tokens[0])
+            guess_tokens = guess_tokens + delta * np.exp(
+                (current_time - guess_times) * self.time_lr)
+        self.gpu_cache_guess = list(
+            zip(guess_times.tolist(), guess_tokens.tolist()))
         
         num_total_cpu = self.cache_config.num_cpu_blocks
         cpu_cache_usage_sys = 0.
@@ -1083,6 +1537,25 @@ class LLMEngine:
         time_per_output_tokens_iter: List[float] = []
         num_preemption_iter = (0 if scheduler_outputs is None else
                                scheduler_outputs.preempted)
+        time_to_first_tokens_session_iter: List[float] = []
+        time_to_first_tokens_non_session_iter: List[float] = []
+
+        # Session stats
+        num_preserved_blocks_sys = sum(
+            scheduler.get_num_seq_id_blocks(seq_id)
+            for scheduler, session_id_block, session_id_arrived in zip(
+                self.scheduler, self.session_id_blocks,
+                self.session_id_arrived)
+            for preserved in (session_id_block, session_id_arrived)
+            for seq_id in preserved.values())
+        self._record_session_eviction(
+            "memory",
+            sum(scheduler.get_and_reset_num_evicted_sessions()
+                for scheduler in self.scheduler))
+        session_reused_tokens_iter = self._session_reused_tokens
+        session_evictions_iter = self._session_evictions
+        self._session_reused_tokens = []
+        self._session_evictions = {}
 
         # Request stats
         #   Latency
@@ -1122,9 +1595,10 @@ class LLMEngine:
                         latency = seq_group.get_last_latency(now)
                         time_to_first_tokens_iter.append(latency)
                         if seq_group.session_id is None:
-                            self.metrics_1.append(latency)
+                            time_to_first_tokens_non_session_iter.append(
+                                latency)
                         else:
-                            self.metrics_2.append(latency)
+                            time_to_first_tokens_session_iter.append(latency)
 
                         # One generation token per finished prefill.
                         num_generation_tokens_from_prefill_groups += (
@@ -1206,6 +1680,14 @@ class LLMEngine:
             best_of_requests=best_of_requests,
             n_requests=n_requests,
             finished_reason_requests=finished_reason_requests,
+
+            # Session stats
+            num_preserved_blocks_sys=num_preserved_blocks_sys,
+            time_to_first_tokens_session_iter=time_to_first_tokens_session_iter,
+            time_to_first_tokens_non_session_iter=(
+                time_to_first_tokens_non_session_iter),
+            session_reused_tokens_iter=session_reused_tokens_iter,
+            session_evictions_iter=session_evictions_iter,
         )
 
     def add_lora(self, lora_request: LoRARequest) -> bool:
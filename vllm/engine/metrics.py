@@ -1,6 +1,6 @@
 import time
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
 from typing import Counter as CollectionsCounter
 from typing import Dict, List, Optional, Protocol, Union
@@ -30,6 +30,8 @@ prometheus_client.disable_created_metrics()
 # begin-metrics-definitions
 class Metrics:
     labelname_finish_reason = "finished_reason"
+    labelname_eviction_reason = "reason"
+    labelname_session = "session"
     _gauge_cls = prometheus_client.Gauge
     _counter_cls = prometheus_client.Counter
     _histogram_cls = prometheus_client.Histogram
@@ -133,6 +135,42 @@ class Metrics:
             documentation="Count of successfully processed requests.",
             labelnames=labelnames + [Metrics.labelname_finish_reason])
 
+        # Session stats
+        self.gauge_preserved_blocks = self._gauge_cls(
+            name="vllm:num_preserved_blocks",
+            documentation="Number of KV cache blocks, on any device, "
+            "preserved for sessions.",
+            labelnames=labelnames)
+        self.counter_session_turns = self._counter_cls(
+            name="vllm:session_turns_total",
+            documentation="Number of session turns.",
+            labelnames=labelnames)
+        self.counter_session_hits = self._counter_cls(
+            name="vllm:session_hits_total",
+            documentation="Number of session turns that reused the "
+            "preserved KV cache.",
+            labelnames=labelnames)
+        self.histogram_session_reused_tokens = self._histogram_cls(
+            name="vllm:session_reused_tokens",
+            documentation="Number of prompt tokens reused from the preserved "
+            "KV cache per session turn.",
+            labelnames=labelnames,
+            buckets=[0] + build_1_2_5_buckets(max_model_len))
+        self.counter_session_evictions = self._counter_cls(
+            name="vllm:session_evictions_total",
+            documentation="Number of sessions whose preserved KV cache was "
+            "freed before their next turn.",
+            labelnames=labelnames + [Metrics.labelname_eviction_reason])
+        self.histogram_session_time_to_first_token = self._histogram_cls(
+            name="vllm:session_time_to_first_token_seconds",
+            documentation="Histogram of time to first token in seconds, by "
+            "whether the request belongs to a session.",
+            labelnames=labelnames + [Metrics.labelname_session],
+            buckets=[
+                0.001, 0.005, 0.01, 0.02, 0.04, 0.06, 0.08, 0.1, 0.25, 0.5,
+                0.75, 1.0, 2.5, 5.0, 7.5, 10.0
+            ])
+
         # Speculatie decoding stats
         self.gauge_spec_decode_draft_acceptance_rate = self._gauge_cls(
             name="vllm:spec_decode_draft_acceptance_rate",
@@ -328,6 +366,17 @@ class Stats:
 
     spec_decode_metrics: Optional["SpecDecodeWorkerMetrics"] = None
 
+    # Session stats
+    num_preserved_blocks_sys: int = 0
+    time_to_first_tokens_session_iter: List[float] = field(
+        default_factory=list)
+    time_to_first_tokens_non_session_iter: List[float] = field(
+        default_factory=list)
+    #   Reused tokens of every session turn added since the last stats.
+    session_reused_tokens_iter: List[int] = field(default_factory=list)
+    #   Eviction reason -> number of sessions.
+    session_evictions_iter: Dict[str, int] = field(default_factory=dict)
+
 
 class SupportsMetricsInfo(Protocol):
 
@@ -521,6 +570,29 @@ class PrometheusStatLogger(StatLoggerBase):
         self._log_histogram(self.metrics.histogram_best_of_request,
                             stats.best_of_requests)
 
+        # Session data
+        self._log_gauge(self.metrics.gauge_preserved_blocks,
+                        stats.num_preserved_blocks_sys)
+        self._log_counter(self.metrics.counter_session_turns,
+                          len(stats.session_reused_tokens_iter))
+        self._log_counter(
+            self.metrics.counter_session_hits,
+            sum(1 for n in stats.session_reused_tokens_iter if n > 0))
+        self._log_histogram(self.metrics.histogram_session_reused_tokens,
+                            stats.session_reused_tokens_iter)
+        self._log_counter_labels(self.metrics.counter_session_evictions,
+                                 CollectionsCounter(
+                                     stats.session_evictions_iter),
+                                 Metrics.labelname_eviction_reason)
+        for session, time_to_first_tokens in (
+            ("true", stats.time_to_first_tokens_session_iter),
+            ("false", stats.time_to_first_tokens_non_session_iter)):
+            for datum in time_to_first_tokens:
+                self.metrics.histogram_session_time_to_first_token.labels(
+                    **{
+                        **self.labels, Metrics.labelname_session: session
+                    }).observe(datum)
+
     def _log_prometheus_interval(self, prompt_throughput: float,
                                  generation_throughput: float) -> None:
         # Logs metrics to prometheus that are computed every logging_interval.
@@ -65,9 +65,7 @@ async def generate(request: Request) -> Response:
     session_id = request_dict.pop("session_id", None)
     
     sampling_params = SamplingParams(**request_dict)
-    if sampling_params.n != 1 and session_id: # Sessionize only when 1 output needed
-        return Response(status_code=501, content="n!=1 not supported")
-    
+
     if request_stop:
         if result:=engine.remove_session(session_id) == True:
             return Response(status_code=200)
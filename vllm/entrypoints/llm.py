@@ -1,11 +1,13 @@
 from contextlib import contextmanager
-from typing import ClassVar, List, Optional, Sequence, Union, cast, overload
+from typing import (ClassVar, Iterator, List, Optional, Sequence, Union, cast,
+                    overload)
 
 from tqdm import tqdm
 from transformers import PreTrainedTokenizer, PreTrainedTokenizerFast
 
 from vllm.engine.arg_utils import EngineArgs
 from vllm.engine.llm_engine import LLMEngine
+from vllm.entrypoints.openai.protocol import AgentConfig
 from vllm.inputs import (PromptInputs, TextPrompt, TokensPrompt,
                          parse_and_batch_prompt)
 from vllm.logger import init_logger
@@ -16,7 +18,7 @@ from vllm.prompt_adapter.request import PromptAdapterRequest
 from vllm.sampling_params import SamplingParams
 from vllm.transformers_utils.tokenizer import get_cached_tokenizer
 from vllm.usage.usage_lib import UsageContext
-from vllm.utils import Counter, deprecate_kwargs
+from vllm.utils import Counter, deprecate_kwargs, random_uuid
 
 logger = init_logger(__name__)
 
@@ -93,6 +95,11 @@ class LLM:
     DEPRECATE_LEGACY: ClassVar[bool] = False
     """A flag to toggle whether to deprecate the legacy generate/encode API."""
 
+    DEFAULT_SESSION_CONFIG: ClassVar[AgentConfig] = AgentConfig(ip=-1,
+                                                                p=100,
+                                                                tau=2)
+    """The arrival forecast of a new session, as in the OpenAI server."""
+
     @classmethod
     @contextmanager
     def deprecate_legacy_api(cls):
@@ -244,6 +251,8 @@ class LLM:
                                         Sequence[SamplingParams]]] = None,
         use_tqdm: bool = True,
         lora_request: Optional[Union[List[LoRARequest], LoRARequest]] = None,
+        session_id: Optional[Union[str, Sequence[Optional[str]]]] = None,
+        priority: Optional[Sequence[float]] = None,
     ) -> List[RequestOutput]:
         ...
 
@@ -262,6 +271,8 @@ class LLM:
         use_tqdm: bool = True,
         lora_request: Optional[Union[List[LoRARequest], LoRARequest]] = None,
         prompt_adapter_request: Optional[PromptAdapterRequest] = None,
+        session_id: Optional[Union[str, Sequence[Optional[str]]]] = None,
+        priority: Optional[Sequence[float]] = None,
     ) -> List[RequestOutput]:
         """Generates the completions for the input prompts.
 
@@ -280,6 +291,14 @@ class LLM:
             lora_request: LoRA request to use for generation, if any.
             prompt_adapter_request: Prompt Adapter request to use for 
                 generation, if any.
+            session_id: The session of every prompt, if any. The KV of a
+                session is preserved when its request finishes, so that the
+                prompt of its next turn, passed to a later call, only
+                prefills what it adds. When it is a list, it is paired one by
+                one with the prompts and `None` entries have no session.
+            priority: The priority of every prompt, paired one by one with
+                the prompts. Only used by the priority scheduling policy,
+                which schedules higher values first.
 
         Returns:
             A list of `RequestOutput` objects containing the
@@ -311,11 +330,35 @@ class LLM:
             inputs=inputs,
             params=sampling_params,
             lora_request=lora_request,
-            prompt_adapter_request=prompt_adapter_request)
+            prompt_adapter_request=prompt_adapter_request,
+            session_id=session_id,
+            priority=priority)
 
         outputs = self._run_engine(use_tqdm=use_tqdm)
         return LLMEngine.validate_outputs(outputs, RequestOutput)
 
+    @contextmanager
+    def chat_session(
+            self,
+            session_id: Optional[str] = None) -> Iterator["ChatSession"]:
+        """Start a multi-turn conversation whose KV is preserved between
+        turns, and freed when the context exits.
+
+        Example:
+            >>> with llm.chat_session() as session:
+            ...     session.generate("What is the capital of France?")
+            ...     session.generate(" And of Italy?")
+        """
+        session = ChatSession(self, session_id or f"llm-{random_uuid()}")
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def free_session(self, session_id: str) -> None:
+        """Free the preserved KV of a session."""
+        self.llm_engine.free_session(session_id)
+
     @overload  # LEGACY: single (prompt + optional token ids)
     def encode(
         self,
@@ -508,6 +551,8 @@ class LLM:
                       Sequence[PoolingParams]],
         lora_request: Optional[Union[Sequence[LoRARequest], LoRARequest]],
         prompt_adapter_request: Optional[PromptAdapterRequest],
+        session_id: Optional[Union[str, Sequence[Optional[str]]]] = None,
+        priority: Optional[Sequence[float]] = None,
     ) -> None:
         if isinstance(inputs, (str, dict)):
             # Convert a single prompt to a list.
@@ -515,6 +560,20 @@ class LLM:
 
         num_requests = len(inputs)
 
+        if isinstance(session_id, str):
+            if num_requests != 1:
+                raise ValueError("A single session_id requires a single "
+                                 "prompt; pass one session_id per prompt.")
+            session_id = [session_id]
+        if session_id is not None:
+            if len(session_id) != num_requests:
+                raise ValueError("The lengths of prompts and session_id "
+                                 "must be the same.")
+            session_ids = [sid for sid in session_id if sid is not None]
+            if len(set(session_ids)) != len(session_ids):
+                raise ValueError("The turns of a session must be generated "
+                                 "one call after another.")
+
         if isinstance(params, list) and len(params) != num_requests:
             raise ValueError("The lengths of prompts and params "
                              "must be the same.")
@@ -522,6 +581,9 @@ class LLM:
                       list) and len(lora_request) != num_requests:
             raise ValueError("The lengths of prompts and lora_request "
                              "must be the same.")
+        if priority is not None and len(priority) != num_requests:
+            raise ValueError("The lengths of prompts and priority "
+                             "must be the same.")
 
         # Add requests to the engine.
         for i, request_inputs in enumerate(inputs):
@@ -530,7 +592,9 @@ class LLM:
                 params[i] if isinstance(params, Sequence) else params,
                 lora_request=lora_request[i] if isinstance(
                     lora_request, Sequence) else lora_request,
-                prompt_adapter_request=prompt_adapter_request)
+                prompt_adapter_request=prompt_adapter_request,
+                session_id=session_id[i] if session_id is not None else None,
+                priority=priority[i] if priority is not None else 0.0)
 
     def _add_request(
             self,
@@ -538,7 +602,9 @@ class LLM:
             params: Union[SamplingParams, PoolingParams],
             lora_request: Optional[Union[List[LoRARequest],
                                          LoRARequest]] = None,
-            prompt_adapter_request: Optional[PromptAdapterRequest] = None
+            prompt_adapter_request: Optional[PromptAdapterRequest] = None,
+            session_id: Optional[str] = None,
+            priority: float = 0.0,
     ) -> None:
         request_id = str(next(self.request_counter))
         self.llm_engine.add_request(
@@ -546,7 +612,11 @@ class LLM:
             inputs,
             params,
             lora_request=lora_request,
-            prompt_adapter_request=prompt_adapter_request)
+            prompt_adapter_request=prompt_adapter_request,
+            session_id=session_id,
+            default_config=(self.DEFAULT_SESSION_CONFIG
+                            if session_id is not None else None),
+            priority=priority)
 
     def _run_engine(
             self, *, use_tqdm: bool
@@ -589,3 +659,41 @@ class LLM:
         # This is necessary because some requests may be finished earlier than
         # its previous requests.
         return sorted(outputs, key=lambda x: int(x.request_id))
+
+
+class ChatSession:
+    """A multi-turn conversation with an :class:`LLM`.
+
+    Every turn extends the prompt and output of the previous one, so that
+    the engine reuses their preserved KV and only prefills the new tokens.
+    Use :meth:`LLM.chat_session` to create one.
+    """
+
+    def __init__(self, llm: LLM, session_id: str) -> None:
+        self.llm = llm
+        self.session_id = session_id
+        # The prompt and output token ids of the conversation so far.
+        self.token_ids: List[int] = []
+
+    def generate(self,
+                 prompt: Union[str, List[int]],
+                 sampling_params: Optional[SamplingParams] = None,
+                 use_tqdm: bool = False) -> RequestOutput:
+        """Append `prompt`, text or token ids, to the conversation and
+        generate the next reply."""
+        if isinstance(prompt, str):
+            # Only the first turn starts with the special tokens.
+            prompt = self.llm.get_tokenizer().encode(
+                prompt, add_special_tokens=not self.token_ids)
+        output = self.llm.generate(
+            TokensPrompt(prompt_token_ids=self.token_ids + prompt),
+            sampling_params=sampling_params,
+            use_tqdm=use_tqdm,
+            session_id=self.session_id)[0]
+        self.token_ids = (list(output.prompt_token_ids) +
+                          list(output.outputs[0].token_ids))
+        return output
+
+    def close(self) -> None:
+        """Free the preserved KV of the conversation."""
+        self.llm.free_session(self.session_id)
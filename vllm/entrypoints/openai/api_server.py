@@ -6,7 +6,6 @@ import signal
 from contextlib import asynccontextmanager
 from http import HTTPStatus
 from typing import Optional, Set
-import json
 
 import fastapi
 import uvicorn
@@ -30,6 +29,11 @@ from vllm.entrypoints.openai.protocol import (ChatCompletionRequest,
                                               DetokenizeRequest,
                                               DetokenizeResponse,
                                               EmbeddingRequest, ErrorResponse,
+                                              SessionForkRequest,
+                                              SessionFreeResponse,
+                                              SessionListResponse,
+                                              SessionPriorityRequest,
+                                              SessionResponse,
                                               TokenizeRequest,
                                               TokenizeResponse)
 # yapf: enable
@@ -74,6 +78,12 @@ async def lifespan(app: fastapi.FastAPI):
 
     yield
 
+    if engine_args.session_persist_path is not None:
+        # Let the next server start from the preserved sessions. The engine
+        # loop is stopped first so that the save does not race with a step.
+        await engine.stop_background_loop()
+        await engine.save_sessions()
+
 
 router = APIRouter()
 
@@ -93,9 +103,13 @@ async def health() -> Response:
     return Response(status_code=200)
 
 @router.get("/future")
-async def get_memory_future() -> Response:
-    """Get future."""
-    return JSONResponse(content={"gpu_guess":engine.engine.gpu_cache_guess}, status_code=200)
+async def get_memory_future(horizon: float = 0.0) -> Response:
+    """Get future. With a positive `horizon`, also the probability that the
+    next turn of every idle session arrives within `horizon` seconds."""
+    content = {"gpu_guess": engine.engine.gpu_cache_guess}
+    if horizon > 0:
+        content["arrival_probs"] = engine.engine.get_arrival_probs(horizon)
+    return JSONResponse(content=content, status_code=200)
 
 @router.get("/exit")  
 async def exit() -> Response:  
@@ -148,6 +162,70 @@ async def show_version():
     return JSONResponse(content=ver)
 
 
+@router.get("/v1/sessions")
+async def list_sessions(prefix: str = ""):
+    sessions = await engine.list_sessions(prefix)
+    response = SessionListResponse(
+        data=[SessionResponse(**session) for session in sessions])
+    return JSONResponse(content=response.model_dump())
+
+
+@router.delete("/v1/sessions")
+async def free_sessions(prefix: str):
+    """Free every session whose id starts with `prefix`."""
+    if not prefix:
+        return JSONResponse(content={"error": "prefix must not be empty"},
+                            status_code=HTTPStatus.BAD_REQUEST)
+    freed = await engine.free_sessions(prefix)
+    return JSONResponse(content=SessionFreeResponse(freed=freed).model_dump())
+
+
+@router.get("/v1/sessions/{session_id}")
+async def show_session(session_id: str):
+    session = await engine.get_session(session_id)
+    if session is None:
+        return JSONResponse(
+            content={"error": f"Session {session_id} not found"},
+            status_code=HTTPStatus.NOT_FOUND)
+    return JSONResponse(content=SessionResponse(**session).model_dump())
+
+
+@router.post("/v1/sessions/{session_id}/fork")
+async def fork_session(session_id: str, request: SessionForkRequest):
+    """Start session `request.session_id` from the preserved KV of
+    `session_id`."""
+    try:
+        forked = await engine.fork_session(session_id, request.session_id)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)},
+                            status_code=HTTPStatus.CONFLICT)
+    if not forked:
+        return JSONResponse(
+            content={"error": f"Session {session_id} has no preserved KV"},
+            status_code=HTTPStatus.NOT_FOUND)
+    session = await engine.get_session(request.session_id)
+    return JSONResponse(content=SessionResponse(**session).model_dump())
+
+
+@router.post("/v1/sessions/{session_id}/pin")
+async def pin_session(session_id: str):
+    await engine.pin_session(session_id, True)
+    return Response(status_code=200)
+
+
+@router.delete("/v1/sessions/{session_id}/pin")
+async def unpin_session(session_id: str):
+    await engine.pin_session(session_id, False)
+    return Response(status_code=200)
+
+
+@router.post("/v1/sessions/{session_id}/priority")
+async def set_session_priority(session_id: str,
+                               request: SessionPriorityRequest):
+    await engine.set_session_priority(session_id, request.priority)
+    return Response(status_code=200)
+
+
 @router.post("/v1/chat/completions")
 async def create_chat_completion(request: ChatCompletionRequest,
                                  raw_request: Request):
@@ -170,6 +248,10 @@ async def create_chat_completion(request: ChatCompletionRequest,
 
 @router.post("/v1/completions")
 async def create_completion(request: CompletionRequest, raw_request: Request):
+    if request.request_stop:
+        await openai_serving_completion.remove_session(request.session_id)
+        return Response(content="good")
+
     generator = await openai_serving_completion.create_completion(
         request, raw_request)
     if isinstance(generator, ErrorResponse):
@@ -391,14 +473,7 @@ async def run_server(args, llm_engine=None, **uvicorn_kwargs) -> None:
                 print(f"Failed to unregister machine {model_url}")
             else:
                 print(f"Unregistered machine {model_url} for model {model_name}")
-        
-        with open("metrics.txt", "w") as f:
-            metrics = {
-                "metrics_1": engine.engine.metrics_1,
-                "metrics_2": engine.engine.metrics_2
-            }
-            json.dump(metrics, f)
-            
+
         server_task.cancel()
 
     loop.add_signal_handler(signal.SIGINT, signal_handler)
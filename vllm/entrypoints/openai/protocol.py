@@ -10,6 +10,7 @@ from typing_extensions import Annotated
 from vllm.entrypoints.chat_utils import ChatCompletionMessageParam
 from vllm.pooling_params import PoolingParams
 from vllm.sampling_params import SamplingParams
+from vllm.sequence import RequestSLO
 from vllm.utils import random_uuid
 
 
@@ -61,10 +62,17 @@ class ModelList(OpenAIBaseModel):
     data: List[ModelCard] = Field(default_factory=list)
 
 
+class PromptTokenUsageInfo(OpenAIBaseModel):
+    # The prompt tokens whose KV was reused from a preserved session or the
+    # prefix cache instead of being computed.
+    cached_tokens: Optional[int] = None
+
+
 class UsageInfo(OpenAIBaseModel):
     prompt_tokens: int = 0
     total_tokens: int = 0
     completion_tokens: Optional[int] = 0
+    prompt_tokens_details: Optional[PromptTokenUsageInfo] = None
 
 
 class ResponseFormat(OpenAIBaseModel):
@@ -124,12 +132,21 @@ class ChatCompletionRequest(OpenAIBaseModel):
     user: Optional[str] = None
 
     session_id: Optional[str] = None
+    # 0 disables reusing the preserved KV of the session; any other value
+    # lets the engine reuse the longest prefix shared with the previous turn.
     session_reuse: Optional[int] = -1
 
     default_config: Optional[AgentConfig] = AgentConfig(ip=-1, p=100, tau=2)
     rounds: Optional[float] = -1
 
     request_stop: Optional[bool] = False
+
+    # Used by the priority and EDF scheduling policies: higher priorities
+    # are scheduled first, and the SLOs are the time to the first token and
+    # per output token after it, in seconds.
+    priority: float = 0.0
+    ttft_slo: Optional[Annotated[float, Field(gt=0)]] = None
+    tpot_slo: Optional[Annotated[float, Field(gt=0)]] = None
     
     # doc: begin-chat-completion-sampling-params
     best_of: Optional[int] = None
@@ -278,6 +295,11 @@ class ChatCompletionRequest(OpenAIBaseModel):
             truncate_prompt_tokens=self.truncate_prompt_tokens,
         )
 
+    def to_request_slo(self) -> Optional[RequestSLO]:
+        if self.ttft_slo is None and self.tpot_slo is None:
+            return None
+        return RequestSLO(ttft=self.ttft_slo, tpot=self.tpot_slo)
+
     @model_validator(mode='before')
     @classmethod
     def validate_stream_options(cls, values):
@@ -356,6 +378,23 @@ class CompletionRequest(OpenAIBaseModel):
     top_p: Optional[float] = 1.0
     user: Optional[str] = None
 
+    session_id: Optional[str] = None
+    # 0 disables reusing the preserved KV of the session; any other value
+    # lets the engine reuse the longest prefix shared with the previous turn.
+    session_reuse: Optional[int] = -1
+
+    default_config: Optional[AgentConfig] = AgentConfig(ip=-1, p=100, tau=2)
+    rounds: Optional[float] = -1
+
+    request_stop: Optional[bool] = False
+
+    # Used by the priority and EDF scheduling policies: higher priorities
+    # are scheduled first, and the SLOs are the time to the first token and
+    # per output token after it, in seconds.
+    priority: float = 0.0
+    ttft_slo: Optional[Annotated[float, Field(gt=0)]] = None
+    tpot_slo: Optional[Annotated[float, Field(gt=0)]] = None
+
     # doc: begin-completion-sampling-params
     use_beam_search: bool = False
     top_k: int = -1
@@ -472,6 +511,11 @@ class CompletionRequest(OpenAIBaseModel):
             truncate_prompt_tokens=self.truncate_prompt_tokens,
         )
 
+    def to_request_slo(self) -> Optional[RequestSLO]:
+        if self.ttft_slo is None and self.tpot_slo is None:
+            return None
+        return RequestSLO(ttft=self.ttft_slo, tpot=self.tpot_slo)
+
     @model_validator(mode="before")
     @classmethod
     def check_guided_decoding_count(cls, data):
@@ -744,3 +788,32 @@ class DetokenizeRequest(OpenAIBaseModel):
 
 class DetokenizeResponse(OpenAIBaseModel):
     prompt: str
+
+
+class SessionResponse(OpenAIBaseModel):
+    session_id: str
+    state: Literal["active", "idle", "arrived"]
+    virtual_engine: Optional[int] = None
+    num_retained_blocks: int
+    num_reused_tokens: int
+    num_turns: int
+    last_seen: float
+    pinned: bool
+    priority: float
+
+
+class SessionListResponse(OpenAIBaseModel):
+    object: str = "list"
+    data: List[SessionResponse] = Field(default_factory=list)
+
+
+class SessionPriorityRequest(OpenAIBaseModel):
+    priority: float
+
+
+class SessionForkRequest(OpenAIBaseModel):
+    session_id: str
+
+
+class SessionFreeResponse(OpenAIBaseModel):
+    freed: List[str] = Field(default_factory=list)
@@ -11,8 +11,7 @@ from vllm.config import ModelConfig
 from vllm.engine.async_llm_engine import AsyncLLMEngine
 from vllm.entrypoints.chat_utils import (ConversationMessage,
                                          load_chat_template,
-                                         parse_chat_message_content,
-                                         find_kth_subseq_position)
+                                         parse_chat_message_content)
 from vllm.entrypoints.logger import RequestLogger
 from vllm.entrypoints.openai.protocol import (
     ChatCompletionLogProb, ChatCompletionLogProbs,
@@ -66,12 +65,6 @@ class OpenAIServingChat(OpenAIServing):
         # If this is None we use the tokenizer's default chat template
         self.chat_template = load_chat_template(chat_template)
 
-    async def remove_session(
-            self,
-            session_id: str
-    ) -> bool:
-        return await self.engine.remove_session(session_id)
-    
     async def create_chat_completion(
         self,
         request: ChatCompletionRequest,
@@ -143,11 +136,10 @@ class OpenAIServingChat(OpenAIServing):
         try:
             sampling_params = request.to_sampling_params()
             session_id = request.session_id
-            session_reuse = request.session_reuse
-    
-            if sampling_params.n != 1 and session_id: # Sessionize only when 1 output needed
-                return self.create_error_response("n!=1 not supported for a session")
-                
+            # The reusable prefix is matched token by token by the engine;
+            # the client can only opt out of reusing the session's KV.
+            session_reuse = 0 if request.session_reuse == 0 else -1
+
             decoding_config = await self.engine.get_decoding_config()
             guided_decoding_backend = request.guided_decoding_backend \
                 or decoding_config.guided_decoding_backend
@@ -178,10 +170,6 @@ class OpenAIServingChat(OpenAIServing):
             engine_inputs: PromptInputs = {
                 "prompt_token_ids": prompt_inputs["prompt_token_ids"],
             }
-            
-            if "Llama-3" in request.model:
-                session_reuse = find_kth_subseq_position(prompt_inputs["prompt_token_ids"], [128006], session_reuse)
-                # print("Session Reuse: ", session_reuse)
 
 
             if mm_data is not None:
@@ -205,7 +193,9 @@ class OpenAIServingChat(OpenAIServing):
                 session_id=session_id,
                 session_reuse = session_reuse,
                 rounds=request.rounds,
-                default_config=request.default_config
+                default_config=request.default_config,
+                priority=request.priority,
+                slo=request.to_request_slo()
             )
         except ValueError as e:
             # TODO: Use a vllm-specific Validation Error
@@ -275,9 +265,13 @@ class OpenAIServingChat(OpenAIServing):
                                 and request.stream_options.include_usage):
                             if (request.stream_options.continuous_usage_stats):
                                 prompt_tokens = len(res.prompt_token_ids)
-                                usage = UsageInfo(prompt_tokens=prompt_tokens,
-                                                  completion_tokens=0,
-                                                  total_tokens=prompt_tokens)
+                                usage = UsageInfo(
+                                    prompt_tokens=prompt_tokens,
+                                    completion_tokens=0,
+                                    total_tokens=prompt_tokens,
+                                    prompt_tokens_details=self.
+                                    _get_prompt_tokens_details(
+                                        res.num_cached_tokens))
                                 chunk.usage = usage
                             else:
                                 chunk.usage = None
@@ -318,7 +312,10 @@ class OpenAIServingChat(OpenAIServing):
                                         usage = UsageInfo(
                                             prompt_tokens=prompt_tokens,
                                             completion_tokens=0,
-                                            total_tokens=prompt_tokens)
+                                            total_tokens=prompt_tokens,
+                                            prompt_tokens_details=self.
+                                            _get_prompt_tokens_details(
+                                                res.num_cached_tokens))
                                         chunk.usage = usage
                                     else:
                                         chunk.usage = None
@@ -389,6 +386,9 @@ class OpenAIServingChat(OpenAIServing):
                                     completion_tokens=completion_tokens,
                                     total_tokens=prompt_tokens +
                                     completion_tokens,
+                                    prompt_tokens_details=self.
+                                    _get_prompt_tokens_details(
+                                        res.num_cached_tokens),
                                 )
                                 chunk.usage = usage
                             else:
@@ -421,6 +421,9 @@ class OpenAIServingChat(OpenAIServing):
                                     completion_tokens=completion_tokens,
                                     total_tokens=prompt_tokens +
                                     completion_tokens,
+                                    prompt_tokens_details=self.
+                                    _get_prompt_tokens_details(
+                                        res.num_cached_tokens),
                                 )
                                 chunk.usage = usage
                             else:
@@ -435,6 +438,8 @@ class OpenAIServingChat(OpenAIServing):
                     prompt_tokens=prompt_tokens,
                     completion_tokens=previous_num_tokens[i],
                     total_tokens=prompt_tokens + previous_num_tokens[i],
+                    prompt_tokens_details=self._get_prompt_tokens_details(
+                        res.num_cached_tokens),
                 )
 
                 final_usage_chunk = ChatCompletionStreamResponse(
@@ -533,6 +538,8 @@ class OpenAIServingChat(OpenAIServing):
             prompt_tokens=num_prompt_tokens,
             completion_tokens=num_generated_tokens,
             total_tokens=num_prompt_tokens + num_generated_tokens,
+            prompt_tokens_details=self._get_prompt_tokens_details(
+                final_res.num_cached_tokens),
         )
         response = ChatCompletionResponse(
             id=request_id,
@@ -119,6 +119,14 @@ class OpenAIServingCompletion(OpenAIServing):
                     add_special_tokens=request.add_special_tokens,
                 ))
 
+            session_id = request.session_id
+            if session_id is not None and len(prompts) != 1:
+                return self.create_error_response(
+                    "session_id requires a single prompt")
+            # The reusable prefix is matched token by token by the engine;
+            # the client can only opt out of reusing the session's KV.
+            session_reuse = 0 if request.session_reuse == 0 else -1
+
             for i, prompt_inputs in enumerate(prompts):
                 request_id_item = f"{request_id}-{i}"
 
@@ -143,6 +151,12 @@ class OpenAIServingCompletion(OpenAIServing):
                     lora_request=lora_request,
                     prompt_adapter_request=prompt_adapter_request,
                     trace_headers=trace_headers,
+                    session_id=session_id,
+                    session_reuse=session_reuse,
+                    rounds=request.rounds,
+                    default_config=request.default_config,
+                    priority=request.priority,
+                    slo=request.to_request_slo(),
                 )
 
                 generators.append(generator)
@@ -312,6 +326,9 @@ class OpenAIServingCompletion(OpenAIServing):
                                 prompt_tokens=prompt_tokens,
                                 completion_tokens=completion_tokens,
                                 total_tokens=prompt_tokens + completion_tokens,
+                                prompt_tokens_details=self.
+                                _get_prompt_tokens_details(
+                                    res.num_cached_tokens),
                             )
                         if request.stream_options.continuous_usage_stats:
                             chunk.usage = usage
@@ -352,6 +369,7 @@ class OpenAIServingCompletion(OpenAIServing):
         choices: List[CompletionResponseChoice] = []
         num_prompt_tokens = 0
         num_generated_tokens = 0
+        num_cached_tokens: Optional[int] = None
 
         for final_res in final_res_batch:
             prompt_token_ids = final_res.prompt_token_ids
@@ -395,6 +413,9 @@ class OpenAIServingCompletion(OpenAIServing):
                 choices.append(choice_data)
 
             num_prompt_tokens += len(prompt_token_ids)
+            if final_res.num_cached_tokens is not None:
+                num_cached_tokens = ((num_cached_tokens or 0) +
+                                     final_res.num_cached_tokens)
             num_generated_tokens += sum(
                 len(output.token_ids) for output in final_res.outputs)
 
@@ -402,6 +423,8 @@ class OpenAIServingCompletion(OpenAIServing):
             prompt_tokens=num_prompt_tokens,
             completion_tokens=num_generated_tokens,
             total_tokens=num_prompt_tokens + num_generated_tokens,
+            prompt_tokens_details=self._get_prompt_tokens_details(
+                num_cached_tokens),
         )
 
         return CompletionResponse(
@@ -19,6 +19,7 @@ from vllm.entrypoints.openai.protocol import (ChatCompletionRequest,
                                               EmbeddingRequest, ErrorResponse,
                                               ModelCard, ModelList,
                                               ModelPermission,
+                                              PromptTokenUsageInfo,
                                               TokenizeChatRequest,
                                               TokenizeCompletionRequest,
                                               TokenizeRequest)
@@ -152,6 +153,10 @@ class OpenAIServing:
         })
         return json_str
 
+    async def remove_session(self, session_id: str) -> None:
+        """Free the preserved KV of a session."""
+        await self.engine.remove_session(session_id)
+
     async def _check_model(
         self,
         request: AnyRequest,
@@ -396,3 +401,10 @@ class OpenAIServing:
         if logprob.decoded_token is not None:
             return logprob.decoded_token
         return tokenizer.decode(token_id)
+
+    @staticmethod
+    def _get_prompt_tokens_details(
+            num_cached_tokens: Optional[int]) -> Optional[PromptTokenUsageInfo]:
+        if num_cached_tokens is None:
+            return None
+        return PromptTokenUsageInfo(cached_tokens=num_cached_tokens)
@@ -7,6 +7,7 @@ from vllm.executor.gpu_executor import GPUExecutor
 from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
 from vllm.sequence import ExecuteModelRequest, SamplerOutput
+from vllm.utils import Device
 
 logger = init_logger(__name__)
 
@@ -88,6 +89,21 @@ class DistributedGPUExecutor(GPUExecutor):
         # (this will raise otherwise)
         self._wait_for_tasks_completion(parallel_worker_tasks)
 
+    def save_kv_cache(
+            self, path: str, num_blocks: int,
+            blocks_to_save: List[Tuple[int, Device, int, int]]) -> None:
+        self._run_workers("save_kv_cache",
+                          path=path,
+                          num_blocks=num_blocks,
+                          blocks_to_save=blocks_to_save)
+
+    def load_kv_cache(self, path: str, num_blocks: int,
+                      blocks_to_load: List[Tuple[int, int, int]]) -> None:
+        self._run_workers("load_kv_cache",
+                          path=path,
+                          num_blocks=num_blocks,
+                          blocks_to_load=blocks_to_load)
+
     def add_lora(self, lora_request: LoRARequest) -> bool:
         assert lora_request.lora_int_id > 0, "lora_id must be greater than 0."
         return self._run_workers(
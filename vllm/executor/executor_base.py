@@ -8,6 +8,7 @@ from vllm.config import (CacheConfig, DeviceConfig, LoadConfig, LoRAConfig,
 from vllm.lora.request import LoRARequest
 from vllm.prompt_adapter.request import PromptAdapterRequest
 from vllm.sequence import ExecuteModelRequest, SamplerOutput
+from vllm.utils import Device
 
 
 class ExecutorBase(ABC):
@@ -117,6 +118,19 @@ class ExecutorBase(ABC):
     def list_prompt_adapters(self) -> Set[int]:
         raise NotImplementedError
 
+    def save_kv_cache(
+            self, path: str, num_blocks: int,
+            blocks_to_save: List[Tuple[int, Device, int, int]]) -> None:
+        """Saves KV cache blocks to `path`, see `Worker.save_kv_cache`."""
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support saving the KV cache.")
+
+    def load_kv_cache(self, path: str, num_blocks: int,
+                      blocks_to_load: List[Tuple[int, int, int]]) -> None:
+        """Loads KV cache blocks saved by `save_kv_cache`."""
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support loading the KV cache.")
+
     @abstractmethod
     def check_health(self) -> None:
         """Checks if the executor is healthy. If not, it should raise an
@@ -5,8 +5,8 @@ from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
 from vllm.prompt_adapter.request import PromptAdapterRequest
 from vllm.sequence import ExecuteModelRequest, PoolerOutput, SamplerOutput
-from vllm.utils import (get_distributed_init_method, get_ip, get_open_port,
-                        make_async)
+from vllm.utils import (Device, get_distributed_init_method, get_ip,
+                        get_open_port, make_async)
 from vllm.worker.worker_base import WorkerWrapperBase
 
 logger = init_logger(__name__)
@@ -110,6 +110,15 @@ class GPUExecutor(ExecutorBase):
         output = self.driver_worker.execute_model(execute_model_req)
         return output
 
+    def save_kv_cache(
+            self, path: str, num_blocks: int,
+            blocks_to_save: List[Tuple[int, Device, int, int]]) -> None:
+        self.driver_worker.save_kv_cache(path, num_blocks, blocks_to_save)
+
+    def load_kv_cache(self, path: str, num_blocks: int,
+                      blocks_to_load: List[Tuple[int, int, int]]) -> None:
+        self.driver_worker.load_kv_cache(path, num_blocks, blocks_to_load)
+
     def add_lora(self, lora_request: LoRARequest) -> bool:
         assert lora_request.lora_int_id > 0, "lora_id must be greater than 0."
         return self.driver_worker.add_lora(lora_request)
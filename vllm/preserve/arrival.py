@@ -0,0 +1,334 @@
+"""Online estimators of when the next turn of a session arrives and how much
+its prompt grows, and a harness that replays a trace to measure their
+forecast error."""
+import bisect
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import (TYPE_CHECKING, Deque, Dict, Iterable, Iterator, List,
+                    Optional, Tuple)
+
+from vllm.preserve.session_config import SessionConfig
+
+if TYPE_CHECKING:
+    from vllm.preserve.simulator import TraceRequest
+
+class QuantileSketch:
+    """Keeps the last `max_samples` samples of a distribution, in arrival
+    and in sorted order, to answer quantile and CDF queries in O(log n)."""
+
+    def __init__(self, max_samples: int = 128) -> None:
+        self.max_samples = max_samples
+        self._samples: Deque[float] = deque()
+        self._sorted: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def __iter__(self) -> Iterator[float]:
+        """Iterate over the samples in arrival order."""
+        return iter(self._samples)
+
+    def add(self, value: float) -> None:
+        if len(self._samples) == self.max_samples:
+            oldest = self._samples.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._samples.append(value)
+        bisect.insort(self._sorted, value)
+
+    def quantile(self, q: float) -> float:
+        """Return the `q` quantile, interpolating between samples."""
+        if not self._sorted:
+            raise ValueError("The sketch is empty.")
+        pos = q * (len(self._sorted) - 1)
+        lo = math.floor(pos)
+        hi = min(lo + 1, len(self._sorted) - 1)
+        return self._sorted[lo] + (pos - lo) * (self._sorted[hi] -
+                                                self._sorted[lo])
+
+    def cdf(self, value: float) -> float:
+        """Return the share of the samples that are at most `value`."""
+        if not self._sorted:
+            raise ValueError("The sketch is empty.")
+        return bisect.bisect_right(self._sorted, value) / len(self._sorted)
+
+
+class ArrivalEstimator:
+    """Fits the turns of sessions online and keeps their `SessionConfig` up
+    to date."""
+
+    def start(self, session_id: str, config: SessionConfig) -> None:
+        """Adjust the config of a new session, made from the defaults."""
+        pass
+
+    def observe(self,
+                session_id: str,
+                config: SessionConfig,
+                sum_p: int,
+                current_time: float,
+                session_reuse: int,
+                rounds: float = -1) -> None:
+        """Update `config` with a new turn of `sum_p` prompt tokens."""
+        raise NotImplementedError
+
+    def remove(self, session_id: str) -> None:
+        """Forget a session that is over."""
+        pass
+
+
+class EMAArrivalEstimator(ArrivalEstimator):
+    """Moves `p` and `tau` of every session toward its last growth and time
+    between turns by `weight`."""
+
+    def __init__(self, weight: float = 1 / 3) -> None:
+        self.weight = weight
+
+    def observe(self,
+                session_id: str,
+                config: SessionConfig,
+                sum_p: int,
+                current_time: float,
+                session_reuse: int,
+                rounds: float = -1) -> None:
+        config.update(sum_p, current_time, session_reuse, rounds, self.weight)
+
+
+@dataclass
+class _ArrivalStats:
+    inter_arrival: QuantileSketch
+    growth: QuantileSketch
+    # Turns followed by another turn, and sessions that ended.
+    num_continued: int = 0
+    num_ended: int = 0
+
+
+class QuantileArrivalEstimator(ArrivalEstimator):
+    """Fits the distributions of the time between turns and of the prompt
+    growth per turn, for every session and for every tenant.
+
+    A session uses its own distributions once it has `min_samples` turns,
+    and those of its tenant until then, so that new sessions start from
+    what the tenant does rather than from fixed defaults. `p` and `tau` are
+    set to the medians, which are robust to the idle outliers that drag an
+    EMA. The probability that a session has another turn is learned from
+    the sessions of its tenant that ended, unless the client announced its
+    number of turns.
+
+    Args:
+        max_samples: The number of recent samples kept per tenant.
+        session_samples: The number of recent samples kept per session.
+        min_samples: The number of samples from which a distribution is
+            used.
+        tenant_separator: The tenant of a session is the part of its id
+            before this separator, or the id itself.
+    """
+
+    def __init__(self,
+                 max_samples: int = 256,
+                 session_samples: int = 16,
+                 min_samples: int = 3,
+                 tenant_separator: str = "/") -> None:
+        self.max_samples = max_samples
+        self.session_samples = session_samples
+        self.min_samples = min_samples
+        self.tenant_separator = tenant_separator
+        self._tenants: Dict[str, _ArrivalStats] = {}
+        self._sessions: Dict[str, Tuple[str, _ArrivalStats]] = {}
+        self._announced_rounds: Dict[str, bool] = {}
+
+    def get_tenant(self, session_id: str) -> str:
+        return session_id.split(self.tenant_separator, 1)[0]
+
+    def _get_stats(self, session_id: str) -> Tuple[_ArrivalStats,
+                                                   _ArrivalStats]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            tenant = self.get_tenant(session_id)
+            entry = (tenant,
+                     _ArrivalStats(QuantileSketch(self.session_samples),
+                                   QuantileSketch(self.session_samples)))
+            self._sessions[session_id] = entry
+        tenant, session_stats = entry
+        tenant_stats = self._tenants.get(tenant)
+        if tenant_stats is None:
+            tenant_stats = _ArrivalStats(QuantileSketch(self.max_samples),
+                                         QuantileSketch(self.max_samples))
+            self._tenants[tenant] = tenant_stats
+        return session_stats, tenant_stats
+
+    def _pick(self, session_sketch: QuantileSketch,
+              tenant_sketch: QuantileSketch) -> Optional[QuantileSketch]:
+        if len(session_sketch) >= self.min_samples:
+            return session_sketch
+        if len(tenant_sketch) >= self.min_samples:
+            return tenant_sketch
+        return None
+
+    def _apply(self, session_id: str, config: SessionConfig,
+               session_stats: _ArrivalStats,
+               tenant_stats: _ArrivalStats) -> None:
+        inter_arrival = self._pick(session_stats.inter_arrival,
+                                   tenant_stats.inter_arrival)
+        if inter_arrival is not None:
+            config.inter_arrival = inter_arrival
+            config.tau = inter_arrival.quantile(0.5)
+        growth = self._pick(session_stats.growth, tenant_stats.growth)
+        if growth is not None:
+            config.p = growth.quantile(0.5)
+        num_outcomes = tenant_stats.num_continued + tenant_stats.num_ended
+        if (tenant_stats.num_ended > 0
+                and not self._announced_rounds.get(session_id, False)):
+            # Laplace smoothing keeps a few sessions from deciding it.
+            config.continue_prob = ((tenant_stats.num_continued + 1) /
+                                    (num_outcomes + 2))
+
+    def start(self, session_id: str, config: SessionConfig) -> None:
+        session_stats, tenant_stats = self._get_stats(session_id)
+        self._apply(session_id, config, session_stats, tenant_stats)
+
+    def observe(self,
+                session_id: str,
+                config: SessionConfig,
+                sum_p: int,
+                current_time: float,
+                session_reuse: int,
+                rounds: float = -1) -> None:
+        session_stats, tenant_stats = self._get_stats(session_id)
+        if rounds > 0:
+            self._announced_rounds[session_id] = True
+            config.continue_prob = None
+        inter_arrival = current_time - config.prev_time
+        growth = sum_p - config.prev_p
+        restored = config.update(sum_p, current_time, session_reuse, rounds)
+        for stats in (session_stats, tenant_stats):
+            stats.inter_arrival.add(inter_arrival)
+            if not restored and session_reuse > 2:
+                stats.growth.add(growth)
+        tenant_stats.num_continued += 1
+        self._apply(session_id, config, session_stats, tenant_stats)
+
+    def remove(self, session_id: str) -> None:
+        self._announced_rounds.pop(session_id, None)
+        entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return
+        tenant_stats = self._tenants.get(entry[0])
+        if tenant_stats is not None:
+            tenant_stats.num_ended += 1
+
+
+class ArrivalEstimatorFactory:
+
+    _ESTIMATOR_REGISTRY = {
+        'ema': EMAArrivalEstimator,
+        'quantile': QuantileArrivalEstimator,
+    }
+
+    @classmethod
+    def get_estimator(cls, estimator_name: str,
+                      **kwargs) -> ArrivalEstimator:
+        return cls._ESTIMATOR_REGISTRY[estimator_name](**kwargs)
+
+
+@dataclass
+class ForecastError:
+    """The forecast error of an estimator over a replayed trace.
+
+    Args:
+        num_turns: The turns that followed a forecast.
+        num_forecasts: The forecasts of a next turn, including those of the
+            last turns of the sessions, which were not followed by one.
+        tau_mae: The mean absolute error of `tau` as the time to the next
+            turn, in seconds.
+        growth_mae: The mean absolute error of `p` as the growth of the next
+            prompt, in tokens.
+        brier_score: The mean squared error of the probability that the next
+            turn arrives within the horizon. 0 is perfect.
+        mean_arrival_prob: The mean of those probabilities, to compare with
+            `arrival_rate` for calibration.
+        arrival_rate: The share of the forecasts followed by a turn within
+            the horizon.
+    """
+    num_turns: int = 0
+    num_forecasts: int = 0
+    tau_mae: float = 0.0
+    growth_mae: float = 0.0
+    brier_score: float = 0.0
+    mean_arrival_prob: float = 0.0
+    arrival_rate: float = 0.0
+
+
+def replay_arrivals(trace: Iterable["TraceRequest"],
+                    estimator: ArrivalEstimator,
+                    default_config: Tuple[int, float, float] = (-1, 100, 2),
+                    horizon: float = 10.0,
+                    session_ttl: Optional[float] = None) -> ForecastError:
+    """Replay the session turns of `trace` through `estimator`, and measure
+    how well the configs it keeps forecast the next turns.
+
+    After every turn, the forecast is the `tau`, `p` and probability of a
+    next turn within `horizon` seconds of the config. A session is over, and
+    removed from the estimator, once it is idle for `session_ttl` seconds,
+    10 horizons by default.
+    """
+    if session_ttl is None:
+        session_ttl = 10 * horizon
+    assert session_ttl >= horizon, "session_ttl must cover the horizon"
+    ip, p, tau = default_config
+    configs: Dict[str, SessionConfig] = {}
+    # Session id -> (time, prompt length, tau, p, arrival probability) of
+    # the forecast made after its last turn.
+    forecasts: Dict[str, Tuple[float, int, float, float, float]] = {}
+    tau_errors: List[float] = []
+    growth_errors: List[float] = []
+    outcomes: List[Tuple[float, bool]] = []
+
+    def end_sessions(now: float) -> None:
+        for session_id in [
+                session_id for session_id, forecast in forecasts.items()
+                if now - forecast[0] > session_ttl
+        ]:
+            outcomes.append((forecasts.pop(session_id)[4], False))
+            del configs[session_id]
+            estimator.remove(session_id)
+
+    for request in sorted(trace, key=lambda request: request.arrival_time):
+        session_id = request.session_id
+        if session_id is None:
+            continue
+        now = request.arrival_time
+        end_sessions(now)
+        config = configs.get(session_id)
+        forecast = forecasts.pop(session_id, None)
+        if forecast is not None:
+            prev_time, prev_len, prev_tau, prev_p, arrival_prob = forecast
+            tau_errors.append(abs(now - prev_time - prev_tau))
+            growth_errors.append(abs(request.prompt_len - prev_len - prev_p))
+            outcomes.append((arrival_prob, now - prev_time <= horizon))
+        if config is None:
+            config = SessionConfig(ip, p, request.prompt_len, tau, now,
+                                   request.rounds)
+            configs[session_id] = config
+            estimator.start(session_id, config)
+        else:
+            # Every token of the previous turn is taken to be reused.
+            estimator.observe(session_id, config, request.prompt_len, now,
+                              config.prev_p, request.rounds)
+        forecasts[session_id] = (now, request.prompt_len, config.tau,
+                                 config.p, config.get_arrival_prob(
+                                     now, horizon))
+    end_sessions(math.inf)
+
+    error = ForecastError(num_turns=len(tau_errors),
+                          num_forecasts=len(outcomes))
+    if tau_errors:
+        error.tau_mae = sum(tau_errors) / len(tau_errors)
+        error.growth_mae = sum(growth_errors) / len(growth_errors)
+    if outcomes:
+        error.brier_score = sum((prob - arrived)**2
+                                for prob, arrived in outcomes) / len(outcomes)
+        error.mean_arrival_prob = sum(prob
+                                      for prob, _ in outcomes) / len(outcomes)
+        error.arrival_rate = sum(arrived
+                                 for _, arrived in outcomes) / len(outcomes)
+    return error
@@ -0,0 +1,378 @@
+import math
+import time
+from typing import (Callable, Dict, Iterator, List, Mapping, MutableMapping,
+                    Optional, Tuple, Union)
+
+from vllm.preserve.registry import SessionRegistry
+from vllm.preserve.session_config import SessionConfig
+
+# A heap priority: a number, or a tuple of numbers compared in order.
+Priority = Union[float, Tuple[float, ...]]
+
+
+class SessionEvictionPolicy:
+    """Ranks preserved sessions. The session with the lowest priority is
+    evicted first.
+
+    A policy whose priorities change with `now` is `time_dependent`, and the
+    sessions it ranks are re-ranked periodically.
+    """
+
+    time_dependent = False
+
+    def get_priority(
+        self,
+        now: float,
+        config: Optional[SessionConfig],
+        num_tokens: int,
+    ) -> float:
+        raise NotImplementedError
+
+    def is_protected(
+        self,
+        now: float,
+        config: Optional[SessionConfig],
+    ) -> bool:
+        """Whether the session should only be evicted as a last resort."""
+        return False
+
+
+class FIFO(SessionEvictionPolicy):
+    """Evicts the session that has been preserved for the longest time."""
+
+    def get_priority(
+        self,
+        now: float,
+        config: Optional[SessionConfig],
+        num_tokens: int,
+    ) -> float:
+        return now
+
+
+class ReuseValue(SessionEvictionPolicy):
+    """Ranks sessions by the prefill they are expected to save per second of
+    residency: the preserved tokens, weighted by the probability that the
+    session has another turn given that it has not come back yet, divided by
+    the time to its next turn.
+
+    The next turn is expected `tau` seconds after the previous one. A session
+    that is late is expected as far past that time as it is late, so an
+    abandoned session loses its rank as it grows overdue. The time is padded
+    by `guard_ratio * tau`, and a session whose next turn is expected within
+    that window is protected, so that it is not evicted right before it
+    returns.
+    """
+
+    time_dependent = True
+
+    def __init__(self, guard_ratio: float = 0.25) -> None:
+        self.guard_ratio = guard_ratio
+
+    def get_priority(
+        self,
+        now: float,
+        config: Optional[SessionConfig],
+        num_tokens: int,
+    ) -> float:
+        if config is None:
+            return 0.0
+        tau = max(config.tau, 1e-6)
+        time_to_next_turn = (abs(config.prev_time + tau - now) +
+                             self.guard_ratio * tau)
+        return (num_tokens * config.get_pending_continue_prob(now) /
+                time_to_next_turn)
+
+    def is_protected(
+        self,
+        now: float,
+        config: Optional[SessionConfig],
+    ) -> bool:
+        if config is None or config.get_continue_prob() == 0.0:
+            return False
+        expected_arrival = config.prev_time + config.tau
+        return abs(expected_arrival - now) <= self.guard_ratio * config.tau
+
+
+class SessionEvictionPolicyFactory:
+
+    _POLICY_REGISTRY = {'fifo': FIFO, 'reuse_value': ReuseValue}
+
+    @classmethod
+    def get_policy(cls, policy_name: str,
+                   **kwargs) -> SessionEvictionPolicy:
+        return cls._POLICY_REGISTRY[policy_name](**kwargs)
+
+
+class IndexedHeap:
+    """A binary min-heap of keys that also indexes their positions, so that
+    the priority of any key can be updated or removed in O(log n)."""
+
+    def __init__(self) -> None:
+        # Entries are (priority, insertion counter, key); the counter breaks
+        # ties in insertion order.
+        self._heap: List[Tuple[Priority, int, str]] = []
+        self._pos: Dict[str, int] = {}
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._pos
+
+    def push(self, key: str, priority: Priority) -> None:
+        """Insert `key`, or update its priority if it is already present."""
+        if key in self._pos:
+            self.remove(key)
+        self._counter += 1
+        self.push_entry((priority, self._counter, key))
+
+    def push_entry(self, entry: Tuple[Priority, int, str]) -> None:
+        """Re-insert an entry returned by `pop_entry`, keeping its place
+        among the keys of equal priority."""
+        self._heap.append(entry)
+        self._pos[entry[2]] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def peek(self) -> Optional[str]:
+        return self._heap[0][2] if self._heap else None
+
+    def peek_priority(self) -> Optional[Priority]:
+        return self._heap[0][0] if self._heap else None
+
+    def pop(self) -> str:
+        return self.pop_entry()[2]
+
+    def pop_entry(self) -> Tuple[Priority, int, str]:
+        entry = self._heap[0]
+        self.remove(entry[2])
+        return entry
+
+    def remove(self, key: str) -> None:
+        idx = self._pos.pop(key)
+        last = self._heap.pop()
+        if idx == len(self._heap):
+            return
+        self._heap[idx] = last
+        self._pos[last[2]] = idx
+        self._sift_up(idx)
+        self._sift_down(self._pos[last[2]])
+
+    def _swap(self, i: int, j: int) -> None:
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._pos[self._heap[i][2]] = i
+        self._pos[self._heap[j][2]] = j
+
+    def _sift_up(self, idx: int) -> None:
+        while idx > 0:
+            parent = (idx - 1) // 2
+            if self._heap[idx] >= self._heap[parent]:
+                break
+            self._swap(idx, parent)
+            idx = parent
+
+    def _sift_down(self, idx: int) -> None:
+        n = len(self._heap)
+        while True:
+            smallest = idx
+            for child in (2 * idx + 1, 2 * idx + 2):
+                if child < n and self._heap[child] < self._heap[smallest]:
+                    smallest = child
+            if smallest == idx:
+                return
+            self._swap(idx, smallest)
+            idx = smallest
+
+
+class PreservedSessions(MutableMapping[str, int]):
+    """Maps the preserved sessions of a virtual engine to the ids of the
+    sequences holding their KV, ranked by a `SessionEvictionPolicy`.
+
+    Iteration follows insertion order, like a dict. Victims are taken in
+    policy order with `select_victim`. If a session registry is given, the
+    priority set by the operator ranks before the policy, and pinned
+    sessions are never victims. The sessions ranked by a time dependent
+    policy are all re-ranked, in O(n log n), when victims are selected at
+    least `rerank_interval` seconds after the last re-ranking.
+
+    Args:
+        policy: The policy ranking the sessions.
+        session_configs: The forecast of every session, shared with the
+            engine. Sessions without a forecast get the policy's default.
+        get_num_tokens: Returns the number of tokens preserved by a sequence.
+        session_registry: The registry holding the pins and priorities of
+            the sessions, shared with the engine.
+        clock: Returns the current time, e.g. the time of a simulation.
+        rerank_interval: The minimum time between two re-rankings.
+    """
+
+    def __init__(
+        self,
+        policy: Optional[SessionEvictionPolicy] = None,
+        session_configs: Optional[Mapping[str, SessionConfig]] = None,
+        get_num_tokens: Optional[Callable[[int], int]] = None,
+        session_registry: Optional[SessionRegistry] = None,
+        clock: Callable[[], float] = time.time,
+        rerank_interval: float = 1.0,
+    ) -> None:
+        self.policy = policy if policy is not None else FIFO()
+        self.session_configs = (session_configs
+                                if session_configs is not None else {})
+        self.get_num_tokens = get_num_tokens
+        self.session_registry = session_registry
+        self.clock = clock
+        self.rerank_interval = rerank_interval
+        self._seq_ids: Dict[str, int] = {}
+        self._heap = IndexedHeap()
+        self._rerank_time = -math.inf
+
+    def __getitem__(self, session_id: str) -> int:
+        return self._seq_ids[session_id]
+
+    def __setitem__(self, session_id: str, seq_id: int) -> None:
+        self._seq_ids[session_id] = seq_id
+        self.refresh(session_id)
+
+    def __delitem__(self, session_id: str) -> None:
+        del self._seq_ids[session_id]
+        self._heap.remove(session_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._seq_ids)
+
+    def __len__(self) -> int:
+        return len(self._seq_ids)
+
+    def __repr__(self) -> str:
+        return f"PreservedSessions({self._seq_ids})"
+
+    def refresh(self, session_id: str, now: Optional[float] = None) -> None:
+        """Re-rank a session, e.g. after its priority was changed."""
+        if now is None:
+            now = self.clock()
+        seq_id = self._seq_ids[session_id]
+        num_tokens = (self.get_num_tokens(seq_id)
+                      if self.get_num_tokens is not None else 0)
+        priority = self.policy.get_priority(
+            now, self.session_configs.get(session_id), num_tokens)
+        user_priority = (self.session_registry.get_priority(session_id)
+                         if self.session_registry is not None else 0.0)
+        self._heap.push(session_id, (user_priority, priority))
+
+    def _maybe_rerank(self, now: float) -> None:
+        if (not self.policy.time_dependent
+                or now - self._rerank_time < self.rerank_interval):
+            return
+        self._rerank_time = now
+        for session_id in self._seq_ids:
+            self.refresh(session_id, now)
+
+    def is_pinned(self, session_id: str) -> bool:
+        return (self.session_registry is not None
+                and self.session_registry.is_pinned(session_id))
+
+    def select_victim(
+        self,
+        can_evict: Optional[Callable[[str, int], bool]] = None,
+        now: Optional[float] = None,
+    ) -> Optional[str]:
+        """Return the lowest-priority session accepted by `can_evict`,
+        without removing it.
+
+        Sessions protected by the policy are only returned if no other
+        session is accepted. Pinned sessions are never returned.
+
+        The sessions ranked before the victim are popped and pushed back, so
+        that a call costs O(k log n) when `k` sessions are rejected, e.g. the
+        pinned ones or those already moved out of the GPU cache.
+        """
+        if now is None:
+            now = self.clock()
+        self._maybe_rerank(now)
+
+        def is_candidate(session_id: str) -> bool:
+            if self.is_pinned(session_id):
+                return False
+            return can_evict is None or can_evict(session_id,
+                                                  self._seq_ids[session_id])
+
+        protected: Optional[str] = None
+        visited: List[Tuple[Priority, int, str]] = []
+        victim: Optional[str] = None
+        while self._heap:
+            entry = self._heap.pop_entry()
+            visited.append(entry)
+            session_id = entry[2]
+            if not is_candidate(session_id):
+                continue
+            if self.policy.is_protected(now,
+                                        self.session_configs.get(session_id)):
+                if protected is None:
+                    protected = session_id
+                continue
+            victim = session_id
+            break
+        for entry in visited:
+            self._heap.push_entry(entry)
+        return victim if victim is not None else protected
+
+    def select_victims(
+        self,
+        num_blocks: int,
+        get_num_blocks: Callable[[int], int],
+        can_evict: Optional[Callable[[str, int], bool]] = None,
+        now: Optional[float] = None,
+    ) -> List[str]:
+        """Return the sessions accepted by `can_evict` whose release frees
+        `num_blocks` blocks, as `get_num_blocks` counts them per sequence,
+        without removing them.
+
+        The sessions are taken in policy order, protected ones last, until
+        they hold `num_blocks` blocks. The most valuable of them are then
+        dropped as long as the rest still do, so that a single large session
+        spares the small ones ranked before it. If all the candidates do not
+        hold `num_blocks` blocks, they are all returned.
+
+        Like in `select_victim`, every session visited costs O(log n).
+        """
+        if now is None:
+            now = self.clock()
+        self._maybe_rerank(now)
+
+        visited: List[Tuple[Priority, int, str]] = []
+        victims: List[str] = []
+        protected: List[str] = []
+        num_victim_blocks: Dict[str, int] = {}
+        total = 0
+        while self._heap and total < num_blocks:
+            entry = self._heap.pop_entry()
+            visited.append(entry)
+            session_id = entry[2]
+            seq_id = self._seq_ids[session_id]
+            if self.is_pinned(session_id) or (can_evict is not None and
+                                              not can_evict(session_id,
+                                                            seq_id)):
+                continue
+            num_victim_blocks[session_id] = get_num_blocks(seq_id)
+            if self.policy.is_protected(now,
+                                        self.session_configs.get(session_id)):
+                protected.append(session_id)
+                continue
+            victims.append(session_id)
+            total += num_victim_blocks[session_id]
+        for entry in visited:
+            self._heap.push_entry(entry)
+
+        for session_id in protected:
+            if total >= num_blocks:
+                break
+            victims.append(session_id)
+            total += num_victim_blocks[session_id]
+        if total < num_blocks:
+            return victims
+
+        for session_id in reversed(victims[:-1]):
+            if total - num_victim_blocks[session_id] >= num_blocks:
+                victims.remove(session_id)
+                total -= num_victim_blocks[session_id]
+        return victims
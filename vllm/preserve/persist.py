@@ -0,0 +1,173 @@
+"""Saves the preserved sessions of an engine to a directory and loads them
+back, so that a restarted server does not prefill every session again.
+
+The directory holds a JSON manifest of the sessions, the token ids of their
+retained blocks in one memory-mapped array, and the contents of the blocks
+in memory-mapped files written by the workers. The manifest is written last,
+so a directory without one holds no usable sessions.
+"""
+import dataclasses
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vllm.preserve.arrival import QuantileSketch
+from vllm.preserve.registry import SessionInfo
+from vllm.preserve.session_config import SessionConfig
+
+MANIFEST_NAME = "sessions.json"
+TOKEN_IDS_NAME = "token_ids.npy"
+_VERSION = 1
+
+
+@dataclass
+class PersistedSession:
+    """A preserved session, as saved to a directory.
+
+    Args:
+        info: What the engine knew about the session.
+        virtual_engine: The virtual engine that preserved the session.
+        block_numbers: The numbers of its blocks in the saved block files.
+        token_ids: The token ids covered by those blocks.
+    """
+    info: SessionInfo
+    virtual_engine: int
+    block_numbers: List[int]
+    token_ids: np.ndarray
+
+
+def config_to_dict(config: SessionConfig) -> Dict[str, Any]:
+    inter_arrival = config.inter_arrival
+    return {
+        "ip": config.ip,
+        "p": config.p,
+        "prev_p": config.prev_p,
+        "prev_time": config.prev_time,
+        "tau": config.tau,
+        "t0": config.t0,
+        "rounds": config.rounds,
+        "inter_arrival": None if inter_arrival is None else {
+            "max_samples": inter_arrival.max_samples,
+            "samples": list(inter_arrival),
+        },
+        "continue_prob": config.continue_prob,
+    }
+
+
+def config_from_dict(state: Dict[str, Any]) -> SessionConfig:
+    config = SessionConfig(state["ip"], state["p"], state["prev_p"],
+                           state["tau"], state["t0"], state["rounds"])
+    config.prev_time = state["prev_time"]
+    if state["inter_arrival"] is not None:
+        config.inter_arrival = QuantileSketch(
+            state["inter_arrival"]["max_samples"])
+        for sample in state["inter_arrival"]["samples"]:
+            config.inter_arrival.add(sample)
+    config.continue_prob = state["continue_prob"]
+    return config
+
+
+def session_info_to_dict(info: SessionInfo) -> Dict[str, Any]:
+    state = {
+        field.name: getattr(info, field.name)
+        for field in dataclasses.fields(info)
+    }
+    if info.config is not None:
+        state["config"] = config_to_dict(info.config)
+    return state
+
+
+def session_info_from_dict(state: Dict[str, Any]) -> SessionInfo:
+    state = dict(state)
+    config = state.pop("config")
+    return SessionInfo(
+        config=None if config is None else config_from_dict(config), **state)
+
+
+def remove_manifest(path: str) -> None:
+    """Invalidate the sessions saved in `path` before their files are
+    overwritten."""
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def has_manifest(path: str) -> bool:
+    return os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+
+def save_manifest(path: str, metadata: Dict[str, Any], num_blocks: int,
+                  sessions: List[PersistedSession]) -> None:
+    """Write the sessions and their token ids to `path`, after the workers
+    wrote their `num_blocks` blocks.
+
+    Args:
+        path: The directory of the saved sessions.
+        metadata: What the blocks depend on, e.g. the model and the block
+            size. Sessions are only loaded back with the same metadata.
+        num_blocks: The number of blocks in the block files.
+        sessions: The sessions to save.
+    """
+    os.makedirs(path, exist_ok=True)
+    offsets = np.cumsum([0] + [len(s.token_ids) for s in sessions])
+    token_ids = np.lib.format.open_memmap(os.path.join(path, TOKEN_IDS_NAME),
+                                          mode="w+",
+                                          dtype=np.int64,
+                                          shape=(int(offsets[-1]), ))
+    for session, offset in zip(sessions, offsets):
+        token_ids[offset:offset + len(session.token_ids)] = session.token_ids
+    token_ids.flush()
+    del token_ids
+
+    manifest = {
+        "version": _VERSION,
+        "metadata": metadata,
+        "num_blocks": num_blocks,
+        "sessions": [{
+            "info": session_info_to_dict(session.info),
+            "virtual_engine": session.virtual_engine,
+            "block_numbers": session.block_numbers,
+            "token_offset": int(offset),
+            "num_tokens": len(session.token_ids),
+        } for session, offset in zip(sessions, offsets)],
+    }
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def load_manifest(
+    path: str,
+    metadata: Optional[Dict[str, Any]] = None
+) -> Tuple[int, List[PersistedSession]]:
+    """Read the sessions saved in `path`.
+
+    Returns the number of blocks in the block files and the sessions.
+    Raises ValueError if the sessions were saved with other `metadata`.
+    """
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest["version"] != _VERSION:
+        raise ValueError(f"Unsupported version of the sessions in {path}: "
+                         f"{manifest['version']}.")
+    if metadata is not None and manifest["metadata"] != metadata:
+        raise ValueError(f"The sessions in {path} were saved with "
+                         f"{manifest['metadata']}, not {metadata}.")
+    token_ids = np.load(os.path.join(path, TOKEN_IDS_NAME), mmap_mode="r")
+    sessions: List[PersistedSession] = []
+    for state in manifest["sessions"]:
+        offset = state["token_offset"]
+        sessions.append(
+            PersistedSession(
+                info=session_info_from_dict(state["info"]),
+                virtual_engine=state["virtual_engine"],
+                block_numbers=state["block_numbers"],
+                # Copied, as the next save overwrites the file.
+                token_ids=np.array(token_ids[offset:offset +
+                                             state["num_tokens"]]),
+            ))
+    return manifest["num_blocks"], sessions
@@ -1,6 +1,46 @@
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
 from vllm.preserve.session_config import SessionConfig
 
+
+def longest_common_prefix(cached_token_ids: np.ndarray,
+                          token_ids: Sequence[int]) -> int:
+    """Return the number of leading tokens shared by the two sequences.
+
+    The comparison is done in a single vectorized pass, so it does not depend
+    on any chat template specific delimiter.
+    """
+    n = min(len(cached_token_ids), len(token_ids))
+    if n == 0:
+        return 0
+    mismatch = np.flatnonzero(
+        cached_token_ids[:n] != np.asarray(token_ids[:n], dtype=np.int64))
+    return int(mismatch[0]) if len(mismatch) > 0 else n
+
+
+def get_session_reuse(retained_token_ids: Optional[np.ndarray],
+                      prompt_token_ids: Sequence[int],
+                      session_reuse: Optional[int] = None) -> int:
+    """Return the number of prompt tokens whose KV can be reused from the
+    retained tokens of the session.
+
+    The reusable prefix is the longest common prefix between the retained
+    tokens and the new prompt. The last prompt token is always recomputed so
+    that its logits are available. A non-negative `session_reuse` is an upper
+    bound set by the client.
+    """
+    if retained_token_ids is None:
+        return 0
+    reused_tokens = longest_common_prefix(retained_token_ids,
+                                          prompt_token_ids)
+    reused_tokens = min(reused_tokens, len(prompt_token_ids) - 1)
+    if session_reuse is not None and session_reuse >= 0:
+        reused_tokens = min(reused_tokens, session_reuse)
+    return max(reused_tokens, 0)
+
+
 def sp_at_time(config:SessionConfig, model_max_len: int, t:float):
     t0 = config.t0
     point1 = config.tau * (model_max_len-config.ip) / config.p
@@ -13,39 +53,171 @@ def sp_at_time(config:SessionConfig, model_max_len: int, t:float):
         return model_max_len
     return config.ip + config.p * new_t / config.tau
 
-def sp_breaking_point(config:SessionConfig, model_max_len: int):
-    t0 = config.t0
-    point1 = round(config.tau * (model_max_len-config.ip) / config.p + t0, 2)
-    point2 = round(config.tau * config.rounds + t0, 2)
 
-    if point1 < point2:
-        return [point1-0.01, point1+0.01, point2-0.01, point2+0.01]
-    else:
-        return [point2-0.01, point2+0.01]
-    
-def sum_sps(configs:List[SessionConfig], model_max_len: int, current_time:float, num_gpu_blocks:int):
-    time_points = set([current_time])
-    for config in configs:
-        # print("config: ", config.ip, config.p, config.tau, config.rounds)    
-        time_points.update(sp_breaking_point(config, model_max_len))
-    time_points = sorted(list(time_points))
-    # print("time_points: ", time_points)
-    time_val = []
-    prev_pair = (0, 0)
-    ahead_pair = (-1, -1000)
-    for tp in time_points:
-        if tp < current_time - 0.01:
-            continue
-
-        new_pair = (tp, round(sum([sp_at_time(config, model_max_len, tp) for config in configs]), 3))
-        if abs(prev_pair[1] - ahead_pair[1]) + abs(ahead_pair[1] - new_pair[1]) < 128: 
-            # TODO (yanyu): 128 = block_size * 8, and 8 is a magic number
-            time_val[-1] = new_pair
-            prev_pair = new_pair 
-        else:
-            ahead_pair = prev_pair
-            prev_pair = new_pair
-            time_val.append(new_pair)
-    
-    return time_val
-    
+class SessionForecaster:
+    """Forecasts the number of tokens held by all sessions over time.
+
+    Every session follows the piecewise-linear curve of `sp_at_time`: it grows
+    linearly from `ip` tokens at rate `p / tau`, saturates at the model max
+    length, and drops to zero after `rounds` turns. The parameters of the
+    sessions are kept in NumPy arrays that are updated in place when a session
+    changes. The sum of the curves is described by the events at which some
+    session changes phase; they are only re-sorted after an update, and the
+    curve is evaluated at any number of times in one vectorized pass.
+
+    Args:
+        model_max_len: The maximum number of tokens of a session.
+        resolution: The variation of the forecast, in tokens, below which
+            consecutive points of `forecast` are merged.
+    """
+
+    # Columns of the parameter array.
+    _IP, _P, _TAU, _T0, _ROUNDS = range(5)
+
+    def __init__(self, model_max_len: int, resolution: float = 128) -> None:
+        self.model_max_len = model_max_len
+        self.resolution = resolution
+        self._slots: Dict[str, int] = {}
+        self._free_slots: List[int] = []
+        self._params = np.zeros((0, 5))
+        self._active = np.zeros(0, dtype=bool)
+        # Times are stored relative to the first update to keep the
+        # intercepts of the linear pieces small.
+        self._origin: Optional[float] = None
+        self._dirty = True
+        self._event_times = np.zeros(0)
+        self._intercept_deltas = np.zeros(0)
+        self._slope_deltas = np.zeros(0)
+        self._base_intercept = 0.0
+        self._base_slope = 0.0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._slots
+
+    def update(self, session_id: str, config: SessionConfig) -> None:
+        """Add a session, or refresh it after its config changed."""
+        if self._origin is None:
+            self._origin = config.t0
+        slot = self._slots.get(session_id)
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = len(self._params)
+                capacity = max(16, 2 * len(self._params))
+                self._params = np.resize(self._params, (capacity, 5))
+                self._active = np.concatenate(
+                    (self._active,
+                     np.zeros(capacity - len(self._active), dtype=bool)))
+                self._free_slots.extend(range(capacity - 1, slot, -1))
+            self._slots[session_id] = slot
+        self._params[slot] = (config.ip, config.p, config.tau,
+                              config.t0 - self._origin, config.rounds)
+        self._active[slot] = True
+        self._dirty = True
+
+    def remove(self, session_id: str) -> None:
+        slot = self._slots.pop(session_id, None)
+        if slot is None:
+            return
+        self._active[slot] = False
+        self._free_slots.append(slot)
+        self._dirty = True
+
+    def _build_events(self) -> None:
+        params = self._params[self._active]
+        ip = params[:, self._IP]
+        tau = np.maximum(params[:, self._TAU], 1e-6)
+        t0 = params[:, self._T0]
+        # A session that does not grow never saturates.
+        p = np.maximum(params[:, self._P], 0.0)
+        slope = p / tau
+        with np.errstate(divide="ignore", invalid="ignore"):
+            saturation = np.where(
+                p > 0, t0 + tau * (self.model_max_len - ip) / np.where(
+                    p > 0, p, 1.0), np.inf)
+        end = t0 + tau * params[:, self._ROUNDS]
+        saturates = saturation < end
+        linear_end = np.where(saturates, saturation, end)
+
+        # Before its first event, a session holds ip + slope * (t - t0).
+        intercept = ip - slope * t0
+        self._base_intercept = float(intercept.sum())
+        self._base_slope = float(slope.sum())
+        saturated_len = np.full(int(saturates.sum()), self.model_max_len,
+                                dtype=np.float64)
+        times = np.concatenate((linear_end, end[saturates]))
+        intercept_deltas = np.concatenate(
+            (np.where(saturates, self.model_max_len, 0.0) - intercept,
+             -saturated_len))
+        slope_deltas = np.concatenate((-slope, np.zeros_like(saturated_len)))
+
+        order = np.argsort(times, kind="stable")
+        self._event_times = times[order]
+        self._intercept_deltas = np.cumsum(intercept_deltas[order])
+        self._slope_deltas = np.cumsum(slope_deltas[order])
+        self._dirty = False
+
+    def evaluate(self, times: np.ndarray) -> np.ndarray:
+        """Return the forecast number of tokens at each of `times`."""
+        times = np.asarray(times, dtype=np.float64)
+        if not self._slots:
+            return np.zeros_like(times)
+        if self._dirty:
+            self._build_events()
+        rel_times = times - self._origin
+        # An event at time e takes effect for t > e.
+        num_events = np.searchsorted(self._event_times, rel_times, side="left")
+        prev_event = np.maximum(num_events - 1, 0)
+        has_events = num_events > 0
+        intercept = self._base_intercept + np.where(
+            has_events, self._intercept_deltas[prev_event]
+            if len(self._event_times) else 0.0, 0.0)
+        slope = self._base_slope + np.where(
+            has_events, self._slope_deltas[prev_event]
+            if len(self._event_times) else 0.0, 0.0)
+        return intercept + slope * rel_times
+
+    def get_max_growth(self, now: float, horizon: float) -> float:
+        """Return by how many tokens the forecast rises above its value at
+        `now` within `horizon` seconds."""
+        if not self._slots:
+            return 0.0
+        if self._dirty:
+            self._build_events()
+        # The forecast is piecewise linear, so its maximum is reached at one
+        # of the ends or of the events in between. Evaluating at an event
+        # gives the value just before it applies.
+        event_times = self._event_times + self._origin
+        in_horizon = event_times[(event_times > now)
+                                 & (event_times < now + horizon)]
+        values = self.evaluate(
+            np.concatenate(([now, now + horizon], in_horizon)))
+        return max(0.0, float(values.max() - values[0]))
+
+    def forecast(self, now: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the forecast from `now` on, as the times around every change
+        of slope and the number of tokens at those times.
+
+        Consecutive points are merged until the forecast has varied by more
+        than `resolution` tokens. The first and the last points are kept.
+        """
+        if not self._slots:
+            return np.array([now]), np.zeros(1)
+        if self._dirty:
+            self._build_events()
+        event_times = self._event_times + self._origin
+        times = np.concatenate(([now], event_times - 0.01, event_times + 0.01))
+        times = np.unique(np.round(times, 2))
+        times = times[times >= now - 0.01]
+        values = np.round(self.evaluate(times), 3)
+
+        variation = np.concatenate(
+            ([0.0], np.cumsum(np.abs(np.diff(values)))))
+        steps = np.floor(variation / self.resolution)
+        keep = np.concatenate(([True], steps[1:] != steps[:-1]))
+        keep[-1] = True
+        return times[keep], values[keep]
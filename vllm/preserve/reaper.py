@@ -0,0 +1,46 @@
+from typing import List, Optional
+
+from vllm.preserve.eviction import IndexedHeap
+
+
+class SessionReaper:
+    """Expires the sessions that have been idle for longer than `ttl`
+    seconds.
+
+    Idle sessions are kept in a min-heap keyed by their expiry time, so
+    checking for an expired session is O(1), and refreshing a session or
+    expiring one is O(log n).
+
+    Args:
+        ttl: The idle time after which a session expires. None disables
+            expiry.
+    """
+
+    def __init__(self, ttl: Optional[float] = None) -> None:
+        self.ttl = ttl
+        self._expiry = IndexedHeap()
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._expiry
+
+    def touch(self, session_id: str, now: float) -> None:
+        """Start or restart the idle timer of a session."""
+        if self.ttl is not None:
+            self._expiry.push(session_id, now + self.ttl)
+
+    def discard(self, session_id: str) -> None:
+        """Stop the idle timer of a session, e.g. when its next turn
+        arrives."""
+        if session_id in self._expiry:
+            self._expiry.remove(session_id)
+
+    def pop_expired(self, now: float) -> List[str]:
+        """Remove and return the sessions that expired by `now`, oldest
+        first."""
+        expired: List[str] = []
+        while self._expiry and self._expiry.peek_priority() <= now:
+            expired.append(self._expiry.pop())
+        return expired
@@ -0,0 +1,153 @@
+import bisect
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Mapping, Optional
+
+from vllm.preserve.session_config import SessionConfig
+
+
+@dataclass
+class SessionInfo:
+    """What the engine knows about a session across its turns.
+
+    Args:
+        session_id: The id of the session.
+        config: The arrival forecast of the session, once a turn arrived.
+        pinned: Whether the preserved KV of the session is never evicted.
+        priority: The eviction priority set by the operator. Sessions with a
+            lower priority are evicted first, whatever the policy says.
+        last_seen: The time the last turn of the session arrived or finished.
+        num_turns: The number of turns that arrived.
+        num_reused_tokens: The number of prompt tokens of the last turn whose
+            KV was reused.
+        num_prompt_tokens: The number of prompt tokens of the last turn.
+        num_output_tokens: The number of tokens past the prompt that were
+            retained when the last turn finished.
+        output_reuse_ratio: The share of those tokens that the next turn is
+            expected to reuse, as observed on the previous turns. Chat
+            templates that re-render the last reply make it 0.
+    """
+    session_id: str
+    config: Optional[SessionConfig] = None
+    pinned: bool = False
+    priority: float = 0.0
+    last_seen: float = 0.0
+    num_turns: int = 0
+    num_reused_tokens: int = 0
+    num_prompt_tokens: int = 0
+    num_output_tokens: int = 0
+    output_reuse_ratio: float = 1.0
+
+    def observe_reuse(self, num_retained_tokens: int,
+                      num_reused_tokens: int) -> None:
+        """Update `output_reuse_ratio` from the reuse of the tokens retained
+        for the last turn, before a new turn overwrites its lengths."""
+        if self.num_output_tokens <= 0 or num_retained_tokens <= 0:
+            return
+        if (num_reused_tokens >= num_retained_tokens and num_retained_tokens
+                < self.num_prompt_tokens + self.num_output_tokens):
+            # Every token kept after trimming was reused, so more might have
+            # been: retain everything again.
+            self.output_reuse_ratio = 1.0
+            return
+        num_reused_output_tokens = num_reused_tokens - self.num_prompt_tokens
+        self.output_reuse_ratio = min(
+            max(num_reused_output_tokens / self.num_output_tokens, 0.0), 1.0)
+
+    def get_num_reusable_tokens(self, num_retained_tokens: int) -> int:
+        """Predict how many of the `num_retained_tokens` tokens retained when
+        the last turn finished will be reused by the next turn.
+
+        Also records the retained tokens past the prompt, see
+        `observe_reuse`.
+        """
+        self.num_output_tokens = max(
+            num_retained_tokens - self.num_prompt_tokens, 0)
+        return min(
+            num_retained_tokens, self.num_prompt_tokens +
+            math.ceil(self.output_reuse_ratio * self.num_output_tokens))
+
+
+class SessionConfigs(Mapping[str, SessionConfig]):
+    """A read-only view of the forecasts of the sessions of a registry."""
+
+    def __init__(self, sessions: Dict[str, SessionInfo]) -> None:
+        self._sessions = sessions
+
+    def __getitem__(self, session_id: str) -> SessionConfig:
+        config = self._sessions[session_id].config
+        if config is None:
+            raise KeyError(session_id)
+        return config
+
+    def __iter__(self) -> Iterator[str]:
+        return (session_id for session_id, info in self._sessions.items()
+                if info.config is not None)
+
+    def __len__(self) -> int:
+        return sum(info.config is not None
+                   for info in self._sessions.values())
+
+
+class SessionRegistry:
+    """Indexes the `SessionInfo` of every known session by id.
+
+    The ids are also kept sorted, so that the sessions sharing a prefix,
+    e.g. those of a tenant, are found in O(log n + k).
+    """
+
+    def __init__(self) -> None:
+        self._sessions: Dict[str, SessionInfo] = {}
+        self._sorted_ids: List[str] = []
+        self.configs = SessionConfigs(self._sessions)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __iter__(self) -> Iterator[SessionInfo]:
+        return iter(list(self._sessions.values()))
+
+    def get(self, session_id: str) -> Optional[SessionInfo]:
+        return self._sessions.get(session_id)
+
+    def get_or_create(self, session_id: str) -> SessionInfo:
+        info = self._sessions.get(session_id)
+        if info is None:
+            info = SessionInfo(session_id)
+            self._sessions[session_id] = info
+            bisect.insort(self._sorted_ids, session_id)
+        return info
+
+    def add(self, info: SessionInfo) -> None:
+        """Register a session, e.g. one restored after a restart."""
+        if info.session_id not in self._sessions:
+            bisect.insort(self._sorted_ids, info.session_id)
+        self._sessions[info.session_id] = info
+
+    def remove(self, session_id: str) -> Optional[SessionInfo]:
+        info = self._sessions.pop(session_id, None)
+        if info is not None:
+            idx = bisect.bisect_left(self._sorted_ids, session_id)
+            del self._sorted_ids[idx]
+        return info
+
+    def is_pinned(self, session_id: str) -> bool:
+        info = self._sessions.get(session_id)
+        return info is not None and info.pinned
+
+    def get_priority(self, session_id: str) -> float:
+        info = self._sessions.get(session_id)
+        return info.priority if info is not None else 0.0
+
+    def with_prefix(self, prefix: str) -> List[str]:
+        """Return the ids starting with `prefix`, in sorted order."""
+        start = bisect.bisect_left(self._sorted_ids, prefix)
+        session_ids: List[str] = []
+        for session_id in self._sorted_ids[start:]:
+            if not session_id.startswith(prefix):
+                break
+            session_ids.append(session_id)
+        return session_ids
@@ -0,0 +1,52 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+class SessionRouter:
+    """Picks the virtual engine that serves a request.
+
+    Engines are scored by the work the request would wait for and do there,
+    in prompt tokens: every unfinished request queued on the engine costs
+    `queue_token_cost` tokens, and every prompt token that is not reused from
+    the session's preserved KV has to be prefilled. Reusing the preserved KV
+    on another engine than its home costs `migration_cost_ratio` of a
+    prefilled token per reused token, for copying the blocks over.
+
+    Args:
+        queue_token_cost: The cost of a queued request, in prompt tokens.
+        migration_cost_ratio: The cost of migrating a reused token, relative
+            to prefilling it.
+    """
+
+    def __init__(self,
+                 queue_token_cost: float = 256.0,
+                 migration_cost_ratio: float = 0.1) -> None:
+        self.queue_token_cost = queue_token_cost
+        self.migration_cost_ratio = migration_cost_ratio
+
+    def route(self,
+              queue_costs: Sequence[int],
+              num_prompt_tokens: int,
+              home: Optional[int] = None,
+              num_reused_tokens: int = 0) -> int:
+        """Return the index of the engine with the lowest score.
+
+        Args:
+            queue_costs: The number of unfinished requests of every engine.
+            num_prompt_tokens: The number of tokens of the prompt.
+            home: The engine preserving the session's KV, if any.
+            num_reused_tokens: The number of prompt tokens whose KV is
+                preserved on `home`.
+        """
+        scores = (np.asarray(queue_costs, dtype=np.float64) *
+                  self.queue_token_cost + num_prompt_tokens -
+                  num_reused_tokens)
+        if home is None:
+            return int(np.argmin(scores))
+        scores += self.migration_cost_ratio * num_reused_tokens
+        scores[home] -= self.migration_cost_ratio * num_reused_tokens
+        # Stay on the home engine on ties.
+        if scores[home] <= scores.min():
+            return home
+        return int(np.argmin(scores))
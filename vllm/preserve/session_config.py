@@ -1,27 +1,113 @@
+import math
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+    from vllm.preserve.arrival import QuantileSketch
+
+# The number of turns of a session that does not announce it.
+DEFAULT_ROUNDS = 15
+
+
 class SessionConfig:
-    def __init__(self, ip: int, p: float, sum_p:int, tau: float, current_time: float, rounds: float):
-        self.ip = ip if ip>0 else sum_p
+    """The arrival forecast of a session: it starts with `ip` prompt tokens
+    at `t0`, and every `tau` seconds a new turn adds `p` tokens, for `rounds`
+    turns in total.
+
+    `p` and `tau` are kept up to date by an `ArrivalEstimator`, which may
+    also set the distribution of the time between turns, `inter_arrival`,
+    and the probability that a turn is followed by another one,
+    `continue_prob`. Without them, the time between turns is taken to be
+    exponential and the session to last `rounds` turns.
+    """
+
+    def __init__(self, ip: int, p: float, sum_p: int, tau: float,
+                 current_time: float, rounds: float):
+        self.ip = ip if ip > 0 else sum_p
         self.p = p
         self.prev_p = sum_p
         self.prev_time = current_time
         self.tau = tau
         self.t0 = current_time
-        self.rounds = rounds if rounds > 0 else 15
-    
-    def update(self, sum_p: int, current_time:float, session_reuse: int, rounds: float = -1):
+        self.rounds = rounds if rounds > 0 else DEFAULT_ROUNDS
+        self.inter_arrival: Optional["QuantileSketch"] = None
+        self.continue_prob: Optional[float] = None
+
+    def update(self,
+               sum_p: int,
+               current_time: float,
+               session_reuse: int,
+               rounds: float = -1,
+               weight: float = 1 / 3) -> bool:
+        """Record a new turn of `sum_p` prompt tokens, and move `p` and `tau`
+        toward the observed growth and time between turns by `weight`.
+
+        Returns whether the turn restored the session to an earlier,
+        shorter context.
+        """
         prev_p = self.prev_p
         delta_p = sum_p - prev_p
         tau = current_time - self.prev_time
-        if prev_p - self.p >= sum_p:
+        restored = prev_p - self.p >= sum_p
+        if restored:
             # restoration happens, go back
             self.ip = prev_p
             self.t0 = current_time
         elif session_reuse > 2:
-            self.p = (self.p * 2 + delta_p) / 3
-        
-        self.tau = (tau + self.tau * 2 ) / 3
-        
+            self.p += weight * (delta_p - self.p)
+
+        self.tau += weight * (tau - self.tau)
+
         self.prev_p = sum_p
         self.prev_time = current_time
 
-        if (rounds > 0): self.rounds = rounds
\ No newline at end of file
+        if rounds > 0:
+            self.rounds = rounds
+        return restored
+
+    def get_continue_prob(self) -> float:
+        """Return the probability that the session has another turn."""
+        if self.continue_prob is not None:
+            return self.continue_prob
+        num_turns = (self.prev_time - self.t0) / max(self.tau, 1e-6)
+        return min(1.0, max(0.0, self.rounds - num_turns - 1))
+
+    def get_arrival_prob(self, now: float, horizon: float) -> float:
+        """Return the probability that the next turn arrives within `horizon`
+        seconds of `now`, given that it has not arrived yet."""
+        continue_prob = self.get_continue_prob()
+        if continue_prob == 0.0:
+            return 0.0
+        elapsed = max(now - self.prev_time, 0.0)
+        cdf = self._get_inter_arrival_cdf()
+        # The turn may never come, so the survival is a mixture.
+        survival = 1.0 - continue_prob * cdf(elapsed)
+        if survival <= 0.0:
+            return 0.0
+        return min(
+            1.0, continue_prob * (cdf(elapsed + horizon) - cdf(elapsed)) /
+            survival)
+
+    def get_pending_continue_prob(self, now: float) -> float:
+        """Return the probability that the session has another turn, given
+        that it has not arrived by `now`."""
+        continue_prob = self.get_continue_prob()
+        if continue_prob == 0.0:
+            return 0.0
+        elapsed = max(now - self.prev_time, 0.0)
+        pending = continue_prob * (1.0 -
+                                   self._get_inter_arrival_cdf()(elapsed))
+        survival = 1.0 - continue_prob + pending
+        if survival <= 0.0:
+            return 0.0
+        return pending / survival
+
+    def _get_inter_arrival_cdf(self) -> Callable[[float], float]:
+        inter_arrival = self.inter_arrival
+        if inter_arrival is not None and len(inter_arrival) > 0:
+            return inter_arrival.cdf
+        tau = max(self.tau, 1e-6)
+
+        def cdf(t: float) -> float:
+            return 1.0 - math.exp(-t / tau)
+
+        return cdf
@@ -0,0 +1,399 @@
+"""A discrete-event simulator of the scheduler, the block manager and session
+preservation.
+
+The simulator drives the real `Scheduler`, block managers, output processor
+and preserved sessions, but replaces the model by a `CostModel` that gives the
+duration of every step. It runs on CPU, so scheduling and preservation
+settings can be compared on a replayed trace in seconds.
+
+Example:
+    >>> trace = [TraceRequest(0.0, 512, 64, "s0"),
+    ...          TraceRequest(3.0, 640, 64, "s0")]
+    >>> simulator = Simulator(SchedulerConfig(4096, 256, 4096),
+    ...                       Simulator.make_cache_config(16, 2048, 512))
+    >>> simulator.run(trace).summary()
+"""
+import itertools
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from vllm.config import CacheConfig, SchedulerConfig
+from vllm.core.scheduler import Scheduler, SchedulerOutputs
+from vllm.engine.output_processor.single_step import SingleStepOutputProcessor
+from vllm.engine.output_processor.stop_checker import StopChecker
+from vllm.preserve.arrival import ArrivalEstimatorFactory
+from vllm.preserve.eviction import (PreservedSessions,
+                                    SessionEvictionPolicyFactory)
+from vllm.preserve.preserve import get_session_reuse
+from vllm.preserve.reaper import SessionReaper
+from vllm.preserve.registry import SessionRegistry
+from vllm.preserve.session_config import SessionConfig
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import (CompletionSequenceGroupOutput, Logprob, Sequence,
+                           SequenceGroup, SequenceGroupMetadata,
+                           SequenceOutput, SequenceStatus)
+from vllm.utils import Counter
+
+
+@dataclass
+class TraceRequest:
+    """A request of a replayed trace.
+
+    Consecutive requests of a session extend the context of the previous
+    turn, i.e. its prompt and output, with new tokens. A prompt shorter than
+    that context keeps only its prefix, like a client truncating history.
+    With `rerender_output`, the output of the previous turn is replaced by new
+    tokens, like a chat template that re-renders the last reply.
+    """
+    arrival_time: float
+    prompt_len: int
+    output_len: int
+    session_id: Optional[str] = None
+    # The expected number of turns of the session, -1 if unknown.
+    rounds: float = -1
+    rerender_output: bool = False
+
+
+@dataclass
+class CostModel:
+    """Gives the duration of a step from what it computes and moves.
+
+    The defaults are in the range of a 7B model on a single A100.
+
+    Args:
+        step_overhead: The fixed time of a step, in seconds.
+        prefill_token_time: The time to prefill a prompt token.
+        decode_seq_time: The time to decode a token of a running sequence.
+        swap_block_time: The time to move a block between GPU and CPU.
+        disk_block_time: The time to move a block from or to disk.
+        compress_block_time: The time to compress or decompress a block on
+            GPU.
+    """
+    step_overhead: float = 5e-3
+    prefill_token_time: float = 1e-4
+    decode_seq_time: float = 2e-4
+    swap_block_time: float = 2e-5
+    disk_block_time: float = 2e-4
+    compress_block_time: float = 5e-6
+
+    def get_step_time(self, num_prefill_tokens: int, num_decode_seqs: int,
+                      outputs: SchedulerOutputs) -> float:
+        num_swapped_blocks = (len(outputs.blocks_to_swap_in) +
+                              len(outputs.blocks_to_swap_out) +
+                              len(outputs.blocks_to_migrate))
+        num_disk_blocks = (len(outputs.blocks_to_disk_in) +
+                           len(outputs.blocks_to_disk_out))
+        num_compressed_blocks = (len(outputs.blocks_to_compress) +
+                                 len(outputs.blocks_to_decompress))
+        return (self.step_overhead +
+                self.prefill_token_time * num_prefill_tokens +
+                self.decode_seq_time * num_decode_seqs +
+                self.swap_block_time * num_swapped_blocks +
+                self.disk_block_time * num_disk_blocks +
+                self.compress_block_time * num_compressed_blocks)
+
+
+@dataclass
+class SimulationResult:
+    """The metrics of a simulation. Times are in simulated seconds."""
+    duration: float = 0.0
+    num_requests: int = 0
+    num_finished: int = 0
+    num_steps: int = 0
+    num_preemptions: int = 0
+    num_prompt_tokens: int = 0
+    num_prefilled_tokens: int = 0
+    num_output_tokens: int = 0
+    # The turns of a session after its first one, and how many of them found
+    # preserved KV to reuse.
+    num_session_turns: int = 0
+    num_session_hits: int = 0
+    num_reused_tokens: int = 0
+    ttfts: List[float] = field(default_factory=list)
+    tpots: List[float] = field(default_factory=list)
+
+    @property
+    def session_hit_rate(self) -> float:
+        return (self.num_session_hits / self.num_session_turns
+                if self.num_session_turns else 0.0)
+
+    def summary(self) -> Dict[str, float]:
+        summary = {
+            "duration": self.duration,
+            "num_requests": self.num_requests,
+            "num_finished": self.num_finished,
+            "num_steps": self.num_steps,
+            "num_preemptions": self.num_preemptions,
+            "num_prompt_tokens": self.num_prompt_tokens,
+            "num_prefilled_tokens": self.num_prefilled_tokens,
+            "num_reused_tokens": self.num_reused_tokens,
+            "session_hit_rate": self.session_hit_rate,
+            "output_throughput": (self.num_output_tokens / self.duration
+                                  if self.duration > 0 else 0.0),
+        }
+        for name, values in (("ttft", self.ttfts), ("tpot", self.tpots)):
+            for percentile in (50, 90, 99):
+                summary[f"p{percentile}_{name}_ms"] = float(
+                    np.percentile(values, percentile) * 1000 if values else 0)
+        return summary
+
+
+class Simulator:
+    """Replays a trace through a single virtual engine.
+
+    Sessions are preserved, reused, evicted and expired like in `LLMEngine`,
+    and ranked by the eviction policy on the simulated clock.
+
+    Args:
+        scheduler_config: The scheduler configuration to simulate.
+        cache_config: The cache configuration, with the numbers of GPU, CPU
+            and disk blocks set.
+        cost_model: The durations of the steps.
+        default_session_config: The (ip, p, tau) forecast of a new session.
+    """
+
+    def __init__(
+        self,
+        scheduler_config: SchedulerConfig,
+        cache_config: CacheConfig,
+        cost_model: Optional[CostModel] = None,
+        default_session_config: Tuple[float, float, float] = (-1, 100, 2),
+    ) -> None:
+        self.scheduler_config = scheduler_config
+        self.cache_config = cache_config
+        self.cost_model = cost_model if cost_model is not None else CostModel()
+        self.default_session_config = default_session_config
+        self.now = 0.0
+
+        self.scheduler = Scheduler(scheduler_config, cache_config, None)
+        self.session_registry = SessionRegistry()
+        policy = SessionEvictionPolicyFactory.get_policy(
+            scheduler_config.session_eviction_policy)
+        self.session_id_blocks, self.session_id_arrived = (
+            PreservedSessions(policy,
+                              self.session_registry.configs,
+                              self.scheduler.get_num_retained_tokens,
+                              self.session_registry,
+                              clock=lambda: self.now) for _ in range(2))
+        self.session_reaper = SessionReaper(scheduler_config.session_ttl)
+        self.session_arrival_estimator = (
+            ArrivalEstimatorFactory.get_estimator(
+                scheduler_config.session_arrival_estimator))
+
+        self.seq_counter = Counter()
+        self.output_processor = SingleStepOutputProcessor(
+            scheduler_config,
+            detokenizer=None,
+            scheduler=[self.scheduler],
+            seq_counter=self.seq_counter,
+            stop_checker=StopChecker(scheduler_config.max_model_len,
+                                     lambda seq: None))
+        # Token ids are only compared with each other, so every new token
+        # gets a fresh id.
+        self._token_counter = itertools.count()
+        # The prompt and output token ids of the last turn of every session.
+        self._session_token_ids: Dict[str, Tuple[List[int], List[int]]] = {}
+
+    @staticmethod
+    def make_cache_config(block_size: int,
+                          num_gpu_blocks: int,
+                          num_cpu_blocks: int,
+                          num_disk_blocks: int = 0,
+                          enable_prefix_caching: bool = False,
+                          num_compressed_blocks: int = 0) -> CacheConfig:
+        cache_config = CacheConfig(
+            block_size,
+            1.0,
+            0,
+            "auto",
+            enable_prefix_caching=enable_prefix_caching)
+        cache_config.num_gpu_blocks = num_gpu_blocks
+        cache_config.num_cpu_blocks = num_cpu_blocks
+        cache_config.num_disk_blocks = num_disk_blocks
+        cache_config.num_compressed_blocks = num_compressed_blocks
+        return cache_config
+
+    def run(self, trace: Iterable[TraceRequest]) -> SimulationResult:
+        """Replay `trace` until every request finished."""
+        pending = sorted(trace, key=lambda request: request.arrival_time)
+        result = SimulationResult(num_requests=len(pending))
+        next_idx = 0
+        while next_idx < len(pending) or self.scheduler.has_unfinished_seqs():
+            self._reap_sessions()
+            while (next_idx < len(pending)
+                   and pending[next_idx].arrival_time <= self.now):
+                self._add_request(str(next_idx), pending[next_idx], result)
+                next_idx += 1
+            if not self.scheduler.has_unfinished_seqs():
+                self.now = pending[next_idx].arrival_time
+                continue
+            if not self._step(result) and next_idx < len(pending):
+                # Nothing could run: wait for the next arrival.
+                self.now = max(self.now, pending[next_idx].arrival_time)
+        result.duration = self.now
+        return result
+
+    def _next_token_ids(self, num_tokens: int) -> List[int]:
+        return list(itertools.islice(self._token_counter, num_tokens))
+
+    def _add_request(self, request_id: str, request: TraceRequest,
+                     result: SimulationResult) -> None:
+        session_id = request.session_id
+        prev_prompt_token_ids, prev_output_token_ids = (
+            self._session_token_ids.get(session_id, ([], [])))
+        context = prev_prompt_token_ids
+        if not request.rerender_output:
+            context = context + prev_output_token_ids
+        prompt_token_ids = context[:request.prompt_len]
+        prompt_token_ids += self._next_token_ids(request.prompt_len -
+                                                 len(prompt_token_ids))
+
+        block_size = self.cache_config.block_size
+        seq = Sequence(next(self.seq_counter),
+                       inputs={"prompt_token_ids": prompt_token_ids},
+                       block_size=block_size)
+        sampling_params = SamplingParams(max_tokens=request.output_len,
+                                         ignore_eos=True,
+                                         detokenize=False)
+        seq_group = SequenceGroup(request_id, [seq],
+                                  arrival_time=self.now,
+                                  sampling_params=sampling_params,
+                                  session_id=session_id)
+        result.num_prompt_tokens += request.prompt_len
+
+        if session_id is not None:
+            self.session_reaper.discard(session_id)
+            reused_tokens = 0
+            session_info = self.session_registry.get_or_create(session_id)
+            if session_id in self.session_id_blocks:
+                seq_id = self.session_id_blocks.pop(session_id)
+                reused_tokens = get_session_reuse(
+                    self.scheduler.get_retained_token_ids(seq_id),
+                    prompt_token_ids)
+                session_info.observe_reuse(
+                    self.scheduler.get_num_retained_tokens(seq_id),
+                    reused_tokens)
+                seq_group.computed_block_seq = seq_id
+                self.session_id_arrived[session_id] = seq_id
+            seq_group.session_reuse = reused_tokens
+
+            if session_info.num_turns > 0:
+                result.num_session_turns += 1
+                result.num_session_hits += reused_tokens > 0
+                result.num_reused_tokens += reused_tokens
+            session_info.last_seen = self.now
+            session_info.num_turns += 1
+            session_info.num_reused_tokens = reused_tokens
+            session_info.num_prompt_tokens = request.prompt_len
+            if session_info.config is not None:
+                self.session_arrival_estimator.observe(
+                    request.session_id, session_info.config,
+                    request.prompt_len, self.now, reused_tokens,
+                    request.rounds)
+            else:
+                ip, p, tau = self.default_session_config
+                session_info.config = SessionConfig(ip, p,
+                                                    request.prompt_len, tau,
+                                                    self.now, request.rounds)
+                self.session_arrival_estimator.start(request.session_id,
+                                                     session_info.config)
+        self.scheduler.add_seq_group(seq_group)
+
+    def _reap_sessions(self) -> None:
+        for session_id in self.session_reaper.pop_expired(self.now):
+            self.session_arrival_estimator.remove(session_id)
+            if session_id in self.session_id_blocks:
+                self.scheduler.free_seq_id(
+                    self.session_id_blocks.pop(session_id))
+
+    def _step(self, result: SimulationResult) -> bool:
+        """Run a step. Returns False if nothing was scheduled."""
+        seq_group_metadata_list, outputs = self.scheduler.schedule(
+            self.session_id_blocks, self.session_id_arrived)
+        result.num_preemptions += outputs.preempted
+        if not outputs.scheduled_seq_groups and not outputs.ignored_seq_groups:
+            return False
+
+        num_prefill_tokens = 0
+        num_decode_seqs = 0
+        for scheduled_seq_group, seq_group_metadata in zip(
+                outputs.scheduled_seq_groups, seq_group_metadata_list):
+            seq_group = scheduled_seq_group.seq_group
+            if seq_group.is_prefill():
+                num_prefill_tokens += self._get_num_prefilled_tokens(
+                    seq_group, seq_group_metadata)
+            else:
+                num_decode_seqs += seq_group.num_seqs(
+                    status=SequenceStatus.RUNNING)
+        result.num_prefilled_tokens += num_prefill_tokens
+        result.num_steps += 1
+        self.now += self.cost_model.get_step_time(num_prefill_tokens,
+                                                  num_decode_seqs, outputs)
+
+        finished: List[SequenceGroup] = list(outputs.ignored_seq_groups)
+        for scheduled_seq_group, seq_group_metadata in zip(
+                outputs.scheduled_seq_groups, seq_group_metadata_list):
+            seq_group = scheduled_seq_group.seq_group
+            seq_group.update_num_computed_tokens(
+                scheduled_seq_group.token_chunk_size)
+            if not seq_group_metadata.do_sample:
+                continue
+            samples = []
+            for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
+                token_id = self._next_token_ids(1)[0]
+                samples.append(
+                    SequenceOutput(seq.seq_id, token_id,
+                                   {token_id: Logprob(0.0)}))
+            self.output_processor.process_outputs(
+                seq_group, [CompletionSequenceGroupOutput(samples, None)])
+            seq_group.maybe_set_first_token_time(self.now)
+            result.num_output_tokens += len(samples)
+            if seq_group.is_finished():
+                finished.append(seq_group)
+
+        for session_id, seq_id in (
+                self.scheduler.free_finished_seq_groups().items()):
+            session_info = self.session_registry.get_or_create(session_id)
+            session_info.last_seen = self.now
+            num_reusable_tokens = session_info.get_num_reusable_tokens(
+                self.scheduler.get_num_retained_tokens(seq_id))
+            if self.scheduler.trim_seq_id(seq_id, num_reusable_tokens) == 0:
+                self.scheduler.free_seq_id(seq_id)
+                continue
+            self.session_id_blocks[session_id] = seq_id
+            self.session_reaper.touch(session_id, self.now)
+        for seq_group in finished:
+            self._record_finished(seq_group, result)
+        return True
+
+    def _get_num_prefilled_tokens(
+            self, seq_group: SequenceGroup,
+            seq_group_metadata: SequenceGroupMetadata) -> int:
+        """The prompt tokens that the step actually computes: the reused
+        and prefix-cached blocks of a first chunk are skipped."""
+        token_chunk_size = seq_group_metadata.token_chunk_size
+        seq = seq_group.get_seqs()[0]
+        if seq.data.get_num_computed_tokens() > 0:
+            return token_chunk_size
+        num_computed_tokens = (len(seq_group_metadata.computed_block_nums
+                                   or []) * self.cache_config.block_size)
+        return max(token_chunk_size - num_computed_tokens, 1)
+
+    def _record_finished(self, seq_group: SequenceGroup,
+                         result: SimulationResult) -> None:
+        result.num_finished += 1
+        seq = seq_group.get_seqs()[0]
+        if seq_group.session_id is not None:
+            self._session_token_ids[seq_group.session_id] = (
+                list(seq.get_prompt_token_ids()),
+                list(seq.get_output_token_ids()))
+        first_token_time = seq_group.metrics.first_token_time
+        if first_token_time is None:
+            return
+        result.ttfts.append(first_token_time - seq_group.metrics.arrival_time)
+        output_len = seq.get_output_len()
+        if output_len > 1:
+            result.tpots.append(
+                (self.now - first_token_time) / (output_len - 1))
@@ -1,13 +1,14 @@
 """Sequence and its related classes."""
 import copy
 import enum
+import heapq
 import math
 from abc import ABC, abstractmethod
 from array import array
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import (TYPE_CHECKING, Dict, List, Mapping, Optional, Set, Tuple,
-                    Union)
+from typing import (TYPE_CHECKING, Callable, Dict, Iterator, List, Mapping,
+                    Optional, Set, Tuple, Union)
 
 import torch
 
@@ -81,33 +82,48 @@ class SequenceStage(enum.Enum):
     PREFILL = enum.auto()
     DECODE = enum.auto()
 
-# import heapq  
-
-# class SequenceGroupMinHeap:  
-#     def __init__(self):  
-#         self.heap = []  
-    
-#     def push(self, val):  
-#         """Insert an element"""  
-#         heapq.heappush(self.heap, val)  
-    
-#     def pop_min(self):  
-#         """Pop out the smallest element"""  
-#         if self.heap:  
-#             return heapq.heappop(self.heap)  
-#         else:  
-#             return None
-    
-#     def get_min(self):  
-#         """Take the minimum element but not pop"""  
-#         if self.heap:  
-#             return self.heap[0]  
-#         else:  
-#             return None 
-    
-#     def size(self):  
-#         """Get the size of heap"""  
-#         return len(self.heap)  
+class FinishedSequenceHeap:
+    """A min-heap of the best finished sequences of a sequence group, bounded
+    to `capacity` sequences.
+
+    Args:
+        capacity: The maximum number of sequences kept.
+        key: The score of a sequence. Higher is better.
+    """
+
+    def __init__(self, capacity: int,
+                 key: Callable[["Sequence"], float]) -> None:
+        self.capacity = capacity
+        self.key = key
+        # Entries are (score, seq_id, seq); the seq_id breaks ties.
+        self._heap: List[Tuple[float, int, "Sequence"]] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __iter__(self) -> Iterator["Sequence"]:
+        return (seq for _, _, seq in self._heap)
+
+    def push(self, seq: "Sequence") -> Optional["Sequence"]:
+        """Keep `seq` if it is among the best sequences.
+
+        Returns the sequence that is no longer kept, which is either the
+        worst kept sequence or `seq` itself, or None if the heap had room.
+        """
+        entry = (self.key(seq), seq.seq_id, seq)
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, entry)
+            return None
+        if not self._heap or entry[:2] <= self._heap[0][:2]:
+            return seq
+        return heapq.heapreplace(self._heap, entry)[2]
+
+    def best(self) -> Optional["Sequence"]:
+        """Return the sequence with the highest score, if any."""
+        if not self._heap:
+            return None
+        return max(self._heap, key=lambda entry: entry[:2])[2]
+
 
 @dataclass
 class RequestMetrics:
@@ -128,6 +144,18 @@ class RequestMetrics:
     finished_time: Optional[float] = None
 
 
+@dataclass
+class RequestSLO:
+    """The latency objectives of a request, in seconds.
+
+    Attributes:
+        ttft: The time to the first token.
+        tpot: The time per output token after the first one.
+    """
+    ttft: Optional[float] = None
+    tpot: Optional[float] = None
+
+
 class SequenceData:
     """Data associated with a sequence.
 
@@ -468,6 +496,10 @@ class SequenceGroup:
                      unless you are working with an encoder/decoder model.
         trace_headers: OpenTelemetry trace headers.
         prompt_adapter_request: Prompt Adapter request.
+        priority: The priority of the request. Higher values are scheduled
+            first by the priority scheduling policy.
+        slo: The latency objectives of the request, used by the EDF
+            scheduling policy.
     """
 
     def __init__(
@@ -484,7 +516,9 @@ class SequenceGroup:
         encoder_seq: Optional[Sequence] = None,
         trace_headers: Optional[Mapping[str, str]] = None,
         prompt_adapter_request: Optional[PromptAdapterRequest] = None,
-        computed_block_seq: Optional[int] = None
+        computed_block_seq: Optional[int] = None,
+        priority: float = 0.0,
+        slo: Optional[RequestSLO] = None,
     ) -> None:
         self.request_id = request_id
         self.seqs_dict = {seq.seq_id: seq for seq in seqs}
@@ -505,10 +539,17 @@ class SequenceGroup:
         self.encoder_seq = encoder_seq
         self.trace_headers = trace_headers
         self._first_seq = next(iter(self.seqs_dict.values()))
-        # self._finished_seq = SequenceGroupMinHeap()
-        self._finished_seq: List[Sequence] = []
+        # Only the best finished sequence of a session keeps its blocks; the
+        # other branches are freed as soon as they lose.
+        self._finished_seq = FinishedSequenceHeap(
+            capacity=1, key=self._get_finished_seq_score)
         self.computed_block_seq = computed_block_seq
         self.computed_block_nums: List[int] = None
+        # The prompt tokens whose KV was reused from a preserved session or
+        # the prefix cache, set when the prompt is first scheduled.
+        self.num_cached_tokens: Optional[int] = None
+        self.priority = priority
+        self.slo = slo
 
     @property
     def prompt(self) -> Optional[str]:
@@ -542,43 +583,24 @@ class SequenceGroup:
         return self.prompt_adapter_request.prompt_adapter_num_virtual_tokens\
                          if self.prompt_adapter_request else 0
 
-    def save_request(self, seq: Sequence) -> bool:
+    def _get_finished_seq_score(self, seq: Sequence) -> float:
+        # Matches the ranking of the outputs of the group.
+        if self.sampling_params.use_beam_search:
+            return seq.get_beam_search_score(
+                self.sampling_params.length_penalty,
+                eos_token_id=seq.eos_token_id)
+        return seq.get_cumulative_logprob()
+
+    def save_request(self, seq: Sequence) -> Optional[Sequence]:
+        """Keep the blocks of a finished sequence of a session if it is the
+        best finished sequence of the group so far, so that they can be
+        retained for the next turn.
+
+        Returns the sequence whose blocks should be freed, if any.
+        """
         if self.session_id is None:
             return seq
-        
-        if len(self._finished_seq) < self.sampling_params.n:
-            self._finished_seq.append(seq)
-            return None
-        
-        assert len(self._finished_seq) == self.sampling_params.n
-        if self.sampling_params.use_beam_search:
-            cur_prob = seq.get_beam_search_score(self.sampling_params.length_penalty)
-            min_prob_index = 0
-            min_prob = self._finished_seq[0].get_beam_search_score(self.sampling_params.length_penalty)
-            for i in range(1, self._finished_seq.size()):
-                prob = self._finished_seq[i].get_beam_search_score(self.sampling_params.length_penalty)
-                if prob < min_prob:
-                    min_prob = prob
-                    min_prob_index = i
-            if cur_prob > min_prob:
-                seq_to_remove = self._finished_seq[min_prob_index]
-                self._finished_seq[min_prob_index] = seq
-                return seq_to_remove
-        else:
-            cur_prob = seq.get_cumulative_logprob()
-            min_prob_index = 0
-            min_prob = self._finished_seq[0].get_cumulative_logprob()
-            for i in range(1, self._finished_seq.size()):
-                prob = self._finished_seq[i].get_cumulative_logprob()
-                if prob < min_prob:
-                    min_prob = prob
-                    min_prob_index = i
-            if cur_prob > min_prob:
-                seq_to_remove = self._finished_seq[min_prob_index]
-                self._finished_seq[min_prob_index] = seq
-                return seq_to_remove
-        
-        return seq
+        return self._finished_seq.push(seq)
 
     def get_last_latency(self, now: float) -> Optional[float]:
         """Sets the last token time for Request level timings."""
@@ -1071,6 +1093,19 @@ class ExecuteModelRequest:
     blocks_to_swap_out: List[Tuple[int, int]] = field(default_factory=list)
     # Blocks to copy. Source to dest block.
     blocks_to_copy: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to move to disk. List of CPU -> disk block number.
+    blocks_to_disk_out: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to restore from disk. List of disk -> GPU block number.
+    blocks_to_disk_in: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to compress. List of GPU -> compressed block number.
+    blocks_to_compress: List[Tuple[int, int]] = field(default_factory=list)
+    # Blocks to decompress. List of compressed -> GPU block number.
+    blocks_to_decompress: List[Tuple[int, int]] = field(
+        default_factory=list)
+    # Blocks to copy from other virtual engines. List of (source virtual
+    # engine, source GPU block number, GPU block number).
+    blocks_to_migrate: List[Tuple[int, int, int]] = field(
+        default_factory=list)
     # Virtual engine ID for pipeline parallel.
     virtual_engine: int = 0
     # The number of slots for lookahead decoding.
@@ -1093,6 +1128,11 @@ class ExecuteModelRequest:
             blocks_to_swap_in=self.blocks_to_swap_in.copy(),
             blocks_to_swap_out=self.blocks_to_swap_out.copy(),
             blocks_to_copy=self.blocks_to_copy.copy(),
+            blocks_to_disk_out=self.blocks_to_disk_out.copy(),
+            blocks_to_disk_in=self.blocks_to_disk_in.copy(),
+            blocks_to_compress=self.blocks_to_compress.copy(),
+            blocks_to_decompress=self.blocks_to_decompress.copy(),
+            blocks_to_migrate=self.blocks_to_migrate.copy(),
             virtual_engine=self.virtual_engine,
             num_lookahead_slots=self.num_lookahead_slots,
             running_queue_size=self.running_queue_size,
@@ -65,6 +65,8 @@ ALL_PINNED_SENTINEL = _Sentinel()
 class Device(enum.Enum):
     GPU = enum.auto()
     CPU = enum.auto()
+    DISK = enum.auto()
+    COMPRESSED = enum.auto()
 
 
 class Counter:
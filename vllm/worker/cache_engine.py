@@ -1,23 +1,38 @@
 """CacheEngine class for managing the KV cache."""
-from typing import List
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Dict, List, Tuple
 
 import torch
 
 from vllm.attention import get_attn_backend
 from vllm.config import CacheConfig, DeviceConfig, ModelConfig, ParallelConfig
 from vllm.logger import init_logger
-from vllm.utils import (STR_DTYPE_TO_TORCH_DTYPE, get_dtype_size,
+from vllm.utils import (STR_DTYPE_TO_TORCH_DTYPE, Device, get_dtype_size,
                         is_pin_memory_available)
 
 logger = init_logger(__name__)
 
+# Session KV compression -> (storage dtype, encoded dtype, largest encoded
+# magnitude). FP8 is stored as uint8, like the fp8 KV cache.
+_COMPRESSED_KV_DTYPES = {
+    "fp8": (torch.uint8, torch.float8_e4m3fn,
+            torch.finfo(torch.float8_e4m3fn).max),
+    "int8": (torch.int8, torch.int8, 127.0),
+}
+
 
 class CacheEngine:
     """Manages the KV cache.
 
     This class is responsible for initializing and managing the GPU and CPU KV
-    caches. It also provides methods for performing KV cache operations, such
-    as swapping and copying.
+    caches, the optional memory-mapped disk cache that holds preserved
+    sessions evicted from the CPU, and the optional GPU cache that holds
+    preserved sessions compressed to FP8 or INT8. It also provides methods for
+    performing KV cache operations, such as swapping and copying, and for
+    saving blocks to files that outlive the engine.
     """
 
     def __init__(
@@ -67,6 +82,20 @@ class CacheEngine:
             self.num_gpu_blocks, self.device_config.device_type)
         self.cpu_cache = self._allocate_kv_cache(self.num_cpu_blocks, "cpu")
 
+        self.num_disk_blocks = cache_config.num_disk_blocks
+        if self.num_disk_blocks:
+            self.num_disk_blocks //= parallel_config.pipeline_parallel_size
+        self.block_dim = self._get_block_dim()
+        self.disk_cache = self._allocate_disk_kv_cache(self.num_disk_blocks)
+
+        self.num_compressed_blocks = cache_config.num_compressed_blocks
+        if self.num_compressed_blocks:
+            self.num_compressed_blocks //= (
+                parallel_config.pipeline_parallel_size)
+        self.compressed_cache, self.compressed_scales = (
+            self._allocate_compressed_kv_cache(
+                self.num_compressed_blocks, self.device_config.device_type))
+
     def _allocate_kv_cache(
         self,
         num_blocks: int,
@@ -88,6 +117,60 @@ class CacheEngine:
                             device=device))
         return kv_cache
 
+    def _get_block_dim(self) -> int:
+        """Get the dimension that indexes the blocks of the KV cache."""
+        one_block = self.attn_backend.get_kv_cache_shape(
+            1, self.block_size, self.num_kv_heads, self.head_size)
+        two_blocks = self.attn_backend.get_kv_cache_shape(
+            2, self.block_size, self.num_kv_heads, self.head_size)
+        return next(dim for dim, (a, b) in enumerate(zip(one_block, two_blocks))
+                    if a != b)
+
+    def _allocate_disk_kv_cache(self, num_blocks: int) -> List[torch.Tensor]:
+        """Allocates the KV cache as one memory-mapped file per layer."""
+        if not num_blocks:
+            return []
+        # Each cache engine owns its files, which are removed with it.
+        self.disk_cache_dir = tempfile.mkdtemp(
+            prefix="vllm_kv_", dir=self.cache_config.disk_swap_path)
+        weakref.finalize(self, shutil.rmtree, self.disk_cache_dir, True)
+        logger.info("Allocating %d disk KV cache blocks in %s", num_blocks,
+                    self.disk_cache_dir)
+        return self._map_kv_files(self.disk_cache_dir, num_blocks)
+
+    def _map_kv_files(self, directory: str,
+                      num_blocks: int) -> List[torch.Tensor]:
+        """Maps a KV cache of `num_blocks` blocks to one file per layer in
+        `directory`, creating the files if needed."""
+        kv_cache_shape = self.attn_backend.get_kv_cache_shape(
+            num_blocks, self.block_size, self.num_kv_heads, self.head_size)
+        return map_kv_files(directory, self.num_attention_layers,
+                            kv_cache_shape, self.dtype)
+
+    def _allocate_compressed_kv_cache(
+        self,
+        num_blocks: int,
+        device: str,
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        """Allocates the compressed KV cache and its per block scales."""
+        if not num_blocks:
+            return [], []
+        storage_dtype, _, _ = _COMPRESSED_KV_DTYPES[
+            self.cache_config.session_kv_compression]
+        kv_cache_shape = self.attn_backend.get_kv_cache_shape(
+            num_blocks, self.block_size, self.num_kv_heads, self.head_size)
+        scales_shape = (tuple(kv_cache_shape[:self.block_dim + 1]) +
+                        (1, ) * (len(kv_cache_shape) - self.block_dim - 1))
+        kv_cache: List[torch.Tensor] = []
+        scales: List[torch.Tensor] = []
+        for _ in range(self.num_attention_layers):
+            kv_cache.append(
+                torch.zeros(kv_cache_shape, dtype=storage_dtype,
+                            device=device))
+            scales.append(
+                torch.ones(scales_shape, dtype=torch.float32, device=device))
+        return kv_cache, scales
+
     def swap_in(self, src_to_dst: torch.Tensor) -> None:
         for i in range(self.num_attention_layers):
             self.attn_backend.swap_blocks(self.cpu_cache[i], self.gpu_cache[i],
@@ -101,6 +184,87 @@ class CacheEngine:
     def copy(self, src_to_dsts: torch.Tensor) -> None:
         self.attn_backend.copy_blocks(self.gpu_cache, src_to_dsts)
 
+    def disk_out(self, src_to_dst: torch.Tensor) -> None:
+        """Moves blocks from the CPU cache to the disk cache."""
+        for i in range(self.num_attention_layers):
+            copy_blocks_between(self.cpu_cache[i], self.disk_cache[i],
+                                self.block_dim, src_to_dst)
+
+    def disk_in(self, src_to_dst: torch.Tensor) -> None:
+        """Moves blocks from the disk cache to the GPU cache."""
+        for i in range(self.num_attention_layers):
+            copy_blocks_between(self.disk_cache[i], self.gpu_cache[i],
+                                self.block_dim, src_to_dst)
+
+    def compress(self, src_to_dst: torch.Tensor) -> None:
+        """Compresses blocks from the GPU cache to the compressed cache."""
+        for i in range(self.num_attention_layers):
+            compress_blocks(self.gpu_cache[i], self.compressed_cache[i],
+                            self.compressed_scales[i], self.block_dim,
+                            src_to_dst,
+                            self.cache_config.session_kv_compression)
+
+    def decompress(self, src_to_dst: torch.Tensor) -> None:
+        """Decompresses blocks from the compressed cache to the GPU
+        cache."""
+        for i in range(self.num_attention_layers):
+            decompress_blocks(self.compressed_cache[i],
+                              self.compressed_scales[i], self.gpu_cache[i],
+                              self.block_dim, src_to_dst,
+                              self.cache_config.session_kv_compression)
+
+    def migrate_in(self, src: "CacheEngine", src_to_dst: torch.Tensor) -> None:
+        """Copies blocks from the GPU cache of another virtual engine to
+        the GPU cache."""
+        for i in range(self.num_attention_layers):
+            self.attn_backend.swap_blocks(src.gpu_cache[i], self.gpu_cache[i],
+                                          src_to_dst)
+
+    def save_blocks(self, directory: str, num_blocks: int,
+                    blocks_to_save: Dict[Device, torch.Tensor]) -> None:
+        """Copies blocks of any of the caches to the files of a KV cache of
+        `num_blocks` blocks in `directory`. Compressed blocks are saved
+        decompressed.
+
+        Args:
+            directory: The directory of the files, one per layer.
+            num_blocks: The number of blocks of the files.
+            blocks_to_save: Maps the device of the source blocks to a
+                (num_blocks, 2) tensor of source and file block numbers.
+        """
+        os.makedirs(directory, exist_ok=True)
+        kv_files = self._map_kv_files(directory, num_blocks)
+        for device, src_to_dst in blocks_to_save.items():
+            for i in range(self.num_attention_layers):
+                if device == Device.COMPRESSED:
+                    decompress_blocks(self.compressed_cache[i],
+                                      self.compressed_scales[i], kv_files[i],
+                                      self.block_dim, src_to_dst,
+                                      self.cache_config.session_kv_compression)
+                else:
+                    copy_blocks_between(self._get_cache(device)[i],
+                                        kv_files[i], self.block_dim,
+                                        src_to_dst)
+
+    def load_blocks(self, directory: str, num_blocks: int,
+                    src_to_dst: torch.Tensor) -> None:
+        """Copies blocks saved by `save_blocks` to the GPU cache."""
+        if not os.path.exists(os.path.join(directory, "layer_0.kv")):
+            raise FileNotFoundError(f"No KV cache files in {directory}.")
+        kv_files = self._map_kv_files(directory, num_blocks)
+        for i in range(self.num_attention_layers):
+            copy_blocks_between(kv_files[i], self.gpu_cache[i],
+                                self.block_dim, src_to_dst)
+
+    def _get_cache(self, device: Device) -> List[torch.Tensor]:
+        if device == Device.GPU:
+            return self.gpu_cache
+        if device == Device.CPU:
+            return self.cpu_cache
+        if device == Device.DISK:
+            return self.disk_cache
+        return self.compressed_cache
+
     @staticmethod
     def get_cache_block_size(
         cache_config: CacheConfig,
@@ -121,3 +285,132 @@ class CacheEngine:
             dtype = STR_DTYPE_TO_TORCH_DTYPE[cache_config.cache_dtype]
         dtype_size = get_dtype_size(dtype)
         return dtype_size * total
+
+    @staticmethod
+    def get_num_disk_blocks(
+        cache_config: CacheConfig,
+        model_config: ModelConfig,
+        parallel_config: ParallelConfig,
+    ) -> int:
+        cache_block_size = CacheEngine.get_cache_block_size(
+            cache_config, model_config, parallel_config)
+        return int(cache_config.disk_swap_space_bytes // cache_block_size)
+
+    @staticmethod
+    def get_compressed_block_size(
+        cache_config: CacheConfig,
+        model_config: ModelConfig,
+        parallel_config: ParallelConfig,
+    ) -> int:
+        head_size = model_config.get_head_size()
+        num_heads = model_config.get_num_kv_heads(parallel_config)
+        num_attention_layers = model_config.get_num_attention_layers(
+            parallel_config)
+
+        # One byte per element, and at most one float32 scale for each of
+        # the key and value blocks.
+        key_cache_block = cache_config.block_size * num_heads * head_size
+        return num_attention_layers * 2 * (key_cache_block + 4)
+
+    @staticmethod
+    def get_num_compressed_blocks(
+        cache_config: CacheConfig,
+        model_config: ModelConfig,
+        parallel_config: ParallelConfig,
+    ) -> int:
+        if cache_config.session_kv_compression is None:
+            return 0
+        compressed_block_size = CacheEngine.get_compressed_block_size(
+            cache_config, model_config, parallel_config)
+        return int(cache_config.compressed_kv_space_bytes //
+                   compressed_block_size)
+
+
+def copy_blocks_between(src: torch.Tensor, dst: torch.Tensor, block_dim: int,
+                        src_to_dst: torch.Tensor) -> None:
+    """Copies blocks between two KV caches that may live on different devices.
+
+    Args:
+        src: The source KV cache of one layer.
+        dst: The destination KV cache of one layer.
+        block_dim: The dimension that indexes the blocks of both caches.
+        src_to_dst: A (num_blocks, 2) tensor of source and destination block
+            numbers.
+    """
+    src_blocks = src_to_dst[:, 0].to(src.device)
+    dst_blocks = src_to_dst[:, 1].to(dst.device)
+    dst.index_copy_(block_dim, dst_blocks,
+                    src.index_select(block_dim, src_blocks).to(dst.device))
+
+
+def map_kv_files(directory: str, num_layers: int,
+                 kv_cache_shape: Tuple[int, ...],
+                 dtype: torch.dtype) -> List[torch.Tensor]:
+    """Maps a KV cache of `kv_cache_shape` to one file per layer in
+    `directory`, named `layer_{i}.kv`. Missing files are created zeroed, and
+    existing ones keep their contents.
+    """
+    numel = 1
+    for size in kv_cache_shape:
+        numel *= size
+    kv_cache: List[torch.Tensor] = []
+    for i in range(num_layers):
+        path = os.path.join(directory, f"layer_{i}.kv")
+        kv_cache.append(
+            torch.from_file(path, shared=True, size=numel,
+                            dtype=dtype).view(kv_cache_shape))
+    return kv_cache
+
+
+def compress_blocks(src: torch.Tensor, dst: torch.Tensor,
+                    dst_scales: torch.Tensor, block_dim: int,
+                    src_to_dst: torch.Tensor, kv_dtype: str) -> None:
+    """Compresses blocks of a KV cache into a KV cache of `kv_dtype`, with
+    one absmax scale for each block.
+
+    Args:
+        src: The source KV cache of one layer.
+        dst: The compressed KV cache of one layer.
+        dst_scales: The scales of `dst`, of the shape of `dst` up to
+            `block_dim` and of size 1 after.
+        block_dim: The dimension that indexes the blocks of both caches.
+        src_to_dst: A (num_blocks, 2) tensor of source and destination block
+            numbers.
+        kv_dtype: "fp8" or "int8".
+    """
+    _, encoded_dtype, max_value = _COMPRESSED_KV_DTYPES[kv_dtype]
+    src_blocks = src_to_dst[:, 0].to(src.device)
+    dst_blocks = src_to_dst[:, 1].to(dst.device)
+    blocks = src.index_select(block_dim, src_blocks).float()
+    reduce_dims = tuple(range(block_dim + 1, blocks.dim()))
+    scales = blocks.abs().amax(dim=reduce_dims, keepdim=True) / max_value
+    scales.clamp_(min=torch.finfo(torch.float32).tiny)
+    blocks = (blocks / scales).clamp_(-max_value, max_value)
+    if encoded_dtype == torch.int8:
+        blocks = blocks.round_()
+    encoded = blocks.to(encoded_dtype).view(dst.dtype)
+    dst.index_copy_(block_dim, dst_blocks, encoded.to(dst.device))
+    dst_scales.index_copy_(block_dim, dst_blocks, scales.to(dst.device))
+
+
+def decompress_blocks(src: torch.Tensor, src_scales: torch.Tensor,
+                      dst: torch.Tensor, block_dim: int,
+                      src_to_dst: torch.Tensor, kv_dtype: str) -> None:
+    """Decompresses blocks compressed by `compress_blocks` into a KV cache.
+
+    Args:
+        src: The compressed KV cache of one layer.
+        src_scales: The scales of `src`.
+        dst: The destination KV cache of one layer.
+        block_dim: The dimension that indexes the blocks of both caches.
+        src_to_dst: A (num_blocks, 2) tensor of source and destination block
+            numbers.
+        kv_dtype: "fp8" or "int8".
+    """
+    _, encoded_dtype, _ = _COMPRESSED_KV_DTYPES[kv_dtype]
+    src_blocks = src_to_dst[:, 0].to(src.device)
+    dst_blocks = src_to_dst[:, 1].to(dst.device)
+    blocks = src.index_select(block_dim, src_blocks).view(encoded_dtype)
+    blocks = blocks.float() * src_scales.index_select(block_dim, src_blocks)
+    dst.index_copy_(block_dim, dst_blocks,
+                    blocks.to(device=dst.device, dtype=dst.dtype))
@@ -1,7 +1,7 @@
 """A GPU worker class."""
 import gc
 import os
-from typing import List, Optional, Set, Tuple, Type
+from typing import Dict, List, Optional, Set, Tuple, Type
 
 import torch
 import torch.distributed
@@ -19,6 +19,7 @@ from vllm.model_executor.model_loader.tensorizer import TensorizerConfig
 from vllm.platforms import current_platform
 from vllm.prompt_adapter.request import PromptAdapterRequest
 from vllm.sequence import ExecuteModelRequest
+from vllm.utils import Device
 from vllm.worker.cache_engine import CacheEngine
 from vllm.worker.embedding_model_runner import EmbeddingModelRunner
 from vllm.worker.model_runner import GPUModelRunnerBase, ModelRunner
@@ -190,9 +191,11 @@ class Worker(LocalOrDistributedWorkerBase):
             "not properly cleaned up before initializing the vLLM instance.")
 
         cache_block_size = self.get_cache_block_size_bytes()
+        # The compressed preserved sessions are kept in a separate pool.
         num_gpu_blocks = int(
             (total_gpu_memory * self.cache_config.gpu_memory_utilization -
-             peak_memory) // cache_block_size)
+             peak_memory - self.cache_config.compressed_kv_space_bytes) //
+            cache_block_size)
         num_cpu_blocks = int(self.cache_config.swap_space_bytes //
                              cache_block_size)
         num_gpu_blocks = max(num_gpu_blocks, 0)
@@ -215,6 +218,12 @@ class Worker(LocalOrDistributedWorkerBase):
 
         self.cache_config.num_gpu_blocks = num_gpu_blocks
         self.cache_config.num_cpu_blocks = num_cpu_blocks
+        self.cache_config.num_disk_blocks = CacheEngine.get_num_disk_blocks(
+            self.cache_config, self.model_config, self.parallel_config)
+        self.cache_config.num_compressed_blocks = (
+            CacheEngine.get_num_compressed_blocks(self.cache_config,
+                                                  self.model_config,
+                                                  self.parallel_config))
 
         self._init_cache_engine()
         self._warm_up_model()
@@ -259,6 +268,23 @@ class Worker(LocalOrDistributedWorkerBase):
         blocks_to_swap_out = torch.tensor(execute_model_req.blocks_to_swap_out,
                                           device="cpu",
                                           dtype=torch.int64).view(-1, 2)
+        blocks_to_disk_out = torch.tensor(execute_model_req.blocks_to_disk_out,
+                                          device="cpu",
+                                          dtype=torch.int64).view(-1, 2)
+        blocks_to_disk_in = torch.tensor(execute_model_req.blocks_to_disk_in,
+                                         device="cpu",
+                                         dtype=torch.int64).view(-1, 2)
+        blocks_to_compress = torch.tensor(
+            execute_model_req.blocks_to_compress,
+            device="cpu",
+            dtype=torch.int64).view(-1, 2)
+        blocks_to_decompress = torch.tensor(
+            execute_model_req.blocks_to_decompress,
+            device="cpu",
+            dtype=torch.int64).view(-1, 2)
+        blocks_to_migrate = torch.tensor(execute_model_req.blocks_to_migrate,
+                                         device="cpu",
+                                         dtype=torch.int64).view(-1, 3)
         # `blocks_to_copy` is a gpu tensor. The src and tgt of
         # blocks to copy are in the same device, and `blocks_to_copy`
         # can be used directly within cuda kernels.
@@ -271,6 +297,11 @@ class Worker(LocalOrDistributedWorkerBase):
             blocks_to_swap_in=blocks_to_swap_in,
             blocks_to_swap_out=blocks_to_swap_out,
             blocks_to_copy=blocks_to_copy,
+            blocks_to_disk_out=blocks_to_disk_out,
+            blocks_to_disk_in=blocks_to_disk_in,
+            blocks_to_compress=blocks_to_compress,
+            blocks_to_decompress=blocks_to_decompress,
+            blocks_to_migrate=blocks_to_migrate,
             virtual_engine=virtual_engine,
         )
 
@@ -278,18 +309,95 @@ class Worker(LocalOrDistributedWorkerBase):
     def execute_worker(self, worker_input: WorkerInput) -> None:
         virtual_engine = worker_input.virtual_engine
         # Issue cache operations.
+        # The blocks of sessions migrated from other virtual engines were
+        # newly allocated here, so their copy does not depend on the others.
+        if (worker_input.blocks_to_migrate is not None
+                and worker_input.blocks_to_migrate.numel() > 0):
+            blocks_to_migrate = worker_input.blocks_to_migrate
+            src_virtual_engines = blocks_to_migrate[:, 0]
+            for src_virtual_engine in src_virtual_engines.unique().tolist():
+                src_to_dst = blocks_to_migrate[
+                    src_virtual_engines == src_virtual_engine, 1:]
+                self.cache_engine[virtual_engine].migrate_in(
+                    self.cache_engine[src_virtual_engine], src_to_dst)
+        # Blocks demoted to disk free the CPU blocks that the swap out in the
+        # same step may write to, so they go first.
+        if (worker_input.blocks_to_disk_out is not None
+                and worker_input.blocks_to_disk_out.numel() > 0):
+            self.cache_engine[virtual_engine].disk_out(
+                worker_input.blocks_to_disk_out)
         if (worker_input.blocks_to_swap_in is not None
                 and worker_input.blocks_to_swap_in.numel() > 0):
             self.cache_engine[virtual_engine].swap_in(
                 worker_input.blocks_to_swap_in)
+        if (worker_input.blocks_to_disk_in is not None
+                and worker_input.blocks_to_disk_in.numel() > 0):
+            self.cache_engine[virtual_engine].disk_in(
+                worker_input.blocks_to_disk_in)
+        if (worker_input.blocks_to_decompress is not None
+                and worker_input.blocks_to_decompress.numel() > 0):
+            self.cache_engine[virtual_engine].decompress(
+                worker_input.blocks_to_decompress)
         if (worker_input.blocks_to_swap_out is not None
                 and worker_input.blocks_to_swap_out.numel() > 0):
             self.cache_engine[virtual_engine].swap_out(
                 worker_input.blocks_to_swap_out)
+        # Like the swap out, the compression may write to the compressed
+        # blocks released by the decompression above.
+        if (worker_input.blocks_to_compress is not None
+                and worker_input.blocks_to_compress.numel() > 0):
+            self.cache_engine[virtual_engine].compress(
+                worker_input.blocks_to_compress)
         if (worker_input.blocks_to_copy is not None
                 and worker_input.blocks_to_copy.numel() > 0):
             self.cache_engine[virtual_engine].copy(worker_input.blocks_to_copy)
 
+    @torch.inference_mode()
+    def save_kv_cache(
+            self, path: str, num_blocks: int,
+            blocks_to_save: List[Tuple[int, Device, int, int]]) -> None:
+        """Save KV cache blocks to the block files of `path`, which hold
+        `num_blocks` blocks. Every rank saves its shard to its own files.
+
+        Args:
+            path: The directory of the saved blocks.
+            num_blocks: The number of blocks of the block files.
+            blocks_to_save: The (virtual engine, device, block number, file
+                block number) of every block to save.
+        """
+        directory = os.path.join(path, f"rank_{self.rank}")
+        for virtual_engine, cache_engine in enumerate(self.cache_engine):
+            blocks: Dict[Device, List[Tuple[int, int]]] = {}
+            for block_ve, device, src, dst in blocks_to_save:
+                if block_ve == virtual_engine:
+                    blocks.setdefault(device, []).append((src, dst))
+            cache_engine.save_blocks(
+                directory, num_blocks, {
+                    device: torch.tensor(src_to_dst,
+                                         device="cpu",
+                                         dtype=torch.int64).view(-1, 2)
+                    for device, src_to_dst in blocks.items()
+                })
+
+    @torch.inference_mode()
+    def load_kv_cache(self, path: str, num_blocks: int,
+                      blocks_to_load: List[Tuple[int, int, int]]) -> None:
+        """Load KV cache blocks saved by `save_kv_cache` into the GPU cache.
+
+        Args:
+            path: The directory of the saved blocks.
+            num_blocks: The number of blocks of the block files.
+            blocks_to_load: The (virtual engine, file block number, GPU
+                block number) of every block to load.
+        """
+        directory = os.path.join(path, f"rank_{self.rank}")
+        blocks = torch.tensor(blocks_to_load, device="cpu",
+                              dtype=torch.int64).view(-1, 3)
+        for virtual_engine in blocks[:, 0].unique().tolist():
+            self.cache_engine[virtual_engine].load_blocks(
+                directory, num_blocks, blocks[blocks[:, 0] == virtual_engine,
+                                              1:])
+
     def add_lora(self, lora_request: LoRARequest) -> bool:
         return self.model_runner.add_lora(lora_request)
 
@@ -126,6 +126,11 @@ class WorkerInput:
     blocks_to_swap_in: Optional[torch.Tensor] = None
     blocks_to_swap_out: Optional[torch.Tensor] = None
     blocks_to_copy: Optional[torch.Tensor] = None
+    blocks_to_disk_out: Optional[torch.Tensor] = None
+    blocks_to_disk_in: Optional[torch.Tensor] = None
+    blocks_to_compress: Optional[torch.Tensor] = None
+    blocks_to_decompress: Optional[torch.Tensor] = None
+    blocks_to_migrate: Optional[torch.Tensor] = None
     virtual_engine: int = 0
 
     @classmethod
@@ -142,6 +147,11 @@ class WorkerInput:
             blocks_to_swap_in=tensor_dict.pop("blocks_to_swap_in"),
             blocks_to_swap_out=tensor_dict.pop("blocks_to_swap_out"),
             blocks_to_copy=tensor_dict.pop("blocks_to_copy"),
+            blocks_to_disk_out=tensor_dict.pop("blocks_to_disk_out"),
+            blocks_to_disk_in=tensor_dict.pop("blocks_to_disk_in"),
+            blocks_to_compress=tensor_dict.pop("blocks_to_compress"),
+            blocks_to_decompress=tensor_dict.pop("blocks_to_decompress"),
+            blocks_to_migrate=tensor_dict.pop("blocks_to_migrate"),
             virtual_engine=tensor_dict["virtual_engine"],
         )
 
@@ -155,6 +165,11 @@ class WorkerInput:
             "blocks_to_swap_in": self.blocks_to_swap_in,
             "blocks_to_swap_out": self.blocks_to_swap_out,
             "blocks_to_copy": self.blocks_to_copy,
+            "blocks_to_disk_out": self.blocks_to_disk_out,
+            "blocks_to_disk_in": self.blocks_to_disk_in,
+            "blocks_to_compress": self.blocks_to_compress,
+            "blocks_to_decompress": self.blocks_to_decompress,
+            "blocks_to_migrate": self.blocks_to_migrate,
             "virtual_engine": self.virtual_engine,
         }
 